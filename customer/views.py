@@ -15,6 +15,7 @@ from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth import update_session_auth_hash
 
 from order import models as order_model
+from order.summary import summary_owner, update_summary
 from store import models as store_model
 from userauths import models as userauths_models
 from .models import Wishlist, WishlistItem
@@ -151,6 +152,14 @@ def wishlist_page(request):
     )
     return render(request, "wishlist.html", {"wishlist_items": items})
 
+def _publish_wishlist_count(user, wl):
+    """Count the wishlist's items and hand the figure to the header summary once the toggle commits."""
+    count = wl.items.count()
+    owner = summary_owner(user)
+    transaction.on_commit(lambda: update_summary(owner, wishlist_items=count))
+    return count
+
+
 @login_required
 @require_POST
 @csrf_protect
@@ -192,14 +201,14 @@ def wishlist_toggle(request):
                 return JsonResponse({
                     "ok": True,
                     "action": "removed",
-                    "count": wl.items.count(),
+                    "count": _publish_wishlist_count(request.user, wl),
                 })
             else:
                 created = wl.items.create(product=product, product_variation=pv)
                 return JsonResponse({
                     "ok": True,
                     "action": "added",
-                    "count": wl.items.count(),
+                    "count": _publish_wishlist_count(request.user, wl),
                     "item_id": created.id,
                 })
     except IntegrityError:
@@ -208,7 +217,7 @@ def wishlist_toggle(request):
         return JsonResponse({
             "ok": True,
             "action": "added" if has_now else "removed",
-            "count": wl.items.count(),
+            "count": _publish_wishlist_count(request.user, wl),
         })
 
 
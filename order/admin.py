@@ -73,6 +73,16 @@ class CouponForm(forms.ModelForm):
             "is_active",
         ]
 
+    def clean_code(self):
+        code = (self.cleaned_data.get("code") or "").strip()
+        # code_normalized is unique: "save10" and "SAVE10" can't both exist.
+        clash = models.Coupon.objects.filter(code_normalized=models.Coupon.normalize_code(code))
+        if self.instance.pk:
+            clash = clash.exclude(pk=self.instance.pk)
+        if clash.exists():
+            raise forms.ValidationError("A coupon with this code already exists.")
+        return code
+
     def clean(self):
         cleaned = super().clean()
         dtype = cleaned.get("discount_type")
@@ -1,29 +1,27 @@
-from .models import Cart
 from customer import models as customer_models
+from store.carts import cart_for_request
 
-def _get_cart_item_count(request):
-    session = getattr(request, "session", None)
-    if session is not None:
-        cached_count = session.get("cart_item_count")
-        if cached_count is not None:
-            return cached_count
+from .summary import get_summary, request_owner, set_summary
 
-    cart = Cart.get_existing_for_request(request)
-    if cart is None:
-        if session is not None:
-            session["cart_item_count"] = 0
-            session.modified = True
-        return 0
 
-    count = cart.items.count()
-    if session is not None:
-        session["cart_item_count"] = count
-        session.modified = True
-    return count
+def _header_summary(request):
+    """Cart and wishlist badge figures; served from order.summary, so rendering the header normally runs no query."""
+    owner = request_owner(request)
+    summary = get_summary(owner)
+    if summary is not None:
+        return summary
+
+    cart = cart_for_request(request, create=False)
+    figures = cart.summary() if cart is not None else {}
+    if request.user.is_authenticated:
+        figures["wishlist_items"] = customer_models.WishlistItem.objects.filter(wishlist__user=request.user).count()
+    return set_summary(owner, **figures)
 
 
 def global_context(request):
+    summary = _header_summary(request)
     return {
-        'cart_item_count': _get_cart_item_count(request),
-        'wishlist_count': customer_models.Wishlist.objects.filter(user=request.user).count() if request.user.is_authenticated else 0,
+        'cart_item_count': summary["cart_items"],
+        'wishlist_count': summary["wishlist_items"],
+        'cart_summary': summary,
     }
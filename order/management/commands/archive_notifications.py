@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from order.notifications import archive_read_notifications
+
+
+class Command(BaseCommand):
+    help = "Move read notifications past retention into NotificationArchive, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None, help="Retention in days (default STORE_NOTIFICATION_RETENTION_DAYS).")
+        parser.add_argument("--batch-size", type=int, default=None, help="Rows per transaction (default STORE_NOTIFICATION_ARCHIVE_BATCH).")
+
+    def handle(self, *args, **opts):
+        moved = archive_read_notifications(days=opts["days"], batch_size=opts["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"✅ Archived {moved} notification(s)"))
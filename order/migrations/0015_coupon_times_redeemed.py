@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:34
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    Coupon = apps.get_model("order", "Coupon")
+    counts = Coupon.objects.using(alias).annotate(n=Count("redemptions")).filter(n__gt=0).values_list("pk", "n")
+    for pk, n in counts:
+        Coupon.objects.using(alias).filter(pk=pk).update(times_redeemed=n)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0014_order_sales_recorded'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coupon',
+            name='times_redeemed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:37
+
+from django.db import migrations, models
+from django.db.models.functions import Trim, Upper
+
+
+def backfill(apps, schema_editor):
+    Coupon = apps.get_model("order", "Coupon")
+    Coupon.objects.using(schema_editor.connection.alias).update(code_normalized=Upper(Trim("code")))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0015_coupon_times_redeemed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coupon',
+            name='code_normalized',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=40),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:37
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_no_clashes(apps, schema_editor):
+    # Codes that differ only in case or surrounding spaces would share a
+    # lookup key; they have to be renamed by hand before the key is unique.
+    Coupon = apps.get_model("order", "Coupon")
+    clashes = list(
+        Coupon.objects.using(schema_editor.connection.alias)
+        .values("code_normalized").annotate(n=Count("id")).filter(n__gt=1)
+        .values_list("code_normalized", flat=True)
+    )
+    if clashes:
+        raise RuntimeError(
+            "Coupon codes collide once normalized; rename all but one of each before migrating: "
+            + ", ".join(sorted(clashes))
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0019_order_paid_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_no_clashes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='coupon',
+            name='code_normalized',
+            field=models.CharField(default='', editable=False, max_length=40, unique=True),
+        ),
+    ]
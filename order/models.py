@@ -3,7 +3,7 @@ from django.db import models
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import transaction
-from django.db.models import F, Sum
+from django.db.models import Count, F, Sum
 from django.utils import timezone
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
@@ -11,6 +11,8 @@ from django.contrib.contenttypes.models import ContentType
 from shortuuid.django_fields import ShortUUIDField
 from decimal import Decimal
 
+from .summary import summary_owner, update_summary
+
 class Cart(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='cart', null=True, blank=True)
     session_key = models.CharField(max_length=40, null=True, blank=True)
@@ -36,7 +38,7 @@ class Cart(models.Model):
 
         if request.user.is_authenticated:
             cart, created = cls.objects.get_or_create(user=request.user)
-            cls._remember_in_session(request, cart, item_count=0 if created else None)
+            cls._remember_in_session(request, cart)
             return cart
 
         
@@ -44,7 +46,7 @@ class Cart(models.Model):
             request.session.create()
         session_key = request.session.session_key
         cart, created = cls.objects.get_or_create(session_key=session_key, user=None)
-        cls._remember_in_session(request, cart, item_count=0 if created else None)
+        cls._remember_in_session(request, cart)
         return cart
 
     @classmethod
@@ -78,23 +80,24 @@ class Cart(models.Model):
         return None
 
     @staticmethod
-    def _remember_in_session(request, cart, *, item_count=None):
+    def _remember_in_session(request, cart):
+        # The header's item count lives in order.summary; only the cart id is kept here.
         session = getattr(request, "session", None)
-        if session is None:
+        if session is None or session.get("cart_id") == cart.pk:
             return
         session["cart_id"] = cart.pk
-        if item_count is None:
-            item_count = cart.items.count()
-        session["cart_item_count"] = item_count
         session.modified = True
 
     @transaction.atomic
-    def add_item(self, product_variation, quantity=1, override_quantity=False):
+    def add_item(self, product_variation, quantity=1, override_quantity=False, value_ids=None, display=None):
         """
-        Add a ProductVariation to this cart.
+        Add a ProductVariation to this cart at its current sale price.
         - If same variation exists, increment quantity (unless override_quantity True).
         - Validate stock (does NOT decrement real stock; only checks availability).
-        Returns: (cart_item, created_bool)
+        - value_ids / display record the shopper's selections (variation_values + selected_variations_json).
+        The line is written once (one INSERT or one UPDATE); value rows only when they change.
+        Returns: (cart_item, created_bool); cart_item.previous_quantity / previous_subtotal
+        hold what the line was before, so callers can shift cached totals instead of re-summing.
         Raises ValidationError on bad quantity / out of stock
         """
         if quantity < 1:
@@ -108,12 +111,25 @@ class Cart(models.Model):
         if product_variation.stock_quantity < quantity:
             raise ValidationError("Insufficient stock for requested quantity")
 
+        selection = {}
+        if value_ids or display:
+            selection["selected_variations_json"] = CartItem.selection_json(value_ids, display)
+
+        # select_for_update() turns the related manager into a plain queryset, so the cart is passed explicitly.
         cart_item, created = self.items.select_for_update().get_or_create(
+            cart=self,
             product_variation=product_variation,
-            defaults={"quantity": quantity}
+            defaults={"quantity": quantity, "price": product_variation.sale_price, **selection}
         )
 
-        if not created:
+        if created:
+            cart_item.previous_quantity, cart_item.previous_subtotal = 0, Decimal("0.00")
+            Through = CartItem.variation_values.through
+            Through.objects.bulk_create([
+                Through(cartitem_id=cart_item.pk, variationvalue_id=value_id) for value_id in value_ids or []
+            ])
+        else:
+            cart_item.previous_quantity, cart_item.previous_subtotal = cart_item.quantity, cart_item.subtotal()
             if override_quantity:
                 new_qty = quantity
             else:
@@ -122,12 +138,59 @@ class Cart(models.Model):
             if product_variation.stock_quantity < new_qty:
                 raise ValidationError("Insufficient stock to update quantity")
 
+            values_changed = bool(value_ids) and (cart_item.selected_variations_json or {}).get("value_ids") != list(value_ids)
             cart_item.quantity = new_qty
-            cart_item.save()
+            cart_item.price = product_variation.sale_price
+            for field, value in selection.items():
+                setattr(cart_item, field, value)
+            cart_item.save(update_fields=["quantity", "price", *selection])
+            if values_changed:
+                cart_item.variation_values.set(value_ids)
 
         return cart_item, created
 
-    
+    @transaction.atomic
+    def set_item_quantity(self, item_id, quantity):
+        """
+        Set a line's quantity at the variation's current price; 0 removes it.
+        Returns the item, or None when it is not in this cart.
+        Raises ValidationError past the available stock.
+        """
+        item = self.items.select_for_update().select_related("product_variation").filter(pk=item_id).first()
+        if item is None:
+            return None
+        if quantity == 0:
+            item.delete()
+            return item
+
+        variation = item.product_variation
+        if quantity > variation.stock_quantity:
+            raise ValidationError(f"Only {variation.stock_quantity} units available in stock")
+        item.quantity = quantity
+        item.price = variation.sale_price
+        item.save(update_fields=["quantity", "price"])
+        return item
+
+    def lines(self):
+        """The cart items with their variation, product and selected values: two queries however long the cart is."""
+        return list(
+            self.items.select_related("product_variation__product").prefetch_related("variation_values")
+        )
+
+    def item_count(self):
+        return self.items.count()
+
+    def summary(self):
+        """The cart figures order.summary caches for the header: one aggregate query."""
+        agg = self.items.aggregate(
+            lines=Count("id"), units=Sum("quantity"), subtotal=Sum(F("quantity") * F("price"))
+        )
+        return {
+            "cart_items": agg["lines"],
+            "cart_quantity": agg["units"] or 0,
+            "cart_subtotal": Decimal(agg["subtotal"] or 0).quantize(Decimal("0.01")),
+        }
+
     def total_amount(self):
         
         agg = self.items.aggregate(total=Sum(F('quantity') * F('price')))
@@ -136,27 +199,56 @@ class Cart(models.Model):
     @transaction.atomic
     def merge_from(self, other_cart):
         """
-        Merge items from other_cart into this cart by "re-parenting" them.
-        This is more efficient and robust than creating new items.
+        Merge the lines of other_cart (a guest Cart row or a cached
+        store.carts.GuestCart) into this cart, then delete other_cart.
+        Both carts are read once; a variation in both gets the summed
+        quantity, and every merged quantity is clamped to the stock on hand.
+        Guest lines bring their variation_values and selected_variations_json
+        along (an existing line only takes them when it has none).
+        The writes are one bulk INSERT (plus one for the value rows), one
+        bulk UPDATE and the delete, however long the guest cart was.
         """
-        
-        for item_to_merge in other_cart.items.all():
-            
-            existing_item, created = self.items.get_or_create(
-                product_variation=item_to_merge.product_variation,
-                defaults={'quantity': item_to_merge.quantity}
-            )
+        mine = {item.product_variation_id: item for item in self.items.select_for_update()}
+        new_items, values, changed = [], [], []
+        for line in other_cart.lines():
+            variation = line.product_variation
+            if not variation.is_active:
+                continue
+            item = mine.get(variation.pk)
+            wanted = line.quantity + (item.quantity if item else 0)
+            quantity = min(wanted, max(variation.stock_quantity, 0))
+
+            if item is None:
+                if quantity < 1:
+                    continue
+                item = CartItem(
+                    cart=self, product_variation=variation, quantity=quantity, price=line.price,
+                    selected_variations_json=line.selected_variations_json,
+                )
+                new_items.append(item)
+                values.append((item, line.value_ids))
+                mine[variation.pk] = item
+            else:
+                adopt_selection = bool(line.selected_variations_json and not item.selected_variations_json)
+                if adopt_selection:
+                    item.selected_variations_json = line.selected_variations_json
+                    values.append((item, line.value_ids))
+                if adopt_selection or quantity != item.quantity:
+                    item.quantity = quantity
+                    changed.append(item)
+
+        CartItem.objects.bulk_create(new_items)
+        Through = CartItem.variation_values.through
+        Through.objects.bulk_create([
+            Through(cartitem_id=item.pk, variationvalue_id=value_id)
+            for item, value_ids in values
+            for value_id in value_ids
+        ], ignore_conflicts=True)
+        CartItem.objects.bulk_update(changed, ["quantity", "selected_variations_json"])
 
-            if not created:
-                
-                existing_item.quantity += item_to_merge.quantity
-                existing_item.save()
-                
-                item_to_merge.delete()
-        
-        
-        
         other_cart.delete()
+        owner = summary_owner(self.user)
+        transaction.on_commit(lambda: update_summary(owner, **self.summary()))
 
 
 class CartItem(models.Model):
@@ -177,6 +269,22 @@ class CartItem(models.Model):
     
     def subtotal(self):
         return (self.price or Decimal('0.00')) * self.quantity
+
+    @property
+    def value_ids(self):
+        return [value.pk for value in self.variation_values.all()]
+
+    @staticmethod
+    def selection_json(value_ids=None, display=None):
+        """The selected_variations_json backup kept next to variation_values."""
+        backup = {}
+        if value_ids:
+            backup["value_ids"] = list(value_ids)
+        if display:
+            backup["display"] = {str(k): str(v) for k, v in display.items()}
+        return backup or None
+
+
 class Order(models.Model):
     class OrderStatus(models.TextChoices):
         PENDING = "PENDING", "Pending"
@@ -229,6 +337,8 @@ class Order(models.Model):
     easebuzz_txnid = models.CharField(max_length=120, blank=True, null=True)
     easebuzz_payment_id = models.CharField(max_length=120, blank=True, null=True)  
     payment_meta = models.JSONField(null=True, blank=True)  
+    sales_recorded = models.BooleanField(default=False)
+    paid_at = models.DateTimeField(null=True, blank=True)
 
     status = models.CharField(max_length=20, choices=OrderStatus.choices, default=OrderStatus.PENDING)
     uuid = ShortUUIDField(length=12, max_length=50, alphabet="1234567890")
@@ -371,6 +481,8 @@ class Coupon(models.Model):
         FIXED   = "FIXED", "Fixed Amount Off"
 
     code = models.CharField(max_length=40, unique=True, db_index=True)
+    # Upper-cased, trimmed copy of `code` so lookups hit an index instead of code__iexact.
+    code_normalized = models.CharField(max_length=40, unique=True, editable=False, default="")
     vendor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="coupons")
 
     title = models.CharField(max_length=120, null=True, blank=True)
@@ -387,6 +499,8 @@ class Coupon(models.Model):
 
     usage_limit_total = models.PositiveIntegerField(null=True, blank=True)
     usage_limit_per_user = models.PositiveIntegerField(null=True, blank=True)
+    # Live redemption count, claimed with a conditional UPDATE against usage_limit_total (store.coupons).
+    times_redeemed = models.PositiveIntegerField(default=0)
 
     is_active = models.BooleanField(default=True)
 
@@ -396,6 +510,17 @@ class Coupon(models.Model):
     def __str__(self):
         return f"{self.code} ({self.vendor_id})"
 
+    @staticmethod
+    def normalize_code(code) -> str:
+        return (code or "").strip().upper()
+
+    def save(self, *args, **kwargs):
+        self.code_normalized = self.normalize_code(self.code)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "code" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "code_normalized"}
+        super().save(*args, **kwargs)
+
     def is_live(self):
         from django.utils import timezone
         now = timezone.now()
@@ -441,7 +566,21 @@ class NotificationQuerySet(models.QuerySet):
         return self.filter(is_read=True)
 
     def mark_all_read(self):
-        return self.update(is_read=True, read_at=timezone.now())
+        """Mark the unread ones read, taking them off their recipients' NotificationCounter."""
+        with transaction.atomic():
+            unread = self.filter(is_read=False)
+            # Lock first, so a concurrent mark_read() cannot flip (and decrement) the same rows.
+            rows = list(unread.select_for_update().values_list("pk", "recipient_id"))
+            if not rows:
+                return 0
+            deltas = {}
+            for _, recipient_id in rows:
+                deltas[recipient_id] = deltas.get(recipient_id, 0) - 1
+            updated = Notification.objects.filter(pk__in=[pk for pk, _ in rows]).update(
+                is_read=True, read_at=timezone.now()
+            )
+            NotificationCounter.adjust(deltas)
+        return updated
 
 
 class Notification(models.Model):
@@ -509,14 +648,133 @@ class Notification(models.Model):
     def __str__(self):
         return f"{self.ntype} • {self.title} (to {self.recipient_id})"
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding and not self.is_read:
+                NotificationCounter.adjust({self.recipient_id: 1})
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            if not self.is_read:
+                NotificationCounter.adjust({self.recipient_id: -1})
+        return result
+
+    def _flip(self, is_read):
+        # Conditional UPDATE: only the call that actually changes the row moves the counter.
+        with transaction.atomic():
+            changed = Notification.objects.filter(pk=self.pk, is_read=not is_read).update(
+                is_read=is_read, read_at=self.read_at
+            )
+            if changed:
+                NotificationCounter.adjust({self.recipient_id: -1 if is_read else 1})
+
     def mark_read(self, save=True):
         self.is_read = True
         self.read_at = timezone.now()
         if save:
-            self.save(update_fields=["is_read", "read_at"])
+            self._flip(True)
 
     def mark_unread(self, save=True):
         self.is_read = False
         self.read_at = None
         if save:
-            self.save(update_fields=["is_read", "read_at"])
\ No newline at end of file
+            self._flip(False)
+
+
+class NotificationArchive(models.Model):
+    """
+    Read notifications past retention (order.notifications.archive_read_notifications).
+    Keeps the original id as primary key, so a re-run batch cannot archive a
+    row twice, and only what the notifications page shows; the live table and
+    its indexes stay the size of the retention window.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    recipient = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="archived_notifications"
+    )
+    ntype = models.CharField(max_length=20, choices=Notification.NType.choices)
+    level = models.CharField(max_length=20, choices=Notification.Level.choices)
+    title = models.CharField(max_length=200)
+    message = models.TextField(blank=True)
+    content_type = models.ForeignKey(ContentType, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    object_id = models.PositiveBigIntegerField(null=True, blank=True)
+    meta = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    read_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    # Everything archived was read; lets the notifications templates render these rows unchanged.
+    is_read = True
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [models.Index(fields=["recipient", "created_at"])]
+
+    def __str__(self):
+        return f"{self.ntype} • {self.title} (to {self.recipient_id}, archived)"
+
+
+class NotificationCounter(models.Model):
+    """
+    Unread notifications per user, moved in the same transaction as every
+    create, read, unread and mark-all, so badges read one row instead of
+    counting the notifications table. A missing row is rebuilt from a COUNT.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name="notification_counter"
+    )
+    unread = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.unread} unread"
+
+    @classmethod
+    def unread_for(cls, user_id) -> int:
+        value = cls.objects.filter(user_id=user_id).values_list("unread", flat=True).first()
+        if value is None:
+            value = cls.recount([user_id])[user_id]
+        return max(value, 0)
+
+    @classmethod
+    def recount(cls, user_ids):
+        """Reset the users' counters from the notifications table. Returns {user_id: unread}."""
+        counts = dict.fromkeys(user_ids, 0)
+        counts.update(
+            Notification.objects.filter(recipient_id__in=counts, is_read=False)
+            .order_by().values("recipient_id").annotate(n=Count("id")).values_list("recipient_id", "n")
+        )
+        with transaction.atomic():
+            existing = {c.user_id: c for c in cls.objects.select_for_update().filter(user_id__in=counts)}
+            for user_id, counter in existing.items():
+                counter.unread = counts[user_id]
+            cls.objects.bulk_update(existing.values(), ["unread"])
+            cls.objects.bulk_create(
+                [cls(user_id=user_id, unread=n) for user_id, n in counts.items() if user_id not in existing],
+                ignore_conflicts=True,
+            )
+        return counts
+
+    @classmethod
+    def adjust(cls, deltas):
+        """
+        Shift counters by {user_id: delta}, one UPDATE per distinct delta.
+        Users without a row get one counted from scratch, which already
+        includes the change being recorded.
+        """
+        deltas = {user_id: d for user_id, d in deltas.items() if d}
+        if not deltas:
+            return
+        existing = set(cls.objects.filter(user_id__in=deltas).values_list("user_id", flat=True))
+        by_delta = {}
+        for user_id, d in deltas.items():
+            if user_id in existing:
+                by_delta.setdefault(d, []).append(user_id)
+        for d, user_ids in by_delta.items():
+            cls.objects.filter(user_id__in=user_ids).update(unread=F("unread") + d, updated_at=timezone.now())
+        missing = [user_id for user_id in deltas if user_id not in existing]
+        if missing:
+            cls.recount(missing)
\ No newline at end of file
@@ -0,0 +1,103 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Notification, NotificationArchive, NotificationCounter
+
+
+ARCHIVED_FIELDS = (
+    "id", "recipient_id", "ntype", "level", "title", "message",
+    "content_type_id", "object_id", "meta", "created_at", "read_at",
+)
+
+
+def _recipient_id(recipient):
+    return getattr(recipient, "pk", recipient)
+
+
+def dispatch(obj, recipients, *, ntype, level=Notification.Level.INFO, title="", message="", meta=None):
+    """
+    Notify many users about one object in a constant number of queries: the
+    recipients' accounts are resolved in one, notifications they already
+    have for obj (same ntype and title) are found in one, and the rest are
+    written with one bulk_create.
+
+    `recipients` holds users or user ids, or (user or id, overrides) pairs
+    where overrides may replace title, message, level or meta for that one
+    recipient (e.g. a vendor's share of an order). Unknown or inactive users
+    are skipped. Returns the created notifications.
+    """
+    wanted = []
+    for entry in recipients:
+        recipient, overrides = entry if isinstance(entry, tuple) else (entry, {})
+        if recipient is None:
+            continue
+        fields = {"title": title, "message": message, "level": level, "meta": meta, **overrides}
+        wanted.append((_recipient_id(recipient), fields))
+    if not wanted:
+        return []
+
+    ids = {rid for rid, _ in wanted}
+    active = set(get_user_model().objects.filter(pk__in=ids, is_active=True).values_list("pk", flat=True))
+    ct = ContentType.objects.get_for_model(obj.__class__)
+    existing = set(
+        Notification.objects.filter(
+            content_type=ct, object_id=obj.pk, ntype=ntype, recipient_id__in=active,
+        ).values_list("recipient_id", "title")
+    )
+
+    rows = []
+    for rid, fields in wanted:
+        key = (rid, fields["title"])
+        if rid not in active or key in existing:
+            continue
+        existing.add(key)
+        rows.append(Notification(
+            recipient_id=rid,
+            ntype=ntype,
+            level=fields["level"],
+            title=fields["title"],
+            message=fields["message"] or "",
+            content_type=ct,
+            object_id=obj.pk,
+            meta=fields["meta"] or {},
+        ))
+    with transaction.atomic():
+        created = Notification.objects.bulk_create(rows)
+        deltas = {}
+        for row in created:
+            deltas[row.recipient_id] = deltas.get(row.recipient_id, 0) + 1
+        NotificationCounter.adjust(deltas)
+    return created
+
+
+def archive_read_notifications(days=None, batch_size=None, now=None) -> int:
+    """
+    Move read notifications older than `days` (STORE_NOTIFICATION_RETENTION_DAYS)
+    into NotificationArchive, `batch_size` rows per transaction: lock a batch,
+    copy it, delete it. Unread ones stay whatever their age, so unread
+    counters are untouched. Returns how many were moved.
+    """
+    days = getattr(settings, "STORE_NOTIFICATION_RETENTION_DAYS", 90) if days is None else days
+    batch_size = batch_size or getattr(settings, "STORE_NOTIFICATION_ARCHIVE_BATCH", 1000)
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    expired = Notification.objects.filter(is_read=True, created_at__lt=cutoff).order_by("id")
+
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(expired.select_for_update(skip_locked=True).values(*ARCHIVED_FIELDS)[:batch_size])
+            if not rows:
+                break
+            NotificationArchive.objects.bulk_create(
+                [NotificationArchive(**row) for row in rows], ignore_conflicts=True
+            )
+            Notification.objects.filter(pk__in=[row["id"] for row in rows]).delete()
+        moved += len(rows)
+        if len(rows) < batch_size:
+            break
+    return moved
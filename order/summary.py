@@ -0,0 +1,115 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+# The header's cart and wishlist badges, cached per shopper ("u<user id>" or
+# "s<session key>"). Every change bumps the owner's version counter and stores
+# the new figures under that version, so a slower concurrent writer lands on a
+# version nobody reads any more instead of overwriting newer figures.
+VERSION_KEY = "order:summary:%s:version"
+SUMMARY_KEY = "order:summary:%s:%s"
+
+EMPTY = {"cart_items": 0, "cart_quantity": 0, "cart_subtotal": Decimal("0.00"), "wishlist_items": 0}
+
+# Backends private to one process: a bump on one worker never reaches the
+# others, so there the figures are only kept for STORE_SUMMARY_LOCAL_TIMEOUT.
+LOCAL_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+def cache_is_shared():
+    return settings.CACHES["default"]["BACKEND"] not in LOCAL_BACKENDS
+
+
+def _timeout():
+    if not cache_is_shared():
+        return getattr(settings, "STORE_SUMMARY_LOCAL_TIMEOUT", 10)
+    return getattr(settings, "STORE_SUMMARY_TIMEOUT", 60 * 60 * 24)
+
+
+def summary_owner(user=None, session_key=None):
+    if user is not None and user.is_authenticated:
+        return f"u{user.pk}"
+    return f"s{session_key}" if session_key else None
+
+
+def request_owner(request):
+    session = getattr(request, "session", None)
+    return summary_owner(request.user, session.session_key if session is not None else None)
+
+
+def _bump(owner) -> int:
+    key = VERSION_KEY % owner
+    cache.add(key, 0, _timeout())
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr(); start over.
+        cache.set(key, 1, _timeout())
+        return 1
+
+
+def get_summary(owner):
+    """The cached figures for owner, or None when they have to be rebuilt."""
+    if owner is None:
+        return dict(EMPTY, version=0)
+    version = cache.get(VERSION_KEY % owner)
+    if version is None:
+        return None
+    return cache.get(SUMMARY_KEY % (owner, version))
+
+
+def set_summary(owner, **figures):
+    """Store a complete set of figures (missing ones count as zero) under a new version."""
+    entry = dict(EMPTY, **figures)
+    if owner is None:
+        return dict(entry, version=0)
+    entry["version"] = version = _bump(owner)
+    cache.set(SUMMARY_KEY % (owner, version), entry, _timeout())
+    return entry
+
+
+def update_summary(owner, **figures):
+    """
+    Replace some of owner's figures (e.g. the cart's after an add, the
+    wishlist count after a toggle). Without a cached entry to patch, the
+    version is still bumped so the next read rebuilds everything.
+    """
+    if owner is None:
+        return None
+    current = get_summary(owner)
+    if current is None:
+        _bump(owner)
+        return None
+    current = {k: v for k, v in current.items() if k != "version"}
+    return set_summary(owner, **dict(current, **figures))
+
+
+def adjust_cart_summary(owner, *, lines=0, quantity=0, subtotal=Decimal("0.00")):
+    """
+    Shift owner's cart figures by one change (a line added or re-quantified)
+    instead of re-aggregating the cart. Returns the new figures, or None when
+    nothing is cached, or when another writer got in between; then the entry
+    is left for the next read to rebuild.
+    """
+    if owner is None:
+        return None
+    current = get_summary(owner)
+    if current is None:
+        _bump(owner)
+        return None
+    entry = set_summary(
+        owner,
+        cart_items=current["cart_items"] + lines,
+        cart_quantity=current["cart_quantity"] + quantity,
+        cart_subtotal=current["cart_subtotal"] + subtotal,
+        wishlist_items=current["wishlist_items"],
+    )
+    if entry["version"] != current["version"] + 1:
+        _bump(owner)
+        return None
+    return entry
@@ -1,3 +1,114 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from addon.models import SiteConfiguration
+from order import models as order_models
+from order.notifications import archive_read_notifications, dispatch
+from userauths import models as userauths_models
+
+
+class NotificationCounterTests(TestCase):
+    def setUp(self):
+        self.vendor = userauths_models.User.objects.create_user(
+            email="bell@example.com", username="bell", password="x",
+            role=userauths_models.User.Role.VENDOR,
+        )
+        self.other = userauths_models.User.objects.create_user(email="o@example.com", username="o", password="x")
+
+    def _unread(self, user=None):
+        return order_models.NotificationCounter.unread_for((user or self.vendor).pk)
+
+    def _note(self, title="Hi"):
+        return order_models.Notification.objects.create(recipient=self.vendor, title=title)
+
+    def test_counter_follows_create_read_and_mark_all(self):
+        self.assertEqual(self._unread(), 0)
+        first, second = self._note("a"), self._note("b")
+        dispatch(self.other, [self.vendor, self.other], ntype=order_models.Notification.NType.SYSTEM, title="c")
+        self.assertEqual((self._unread(), self._unread(self.other)), (3, 1))
+
+        first.mark_read()
+        first.mark_read()
+        self.assertEqual(self._unread(), 2)
+        first.mark_unread()
+        second.delete()
+        self.assertEqual(self._unread(), 2)
+
+        self.assertEqual(order_models.Notification.objects.filter(recipient=self.vendor).mark_all_read(), 2)
+        self.assertEqual((self._unread(), self._unread(self.other)), (0, 1))
+
+        # A lost counter row is rebuilt from the table.
+        order_models.NotificationCounter.objects.all().delete()
+        self.assertEqual(self._unread(self.other), 1)
+
+    def test_poll_endpoint_reads_the_counter(self):
+        self._note()
+        self._unread()
+        self.client.force_login(self.vendor)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("vendor:notification_unread_count"))
+        self.assertEqual(response.json(), {"ok": True, "unread": 1})
+        self.assertFalse([q for q in ctx.captured_queries if "COUNT(" in q["sql"]])
+
+        self.client.post(
+            reverse("vendor:notification_mark_all_read_ajax"), HTTP_X_REQUESTED_WITH="XMLHttpRequest"
+        )
+        self.assertEqual(self.client.get(reverse("vendor:notification_unread_count")).json()["unread"], 0)
+
+    @override_settings(STORE_NOTIFICATION_SSE=True, STORE_NOTIFICATION_SSE_INTERVAL=0.01, STORE_NOTIFICATION_SSE_LIFETIME=0)
+    async def test_stream_sends_the_count(self):
+        await order_models.Notification.objects.acreate(recipient=self.vendor, title="x")
+        await self.async_client.aforce_login(self.vendor)
+        response = await self.async_client.get(reverse("vendor:notification_unread_stream"))
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        body = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertIn('event: unread\ndata: {"unread": 1}\n\n', body)
+
+    async def test_stream_is_off_by_default(self):
+        await self.async_client.aforce_login(self.vendor)
+        response = await self.async_client.get(reverse("vendor:notification_unread_stream"))
+        self.assertEqual(response.status_code, 404)
+
+
+class NotificationArchiveTests(TestCase):
+    def setUp(self):
+        self.vendor = userauths_models.User.objects.create_user(
+            email="old@example.com", username="old", password="x",
+            role=userauths_models.User.Role.VENDOR,
+        )
+        long_ago = timezone.now() - timedelta(days=200)
+        for n in range(5):
+            order_models.Notification.objects.create(
+                recipient=self.vendor, title=f"Old {n}", is_read=n < 4, created_at=long_ago
+            )
+        order_models.Notification.objects.create(recipient=self.vendor, title="Fresh", is_read=True)
+
+    def test_only_old_read_notifications_move_in_batches(self):
+        self.assertEqual(archive_read_notifications(days=90, batch_size=3), 4)
+        self.assertEqual(archive_read_notifications(days=90, batch_size=3), 0)
+        self.assertEqual(
+            sorted(order_models.Notification.objects.values_list("title", flat=True)), ["Fresh", "Old 4"]
+        )
+        self.assertEqual(order_models.NotificationArchive.objects.filter(recipient=self.vendor).count(), 4)
+        self.assertEqual(order_models.NotificationCounter.unread_for(self.vendor.pk), 1)
+
+    def test_page_reads_the_archive_only_when_asked(self):
+        archive_read_notifications(days=90)
+        # Templates read the branding images unconditionally; a name is enough for .url.
+        SiteConfiguration.objects.update_or_create(pk=1, defaults={
+            "site_logo": "branding/t.png", "login_logo": "branding/t.png", "favicon": "branding/t.png",
+        })
+        self.client.force_login(self.vendor)
+        with CaptureQueriesContext(connection) as ctx:
+            recent = self.client.get(reverse("vendor:notifications"))
+        self.assertFalse([q for q in ctx.captured_queries if "notificationarchive" in q["sql"]])
+        archived = self.client.get(reverse("vendor:notifications"), {"archive": "1", "q": "Old 1"})
+
+        self.assertEqual([n.title for n in recent.context["page"]], ["Fresh", "Old 4"])
+        self.assertEqual([n.title for n in archived.context["page"]], ["Old 1"])
+        self.assertContains(archived, "Back to recent")
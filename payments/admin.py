@@ -1,3 +1,18 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import PaymentEvent, PaymentVerification
+
+
+@admin.register(PaymentVerification)
+class PaymentVerificationAdmin(admin.ModelAdmin):
+    list_display = ("txnid", "order", "status", "gateway_status", "attempts", "run_after", "updated_at")
+    list_filter = ("status", "provider")
+    search_fields = ("txnid", "easebuzz_id", "order__order_id")
+    raw_id_fields = ("order",)
+
+
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = ("txnid", "status", "order_ref", "outcome", "received_at", "processed_at")
+    list_filter = ("provider", "status", "outcome")
+    search_fields = ("txnid", "easebuzz_id", "order_ref")
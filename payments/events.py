@@ -0,0 +1,123 @@
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from order import models as order_models
+from store.stock import release_order_stock
+
+from .models import PaymentEvent
+from .verification import FAILED_STATUSES, SUCCESS_STATUSES, settle_paid
+
+
+log = logging.getLogger(__name__)
+
+
+def record_event(data, provider="EASEBUZZ") -> bool:
+    """
+    The webhook's whole job: one INSERT of the delivery. A redelivery hits
+    the (provider, txnid, status) unique key and is dropped by the database.
+    Returns False when the payload names no order, or no transaction to key
+    the delivery on (every such delivery would share one key).
+    """
+    order_ref = data.get("udf1") or data.get("merchant_ref_no") or ""
+    easebuzz_id = data.get("easebuzz_id") or data.get("payment_id") or ""
+    if not order_ref or not (data.get("txnid") or easebuzz_id):
+        return False
+    PaymentEvent.objects.bulk_create(
+        [PaymentEvent(
+            provider=provider,
+            txnid=(data.get("txnid") or easebuzz_id)[:120],
+            status=(data.get("status", "") or "").lower()[:40],
+            order_ref=order_ref[:64],
+            easebuzz_id=easebuzz_id[:120],
+            payload=data,
+        )],
+        ignore_conflicts=True,
+    )
+    return True
+
+
+def _apply(order, events):
+    """
+    Fold one order's events, oldest first, into its payment state with a
+    single save. PAID is final: a late or replayed "failed" cannot undo it.
+    Returns {event id: outcome}.
+    """
+    outcomes = {}
+    meta = order.payment_meta or {}
+    update = {"payment_meta", "updated_at"}
+    was_paid = order.payment_status == "PAID"
+    for event in events:
+        meta["easebuzz_webhook"] = event.payload
+        if event.easebuzz_id:
+            order.easebuzz_payment_id = event.easebuzz_id
+            update.add("easebuzz_payment_id")
+        if order.payment_status == "PAID":
+            outcomes[event.pk] = "ignored"
+        elif event.status in SUCCESS_STATUSES:
+            order.payment_status = "PAID"
+            order.status = order_models.Order.OrderStatus.PROCESSING
+            update |= {"payment_status", "status"}
+            outcomes[event.pk] = "paid"
+        elif event.status in FAILED_STATUSES:
+            order.payment_status = "FAILED"
+            update.add("payment_status")
+            outcomes[event.pk] = "failed"
+        else:
+            outcomes[event.pk] = "noted"
+
+    order.payment_meta = meta
+    order.save(update_fields=sorted(update))
+    if order.payment_status == "PAID" and not was_paid:
+        settle_paid(order)
+    elif order.payment_status == "FAILED" and "payment_status" in update:
+        release_order_stock(order)
+    return outcomes
+
+
+def process_events(limit=500) -> int:
+    """
+    Apply up to `limit` unprocessed events, grouped by order. Each order is
+    locked, its pending events re-read under the lock (so two processors
+    never apply the same event) and settled in one transaction. An order
+    whose events raise is rolled back and its events are marked "error", so
+    one bad order doesn't stall the rest of the batch.
+    Returns how many events were processed.
+    """
+    pending = PaymentEvent.objects.filter(processed_at=None).order_by("id")
+    by_order = defaultdict(list)
+    for event_id, order_ref in pending.values_list("id", "order_ref")[:limit]:
+        by_order[order_ref].append(event_id)
+
+    done = 0
+    for order_ref, ids in by_order.items():
+        try:
+            done += _process_order(order_ref, ids)
+        except Exception:
+            log.exception("Applying payment events %s to order %s failed", ids, order_ref)
+            done += PaymentEvent.objects.filter(pk__in=ids, processed_at=None).update(
+                processed_at=timezone.now(), outcome="error"
+            )
+    return done
+
+
+@transaction.atomic
+def _process_order(order_ref, ids) -> int:
+    order = order_models.Order.objects.select_for_update().filter(order_id=order_ref).first()
+    events = list(PaymentEvent.objects.filter(pk__in=ids, processed_at=None).order_by("id"))
+    if not events:
+        return 0
+    if order is None:
+        outcomes = {e.pk: "unknown-order" for e in events}
+    else:
+        outcomes = _apply(order, events)
+
+    now = timezone.now()
+    for outcome in set(outcomes.values()):
+        PaymentEvent.objects.filter(pk__in=[pk for pk, o in outcomes.items() if o == outcome]).update(
+            processed_at=now, outcome=outcome
+        )
+    log.info("payment_events order=%s events=%s outcome=%s", order_ref, len(events), order and order.payment_status)
+    return len(events)
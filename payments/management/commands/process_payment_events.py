@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.events import process_events
+
+
+class Command(BaseCommand):
+    help = "Apply queued payment webhook events (PaymentEvent) to their orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=500, help="Process at most this many events per pass.")
+        parser.add_argument(
+            "--loop", type=float, default=None, metavar="SECONDS",
+            help="Keep running, sleeping this long whenever the inbox is empty.",
+        )
+
+    def handle(self, *args, **opts):
+        while True:
+            processed = process_events(limit=opts["limit"])
+            if opts["loop"] is None:
+                break
+            if processed < opts["limit"]:
+                time.sleep(opts["loop"])
+        self.stdout.write(self.style.SUCCESS(f"✅ Processed {processed} payment event(s)"))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.verification import run_due
+
+
+class Command(BaseCommand):
+    help = "Verify queued Easebuzz returns with the gateway and settle their orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=100, help="Verify at most this many jobs per pass.")
+        parser.add_argument(
+            "--loop", type=float, default=None, metavar="SECONDS",
+            help="Keep running, sleeping this long whenever the queue is empty.",
+        )
+
+    def handle(self, *args, **opts):
+        while True:
+            settled = run_due(limit=opts["limit"])
+            if opts["loop"] is None:
+                break
+            if settled < opts["limit"]:
+                time.sleep(opts["loop"])
+        self.stdout.write(self.style.SUCCESS(f"✅ Settled {settled} payment verification(s)"))
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:58
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('order', '0016_coupon_code_normalized'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentVerification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(default='EASEBUZZ', max_length=20)),
+                ('txnid', models.CharField(max_length=120)),
+                ('easebuzz_id', models.CharField(blank=True, default='', max_length=120)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('hash_ok', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('QUEUED', 'Queued'), ('DONE', 'Done'), ('GAVE_UP', 'Gave up')], default='QUEUED', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('gateway_status', models.CharField(blank=True, default='', max_length=40)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payment_verifications', to='order.order')),
+            ],
+            options={
+                'ordering': ['run_after'],
+                'indexes': [models.Index(fields=['status', 'run_after'], name='payments_pa_status_b31e99_idx')],
+                'constraints': [models.UniqueConstraint(fields=('provider', 'txnid'), name='uniq_payment_verification_txn')],
+            },
+        ),
+    ]
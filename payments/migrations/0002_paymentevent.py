@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(default='EASEBUZZ', max_length=20)),
+                ('txnid', models.CharField(max_length=120)),
+                ('status', models.CharField(max_length=40)),
+                ('order_ref', models.CharField(db_index=True, max_length=64)),
+                ('easebuzz_id', models.CharField(blank=True, default='', max_length=120)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('outcome', models.CharField(blank=True, default='', max_length=40)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['processed_at', 'id'], name='payments_pa_process_c095d8_idx')],
+                'constraints': [models.UniqueConstraint(fields=('provider', 'txnid', 'status'), name='uniq_payment_event')],
+            },
+        ),
+    ]
@@ -1,3 +1,73 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class PaymentVerification(models.Model):
+    """
+    A gateway return waiting for server-side verification. easebuzz_return
+    records one and redirects straight away; `manage.py verify_payments`
+    asks the gateway and applies the outcome to the order.
+    """
+
+    class Status(models.TextChoices):
+        QUEUED = "QUEUED", "Queued"
+        DONE = "DONE", "Done"
+        GAVE_UP = "GAVE_UP", "Gave up"
+
+    order = models.ForeignKey("order.Order", on_delete=models.CASCADE, related_name="payment_verifications")
+    provider = models.CharField(max_length=20, default="EASEBUZZ")
+    txnid = models.CharField(max_length=120)
+    easebuzz_id = models.CharField(max_length=120, blank=True, default="")
+    payload = models.JSONField(default=dict, blank=True)
+    hash_ok = models.BooleanField(default=False)
+
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    # Due time; a worker that claims the row pushes it out by the lease, so a
+    # crashed worker's job comes due again instead of staying stuck.
+    run_after = models.DateTimeField(default=timezone.now)
+    gateway_status = models.CharField(max_length=40, blank=True, default="")
+    last_error = models.TextField(blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["run_after"]
+        constraints = [
+            models.UniqueConstraint(fields=["provider", "txnid"], name="uniq_payment_verification_txn"),
+        ]
+        indexes = [models.Index(fields=["status", "run_after"])]
+
+    def __str__(self):
+        return f"{self.provider} {self.txnid} ({self.status})"
+
+
+class PaymentEvent(models.Model):
+    """
+    A gateway webhook delivery, inserted as received. (provider, txnid,
+    status) is unique, so a redelivered event is one insert that conflicts
+    and is dropped; `manage.py process_payment_events` applies the rest to
+    their orders in arrival order.
+    """
+
+    provider = models.CharField(max_length=20, default="EASEBUZZ")
+    txnid = models.CharField(max_length=120)
+    status = models.CharField(max_length=40)
+    order_ref = models.CharField(max_length=64, db_index=True)
+    easebuzz_id = models.CharField(max_length=120, blank=True, default="")
+    payload = models.JSONField(default=dict, blank=True)
+
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    outcome = models.CharField(max_length=40, blank=True, default="")
+
+    class Meta:
+        ordering = ["id"]
+        constraints = [
+            models.UniqueConstraint(fields=["provider", "txnid", "status"], name="uniq_payment_event"),
+        ]
+        indexes = [models.Index(fields=["processed_at", "id"])]
+
+    def __str__(self):
+        return f"{self.provider} {self.txnid} {self.status}"
@@ -1,3 +1,212 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from order import models as order_models
+from payments.events import process_events
+from payments.models import PaymentEvent, PaymentVerification
+from payments.verification import run_due
+from payments.views import _notify_order_paid
+from store import models as store_models
+from store.checkout import cart_lines, create_order_from_cart
+from store.stock import release_abandoned_checkouts, release_expired_holds
+from store.tests.stubs import StubEasebuzz
+from userauths import models as userauths_models
+
+
+@override_settings(STORE_HTTP_BACKOFF=0, STORE_HTTP_RETRIES=0)
+class PaymentVerificationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.vendor = userauths_models.User.objects.create_user(
+            email="seller@example.com", username="seller", password="x",
+            role=userauths_models.User.Role.VENDOR,
+        )
+        product = store_models.Product.objects.create(vendor=self.vendor, name="Mug", description="Mug")
+        self.variation = store_models.ProductVariation.objects.create(
+            product=product, sku="MUG-1", sale_price=Decimal("8.00"), regular_price=Decimal("10.00"),
+            stock_quantity=5, weight=1, length=1, height=1, width=1,
+        )
+        self.buyer = userauths_models.User.objects.create_user(email="buyer@example.com", username="buyer", password="x")
+        addr = userauths_models.Address.objects.create(
+            profile=self.buyer.profile, address_type=userauths_models.Address.AddressType.SHIPPING,
+            street_address="1 Road", city="Pune", state="MH", postal_code="411001", country="IN",
+        )
+        cart = order_models.Cart.objects.create(user=self.buyer)
+        cart.items.create(product_variation=self.variation, quantity=2, price=Decimal("8.00"))
+        self.order = create_order_from_cart(self.buyer, addr, cart_lines(cart))
+        self.order.easebuzz_txnid = "TXN1"
+        self.order.save(update_fields=["easebuzz_txnid"])
+        self.client.force_login(self.buyer)
+
+    def _return(self, status="success"):
+        return self.client.post(
+            reverse("payments:easebuzz_return"), {"udf1": self.order.order_id, "txnid": "TXN1", "status": status}
+        )
+
+    def test_return_queues_verification_without_calling_the_gateway(self):
+        with StubEasebuzz() as stub, override_settings(EASEBUZZ_API_BASE=stub.base_url):
+            response = self._return()
+            self._return()
+            self.assertEqual(stub.calls, [])
+
+        self.assertRedirects(
+            response, reverse("payments:thank_you", kwargs={"order_id": self.order.order_id}),
+            fetch_redirect_response=False,
+        )
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, "PENDING_VERIFICATION")
+        self.assertEqual(PaymentVerification.objects.get().status, PaymentVerification.Status.QUEUED)
+
+    def test_worker_settles_the_order_once(self):
+        self._return()
+        with StubEasebuzz() as stub, override_settings(EASEBUZZ_API_BASE=stub.base_url):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(run_due(), 1)
+            self.assertEqual(run_due(), 0)
+
+            # A late duplicate return does not reopen a settled job.
+            self._return()
+            self.assertEqual(run_due(), 0)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, "PAID")
+        self.assertEqual(self.order.status, order_models.Order.OrderStatus.PROCESSING)
+        self.assertEqual(self.order.easebuzz_payment_id, "EZTXN1")
+        self.assertEqual(self.order.stock_reservations.get().status, store_models.StockReservation.Status.COMMITTED)
+        self.assertEqual(
+            sorted(order_models.Notification.objects.values_list("recipient__username", flat=True)),
+            ["buyer", "seller"],
+        )
+        self.assertEqual(PaymentVerification.objects.get().status, PaymentVerification.Status.DONE)
+
+    def test_unanswered_verification_is_retried_later(self):
+        self._return()
+        with StubEasebuzz() as stub, override_settings(EASEBUZZ_API_BASE=stub.base_url):
+            stub.down.update({"/transaction/v2/retrieve", "/transaction/v1/retrieve"})
+            with self.assertLogs("payments.views", "ERROR"):
+                self.assertEqual(run_due(), 0)
+
+        job = PaymentVerification.objects.get()
+        self.assertEqual((job.status, job.attempts), (PaymentVerification.Status.QUEUED, 1))
+        self.assertGreater(job.run_after, timezone.now())
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, "PENDING_VERIFICATION")
+
+    def test_pending_verification_keeps_its_stock_hold(self):
+        self._return()
+        hold = self.order.stock_reservations.get()
+        self.assertGreater(hold.expires_at, timezone.now() + timedelta(minutes=25))
+
+        self.assertEqual(release_expired_holds(now=timezone.now() + timedelta(minutes=20)), 0)
+        self.assertEqual(release_abandoned_checkouts(self.buyer), 0)
+        hold.refresh_from_db()
+        self.assertEqual(hold.status, store_models.StockReservation.Status.HELD)
+        self.variation.refresh_from_db()
+        self.assertEqual(self.variation.stock_quantity, 3)
+
+    def test_an_inconclusive_answer_does_not_reopen_a_failed_order(self):
+        self._return("userCancelled")
+        self._deliver("failed")
+        with self.captureOnCommitCallbacks(execute=True):
+            process_events()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, "FAILED")
+
+        with StubEasebuzz(txn_status="userCancelled") as stub, override_settings(EASEBUZZ_API_BASE=stub.base_url):
+            run_due()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, "FAILED")
+        self.assertEqual(PaymentVerification.objects.get().status, PaymentVerification.Status.DONE)
+
+    def _deliver(self, status):
+        return self.client.post(
+            reverse("payments:easebuzz_webhook"),
+            {"udf1": self.order.order_id, "txnid": "TXN1", "status": status, "easebuzz_id": "EZ9"},
+        )
+
+    def test_webhook_redeliveries_cost_one_insert(self):
+        self.client.logout()
+        self._deliver("success")
+        with self.assertNumQueries(1):
+            self.assertEqual(self._deliver("success").json(), {"ok": True})
+        self.assertEqual(PaymentEvent.objects.count(), 1)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, "UNPAID")
+
+    def test_events_are_applied_in_order_and_paid_is_final(self):
+        for status in ("userCancelled", "success", "success", "failed"):
+            self._deliver(status)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(process_events(), 3)
+        self.assertEqual(process_events(), 0)
+
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.payment_status, self.order.easebuzz_payment_id), ("PAID", "EZ9"))
+        self.assertEqual(self.order.payment_meta["easebuzz_webhook"]["status"], "failed")
+        self.assertEqual(
+            list(PaymentEvent.objects.values_list("status", "outcome")),
+            [("usercancelled", "noted"), ("success", "paid"), ("failed", "ignored")],
+        )
+        self.assertEqual(order_models.Notification.objects.count(), 2)
+
+    def test_a_failing_order_is_marked_and_the_batch_goes_on(self):
+        self._deliver("success")
+        self.client.post(reverse("payments:easebuzz_webhook"), {"udf1": "NO-SUCH-ORDER", "txnid": "TXN2", "status": "success"})
+        with patch("payments.events.settle_paid", side_effect=RuntimeError("boom")), self.assertLogs("payments.events", "ERROR"):
+            self.assertEqual(process_events(), 2)
+
+        self.assertEqual(
+            list(PaymentEvent.objects.values_list("txnid", "outcome")), [("TXN1", "error"), ("TXN2", "unknown-order")]
+        )
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, "UNPAID")
+
+    def test_webhook_without_a_transaction_key_is_rejected(self):
+        response = self.client.post(
+            reverse("payments:easebuzz_webhook"), {"udf1": self.order.order_id, "status": "success"}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PaymentEvent.objects.exists())
+
+
+class OrderPaidNotificationTests(TestCase):
+    def _order(self, vendors):
+        tag = order_models.Order.objects.count()
+        buyer = userauths_models.User.objects.create_user(
+            email=f"buyer{tag}@example.com", username=f"buyer{tag}", password="x"
+        )
+        order = order_models.Order.objects.create(buyer=buyer, order_id=f"FAN{tag}")
+        for n in range(vendors):
+            vendor = userauths_models.User.objects.create_user(
+                email=f"v{tag}-{n}@example.com", username=f"v{tag}-{n}", password="x",
+                role=userauths_models.User.Role.VENDOR,
+            )
+            order.items.create(vendor=vendor, quantity=2, price=Decimal("5.00"), line_discount_total=Decimal("1.00"))
+        return order
+
+    def _queries(self, order):
+        with CaptureQueriesContext(connection) as ctx:
+            _notify_order_paid(order)
+        return len(ctx.captured_queries)
+
+    def test_fan_out_is_constant_in_the_number_of_vendors(self):
+        self._queries(self._order(1))
+        one, twenty = self._order(1), self._order(20)
+        self.assertEqual(self._queries(one), self._queries(twenty))
+
+        notes = order_models.Notification.objects.filter(object_id=twenty.pk)
+        self.assertEqual(notes.count(), 21)
+        vendor_note = notes.exclude(recipient=twenty.buyer).first()
+        self.assertEqual(vendor_note.message, "2 item(s) • ₹9.00 net for you.")
+        self.assertEqual(vendor_note.meta, {"target_url": f"/vendor/orders/{twenty.order_id}/"})
+
+        self.assertEqual(_notify_order_paid(twenty), [])
+        self.assertEqual(notes.count(), 21)
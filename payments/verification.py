@@ -0,0 +1,199 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from order import models as order_models
+from store.sales import record_paid_order
+from store.stock import commit_order_stock, extend_holds, release_order_stock
+
+from .models import PaymentVerification
+
+
+log = logging.getLogger(__name__)
+
+QUEUED = PaymentVerification.Status.QUEUED
+DONE = PaymentVerification.Status.DONE
+GAVE_UP = PaymentVerification.Status.GAVE_UP
+
+PENDING_VERIFICATION = "PENDING_VERIFICATION"
+SUCCESS_STATUSES = {"success", "captured"}
+FAILED_STATUSES = {"failed", "tampered", "bounced"}
+
+
+def _lease():
+    return timedelta(seconds=getattr(settings, "STORE_PAYMENT_VERIFY_LEASE", 120))
+
+
+def _max_attempts():
+    return getattr(settings, "STORE_PAYMENT_VERIFY_ATTEMPTS", 6)
+
+
+def _retry_delay(attempts):
+    return timedelta(seconds=30 * 2 ** (attempts - 1))
+
+
+def _retry_window():
+    """How long a job can stay QUEUED: every backoff plus a lease per attempt."""
+    backoff = sum((_retry_delay(n) for n in range(1, _max_attempts())), timedelta())
+    return backoff + _lease() * _max_attempts()
+
+
+def enqueue_return(order, payload, hash_ok):
+    """
+    Record a browser return from Easebuzz and park the order in
+    PENDING_VERIFICATION until the worker has asked the gateway. A repeated
+    return for the same txnid (reload, back button) refreshes the queued job
+    rather than adding one. The order's stock holds are stretched over the
+    retry window, so they can't lapse while the worker is still asking.
+    """
+    txnid = payload.get("txnid", "") or (order.easebuzz_txnid or "")
+    fields = {
+        "order": order,
+        "easebuzz_id": payload.get("easebuzz_id", "") or (order.easebuzz_payment_id or ""),
+        "payload": payload,
+        "hash_ok": hash_ok,
+    }
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                job = PaymentVerification.objects.create(provider="EASEBUZZ", txnid=txnid, **fields)
+        except IntegrityError:
+            job = PaymentVerification.objects.select_for_update().get(provider="EASEBUZZ", txnid=txnid)
+            # A settled job stays settled; the order already carries its outcome.
+            if job.status != DONE:
+                for name, value in fields.items():
+                    setattr(job, name, value)
+                job.status, job.run_after = QUEUED, timezone.now()
+                job.save()
+
+        meta = order.payment_meta or {}
+        meta.update({"easebuzz_return": payload, "return_received_at": timezone.now().isoformat()})
+        order.payment_meta = meta
+        update = ["payment_meta", "updated_at"]
+        if job.status == QUEUED and order.payment_status != "PAID":
+            order.payment_status = PENDING_VERIFICATION
+            update.append("payment_status")
+            extend_holds(order, timezone.now() + _retry_window())
+        order.save(update_fields=update)
+    return job
+
+
+def _claim(job_id) -> bool:
+    """Take a due job by pushing its run_after past the lease; only one worker's UPDATE matches."""
+    now = timezone.now()
+    return bool(
+        PaymentVerification.objects.filter(pk=job_id, status=QUEUED, run_after__lte=now)
+        .update(run_after=now + _lease(), updated_at=now)
+    )
+
+
+def settle_paid(order):
+    """
+    Side effects of an order turning PAID, inside the caller's transaction:
+    sales stats and stock now, buyer and vendor notifications after commit.
+    """
+    from .views import _notify_order_paid
+
+    record_paid_order(order)
+    commit_order_stock(order)
+
+    def _notify():
+        try:
+            _notify_order_paid(order)
+        except Exception as e:
+            log.warning("Order paid notify failed for %s: %s", order.order_id, e)
+
+    transaction.on_commit(_notify)
+
+
+def apply_verification(job, verified_resp):
+    """
+    Settle job's order from the gateway's answer (None when it could not be
+    had) and the signed return payload, the same rules easebuzz_return used
+    inline. Runs under a lock on the order row and leaves a PAID order alone,
+    so a replayed job, the webhook and the worker cannot apply a result twice.
+    An answer short of success only moves an order still PENDING_VERIFICATION;
+    one the webhook already marked FAILED (its stock released) stays FAILED.
+    Returns the order's payment_status.
+    """
+    from .views import _easebuzz_status_is_success
+
+    ok, gateway_status, ez_id = _easebuzz_status_is_success(verified_resp)
+    status_val = (job.payload.get("status", "") or "").lower()
+    final_success = ok or (job.hash_ok and status_val in SUCCESS_STATUSES)
+
+    with transaction.atomic():
+        order = order_models.Order.objects.select_for_update().get(pk=job.order_id)
+        meta = order.payment_meta or {}
+        meta["easebuzz_verify"] = {"ok": ok, "gateway_status": gateway_status, "raw": verified_resp}
+        order.payment_meta = meta
+        order.easebuzz_payment_id = job.easebuzz_id or ez_id or order.easebuzz_payment_id
+        update = ["payment_meta", "easebuzz_payment_id", "updated_at"]
+
+        if order.payment_status == "PAID":
+            pass
+        elif final_success:
+            order.payment_status = "PAID"
+            order.status = order_models.Order.OrderStatus.PROCESSING
+            update += ["payment_status", "status"]
+        elif order.payment_status == PENDING_VERIFICATION:
+            hard_fail = isinstance(verified_resp, dict) and status_val in FAILED_STATUSES
+            order.payment_status = "FAILED" if hard_fail else "PENDING"
+            update.append("payment_status")
+        order.save(update_fields=update)
+
+        if "status" in update:
+            settle_paid(order)
+        elif order.payment_status == "FAILED" and "payment_status" in update:
+            release_order_stock(order)
+
+        PaymentVerification.objects.filter(pk=job.pk).update(
+            status=DONE, gateway_status=gateway_status[:40], last_error="", updated_at=timezone.now()
+        )
+    return order.payment_status
+
+
+def verify(job):
+    """Ask the gateway about one claimed job; an unanswered question is retried with backoff until it gives up."""
+    from .views import _easebuzz_txn_status
+
+    attempts = job.attempts = job.attempts + 1
+    PaymentVerification.objects.filter(pk=job.pk).update(attempts=attempts)
+    resp = _easebuzz_txn_status(txnid=job.txnid, easebuzz_id=job.easebuzz_id or None)
+    trusted_return = job.hash_ok and (job.payload.get("status", "") or "").lower() in SUCCESS_STATUSES
+    if resp is None and not trusted_return and attempts < _max_attempts():
+        PaymentVerification.objects.filter(pk=job.pk).update(
+            run_after=timezone.now() + _retry_delay(attempts),
+            last_error="no usable answer from the status API",
+            updated_at=timezone.now(),
+        )
+        return None
+
+    result = apply_verification(job, resp)
+    if resp is None and not trusted_return:
+        PaymentVerification.objects.filter(pk=job.pk).update(status=GAVE_UP)
+    log.info("payment_verify txnid=%s order=%s attempts=%s result=%s", job.txnid, job.order_id, attempts, result)
+    return result
+
+
+def run_due(limit=100) -> int:
+    """Work through up to `limit` due jobs, oldest first. Returns how many were settled."""
+    settled = 0
+    due = PaymentVerification.objects.filter(status=QUEUED, run_after__lte=timezone.now())
+    for job in due.order_by("run_after")[:limit]:
+        if not _claim(job.pk):
+            continue
+        try:
+            if verify(job) is not None:
+                settled += 1
+        except Exception as e:
+            log.exception("Verifying payment %s failed", job.txnid)
+            # Due again once the lease runs out, unless it has used up its attempts.
+            gave_up = job.attempts >= _max_attempts()
+            PaymentVerification.objects.filter(pk=job.pk).update(
+                status=GAVE_UP if gave_up else QUEUED, last_error=repr(e)[:2000], updated_at=timezone.now()
+            )
+    return settled
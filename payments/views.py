@@ -8,7 +8,6 @@ from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.views.decorators.http import require_POST
-from django.contrib.contenttypes.models import ContentType
 from django.db.models import Sum, F, Count
 from django.db.models.functions import Coalesce
 from django.db.models import DecimalField
@@ -17,6 +16,12 @@ from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 
 from order import models as order_models
+from order.notifications import dispatch
+from store.sales import record_paid_order
+from store.stock import commit_order_stock
+
+from .events import record_event
+from .verification import FAILED_STATUSES, enqueue_return
 
 # payments/views.py
 import json
@@ -24,8 +29,12 @@ import secrets
 import hashlib
 from decimal import Decimal
 import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
 import requests
 
+from store.integrations import easebuzz_client
+
 log = logging.getLogger(__name__)
 
 
@@ -57,7 +66,7 @@ def _hash_request(params: dict, salt: str) -> str:
     seq = [str(params.get(f, "") or "") for f in fields]
     raw = "|".join(seq + [salt])
     
-    print("[EASEBUZZ][HASH][REQ] pipes=", raw.count("|"), "len=", len(raw))
+    log.debug("[EASEBUZZ][HASH][REQ] pipes=%s len=%s", raw.count("|"), len(raw))
     return hashlib.sha512(raw.encode("utf-8")).hexdigest()
 
 def _hash_response_reverse(payload: dict, salt: str) -> str:
@@ -85,7 +94,6 @@ def _hash_response_reverse(payload: dict, salt: str) -> str:
     raw = "|".join(seq)
     return hashlib.sha512(raw.encode("utf-8")).hexdigest()
 
-print("[EASEBUZZ][ENV]", settings.EASEBUZZ_ENV, "base:", _ez_base())
 
 @login_required
 @require_POST
@@ -105,7 +113,7 @@ def easebuzz_start(request, order_id: str):
     key = settings.EASEBUZZ_KEY
     salt = settings.EASEBUZZ_SALT
     if not key or not salt:
-        print("[EASEBUZZ] Missing key/salt")
+        log.error("[EASEBUZZ] Missing key/salt")
         return HttpResponseBadRequest("Easebuzz key/salt missing.")
 
     
@@ -174,27 +182,30 @@ def easebuzz_start(request, order_id: str):
     safe_params = dict(params)
     safe_params["key"] = "***" + (key[-4:] if key else "")
     safe_params["hash"] = params["hash"][:8] + "..."  
-    print("[EASEBUZZ][INIT][REQUEST]", json.dumps(safe_params, indent=2))
+    log.debug("[EASEBUZZ][INIT][REQUEST] env=%s %s", settings.EASEBUZZ_ENV, safe_params)
 
     try:
         url = f"{_ez_checkout_base()}/payment/initiateLink"  
-        resp = requests.post(url, data=params, headers={"Content-Type": "application/x-www-form-urlencoded"}, timeout=30)
+        resp = easebuzz_client.post(
+            url, endpoint="payment.initiate", data=params,
+            headers={"Content-Type": "application/x-www-form-urlencoded"}, timeout=30,
+        )
         content_type = resp.headers.get("content-type", "")
         raw_text = (resp.text or "")[:1000]
-        print("[EASEBUZZ][INIT][HTTP]", resp.status_code, content_type)
-        print("[EASEBUZZ][INIT][BODY]", raw_text)
+        log.debug("[EASEBUZZ][INIT][HTTP] %s %s", resp.status_code, content_type)
+        log.debug("[EASEBUZZ][INIT][BODY] %s", raw_text)
         try:
             data = resp.json()
         except Exception:
             
             data = {"status": 0, "data": raw_text}
     except Exception as e:
-        print("[EASEBUZZ][INIT][ERROR]", repr(e))
+        log.exception("[EASEBUZZ][INIT][ERROR] order=%s", order.order_id)
         messages.error(request, f"Easebuzz init error: {e}")
         return redirect(reverse("store:checkout", kwargs={"order_id": order.order_id}))
 
     status = int(data.get("status", 0)) if isinstance(data, dict) else 0
-    print("[EASEBUZZ][INIT][PARSED]", json.dumps(data, indent=2))
+    log.debug("[EASEBUZZ][INIT][PARSED] %s", data)
 
     
     try:
@@ -206,19 +217,19 @@ def easebuzz_start(request, order_id: str):
         order.easebuzz_txnid = txnid
         order.save(update_fields=["payment_meta", "payment_provider", "payment_status", "easebuzz_txnid", "updated_at"])
     except Exception as _e:
-        print("[EASEBUZZ][INIT][ORDER_SAVE_WARN]", repr(_e))
+        log.warning("[EASEBUZZ][INIT][ORDER_SAVE_WARN] order=%s %r", order.order_id, _e)
 
     if status != 1:
         
         reason = data.get("data") or data.get("error") or data
-        print("[EASEBUZZ][INIT][VALIDATION_FAIL]", json.dumps(reason, indent=2))
+        log.warning("[EASEBUZZ][INIT][VALIDATION_FAIL] order=%s %s", order.order_id, reason)
         messages.error(request, f"Payment init failed: {reason}")
         return redirect(reverse("store:checkout", kwargs={"order_id": order.order_id}))
 
     
     access_or_url = data.get("data")
     hosted_url = _hosted_checkout_url_from_data(access_or_url)
-    print("[EASEBUZZ][INIT][REDIRECT]", hosted_url)
+    log.debug("[EASEBUZZ][INIT][REDIRECT] %s", hosted_url)
     return redirect(hosted_url)
 
 
@@ -244,10 +255,16 @@ def easebuzz_start(request, order_id: str):
 
 # Separate bases for checkout vs. API (dashboard)
 def _ez_checkout_base() -> str:
+    override = getattr(settings, "EASEBUZZ_CHECKOUT_BASE", None)
+    if override:
+        return override.rstrip("/")
     env = (getattr(settings, "EASEBUZZ_ENV", "PROD") or "").upper()
     return "https://testpay.easebuzz.in" if env in {"UAT","TEST","SANDBOX"} or getattr(settings, "DEBUG", False) else "https://pay.easebuzz.in"
 
 def _ez_api_base() -> str:
+    override = getattr(settings, "EASEBUZZ_API_BASE", None)
+    if override:
+        return override.rstrip("/")
     env = (getattr(settings, "EASEBUZZ_ENV", "PROD") or "").upper()
     return "https://testdashboard.easebuzz.in" if env in {"UAT","TEST","SANDBOX"} or getattr(settings, "DEBUG", False) else "https://dashboard.easebuzz.in"
 
@@ -280,43 +297,74 @@ def _easebuzz_status_payload(txnid: str, easebuzz_id: str | None) -> dict:
     return payload
 
 
-def _easebuzz_txn_status(txnid: str, easebuzz_id: str | None = None, timeout=10) -> dict | None:
-    payload = _easebuzz_status_payload(txnid, easebuzz_id)
-    headers = {
-        "User-Agent": "FluxStore/1.0",
-        "Accept": "application/json",
-        "Content-Type": "application/x-www-form-urlencoded",
-    }
+# v2 is asked first; v1 is only asked once v2 has failed or has not answered
+# within STORE_EASEBUZZ_STATUS_HEDGE_AFTER seconds, so a healthy v2 costs one
+# call and a slow or broken one at most the hedge delay. Each lookup gets its
+# own small executor, shut down without waiting: a straggler finishes within
+# its request timeout and its thread exits.
 
 
+def _easebuzz_status_attempt(url: str, payload: dict, headers: dict, timeout) -> dict | None:
+    endpoint = "transaction." + url.rstrip("/").split("/")[-2]
+    try:
+        r = easebuzz_client.post(
+            url, endpoint=endpoint, data=payload, headers=headers, timeout=timeout,
+            allow_redirects=False, idempotent=True,
+        )
+    except requests.RequestException as e:
+        log.error("[EASEBUZZ][STATUS][HTTPFAIL] %s :: %s", url, e)
+        return None
 
-    for url in _easebuzz_status_urls():
-        try:
-            r = requests.post(url, data=payload, headers=headers, timeout=timeout, allow_redirects=False)
-            status = r.status_code
-            ctype = r.headers.get("content-type", "")
-            raw = (r.text or "")[:800]
+    status = r.status_code
+    ctype = r.headers.get("content-type", "")
+    raw = (r.text or "")[:800]
 
-            log.info("[EZ][STATUS][HTTP] code=%s ctype=%s", status, ctype)
-            log.info("[EZ][STATUS][BODY] %s", raw)
+    log.info("[EZ][STATUS][HTTP] code=%s ctype=%s", status, ctype)
+    log.info("[EZ][STATUS][BODY] %s", raw)
 
-            
-            if "application/json" not in ctype and not raw.strip().startswith(("{", "[")):
-                log.error("[EASEBUZZ][STATUS][NONJSON] %s %s %s :: %s", status, ctype, url, raw)
-                
-                continue
+    if status >= 500:
+        log.error("[EASEBUZZ][STATUS][UNAVAILABLE] %s %s", status, url)
+        return None
+
+    
+    if "application/json" not in ctype and not raw.strip().startswith(("{", "[")):
+        log.error("[EASEBUZZ][STATUS][NONJSON] %s %s %s :: %s", status, ctype, url, raw)
+        return None
 
-            log.info("[EZ][STATUS][REQ] url=%s payload=%s", url, payload)
+    log.info("[EZ][STATUS][REQ] url=%s payload=%s", url, payload)
 
+    try:
+        return r.json()
+    except Exception:
+        return json.loads((r.text or "").strip() or "{}")
 
-            try:
-                return r.json()
-            except Exception:
-                return json.loads((r.text or "").strip() or "{}")
-        except requests.RequestException as e:
-            log.error("[EASEBUZZ][STATUS][HTTPFAIL] %s :: %s", url, e)
-            continue
-    return None
+
+def _easebuzz_txn_status(txnid: str, easebuzz_id: str | None = None, timeout=10) -> dict | None:
+    payload = _easebuzz_status_payload(txnid, easebuzz_id)
+    headers = {
+        "Accept": "application/json",
+        "Content-Type": "application/x-www-form-urlencoded",
+    }
+
+    hedge_after = getattr(settings, "STORE_EASEBUZZ_STATUS_HEDGE_AFTER", 1.5)
+    urls = _easebuzz_status_urls()
+    pool = ThreadPoolExecutor(max_workers=len(urls) or 1, thread_name_prefix="easebuzz-status")
+    try:
+        pending = set()
+        for url in urls:
+            pending.add(pool.submit(_easebuzz_status_attempt, url, payload, headers, timeout))
+            done, pending = wait(pending, timeout=hedge_after, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result is not None:
+                    return result
+        for future in as_completed(pending):
+            result = future.result()
+            if result is not None:
+                return result
+        return None
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
 
 
 
@@ -377,50 +425,11 @@ def _easebuzz_status_is_success(resp: dict | None) -> tuple[bool, str, str | Non
 
 # ---------- Notification helpers ----------
 
-def _notify_once(recipient, ntype, level, title, message, obj, meta=None):
-    """
-    Idempotent-ish: don't spam duplicates for the same order + title + recipient.
-    """
-    ct = ContentType.objects.get_for_model(obj.__class__)
-    meta = meta or {}
-    exists = order_models.Notification.objects.filter(
-        recipient=recipient,
-        ntype=ntype,
-        title=title,
-        content_type=ct,
-        object_id=str(obj.pk),
-    ).exists()
-    if exists:
-        return
-
-    order_models.Notification.objects.create(
-        recipient=recipient,
-        ntype=ntype,
-        level=level,
-        title=title,
-        message=message or "",
-        content_type=ct,
-        object_id=str(obj.pk),
-        meta=meta,
-    )
-
-def _notify_buyer_order_paid(order):
-    title = "Order placed"
-    message = f"Thanks! Your order #{order.order_id} has been placed."
-    _notify_once(
-        recipient=order.buyer,
-        ntype=order_models.Notification.NType.ORDER,
-        level=order_models.Notification.Level.SUCCESS,
-        title=title,
-        message=message,
-        obj=order,
-        meta={"target_url": f"/customer/orders/{order.order_id}/"},
-    )
-
-def _notify_vendors_order_paid(order):
+def _notify_order_paid(order):
     """
-    One notification per vendor present in the order.
-    Includes a quick summary for that vendor: items, gross, discount, net.
+    "Order placed" to the buyer plus one "New paid order" per vendor in the
+    order with their share (items, net after discounts), sent as a single
+    dispatch so the query count does not grow with the number of vendors.
     """
     vendor_rows = (
         order.items
@@ -442,41 +451,39 @@ def _notify_vendors_order_paid(order):
              )
     )
 
+    recipients = []
+    if order.buyer_id:
+        recipients.append((order.buyer_id, {
+            "title": "Order placed",
+            "message": f"Thanks! Your order #{order.order_id} has been placed.",
+            "meta": {"target_url": f"/customer/orders/{order.order_id}/"},
+        }))
     for row in vendor_rows:
-        vendor_id = row["vendor_id"]
-        if not vendor_id:
-            continue
-        try:
-            vendor_user = order_models.settings.AUTH_USER_MODEL.objects.get(pk=vendor_id)  
-        except Exception:
-            
-            from django.contrib.auth import get_user_model
-            User = get_user_model()
-            vendor_user = User.objects.filter(pk=vendor_id).first()
-        if not vendor_user:
+        if not row["vendor_id"]:
             continue
-
         net = (row["gross"] or Decimal("0.00")) - (row["disc"] or Decimal("0.00"))
-        title = f"New paid order #{order.order_id}"
-        message = f"{row['item_count']} item(s) • ₹{net:.2f} net for you."
-
-        _notify_once(
-            recipient=vendor_user,
-            ntype=order_models.Notification.NType.ORDER,
-            level=order_models.Notification.Level.SUCCESS,
-            title=title,
-            message=message,
-            obj=order,
-            meta={"target_url": f"/vendor/orders/{order.order_id}/"},
-        )
+        recipients.append((row["vendor_id"], {
+            "title": f"New paid order #{order.order_id}",
+            "message": f"{row['item_count']} item(s) • ₹{net:.2f} net for you.",
+            "meta": {"target_url": f"/vendor/orders/{order.order_id}/"},
+        }))
+
+    return dispatch(
+        order, recipients,
+        ntype=order_models.Notification.NType.ORDER,
+        level=order_models.Notification.Level.SUCCESS,
+    )
 
 # ---------- Your return view (drop-in) ----------
 
 @csrf_exempt  
 def easebuzz_return(request):
     """
-    Verify with Easebuzz Transaction API BEFORE marking paid.
-    Then create notifications (buyer + each vendor) and move order to PROCESSING.
+    Record the signed return payload, park the order in PENDING_VERIFICATION
+    and redirect at once. The status API call, the state change and the
+    notifications happen in the verification worker
+    (payments.verification, `manage.py verify_payments`), so the buyer's
+    redirect never waits on the gateway.
     """
     payload = request.POST.dict() if request.method == "POST" else request.GET.dict()
     order_public_id = payload.get("udf1")
@@ -484,106 +491,36 @@ def easebuzz_return(request):
         return HttpResponseBadRequest("Missing udf1 (order id).")
 
     order = get_object_or_404(order_models.Order, order_id=order_public_id)
-
-    txnid = payload.get("txnid", "") or (order.easebuzz_txnid or "")
-    easebuzz_id = payload.get("easebuzz_id", "") or (order.easebuzz_payment_id or "")
     status_val = (payload.get("status", "") or "").lower()
-    print("[EZ][RETURN][PAYLOAD]", json.dumps(payload, indent=2))
-    
-    meta = order.payment_meta or {}
-    meta.update({
-        "easebuzz_return": payload,
-        "return_received_at": timezone.now().isoformat(),
-    })
 
-    
-    
     resp_hash = payload.get("hash", "")
     reverse_ok = False
     try:
         if resp_hash:
             calc = _hash_response_reverse(payload, settings.EASEBUZZ_SALT)
             reverse_ok = (resp_hash.lower() == calc.lower())
-
-            print("[EZ][RETURN][REVHASH] provided=%s calc=%s match=%s" % (
-                resp_hash[:12]+"..." if resp_hash else "",
-                calc[:12]+"..." if 'calc' in locals() else "",
-                str(reverse_ok)
-            ))
-            
     except Exception:
         reverse_ok = False
-        print("[EZ][RETURN][REVHASH] no hash in payload")
-
-    
-    verified_resp = _easebuzz_txn_status(txnid=txnid, easebuzz_id=easebuzz_id)
-    ok, gateway_status, ez_id_from_status = _easebuzz_status_is_success(verified_resp)
-
-    
-    final_success = ok or (reverse_ok and (payload.get("status","").lower() in {"success","captured"}))
-    print("[EZ][VERIFY][RESP]", json.dumps(verified_resp, indent=2))
-    print("[EZ][VERIFY][PARSED] ok=%s gateway_status=%s ez_id=%s" % (ok, gateway_status, ez_id_from_status))
 
-    print("[EZ][DECIDE] reverse_ok=%s payload.status=%s final_success=%s" % (
-        reverse_ok, status_val, ok or (reverse_ok and status_val in {"success","captured"})
-    ))
-
-    
-    meta["easebuzz_verify"] = {
-        "ok": ok,
-        "gateway_status": gateway_status,
-        "raw": verified_resp,
-    }
-
-    
-    if ez_id_from_status and not easebuzz_id:
-        easebuzz_id = ez_id_from_status
-
-    order.payment_meta = meta
-    order.easebuzz_payment_id = easebuzz_id or order.easebuzz_payment_id
-
-    
-    
-    if final_success:
-        if order.payment_status != "PAID":
-            order.payment_status = "PAID"
-            order.status = order_models.Order.OrderStatus.PROCESSING
-            order.save(update_fields=["payment_meta", "easebuzz_payment_id", "payment_status", "status", "updated_at"])
-
-            try:
-                if order.buyer:
-                    _notify_buyer_order_paid(order)
-            except Exception as e:
-                log.warning("Buyer notify failed: %s", e)
-            try:
-                _notify_vendors_order_paid(order)
-            except Exception as e:
-                log.warning("Vendor notify failed: %s", e)
+    job = enqueue_return(order, payload, reverse_ok)
+    log.info(
+        "[EZ][RETURN] order=%s txnid=%s status=%s hash_ok=%s job=%s",
+        order.order_id, job.txnid, status_val, reverse_ok, job.pk,
+    )
 
-        return redirect(reverse("payments:thank_you", kwargs={"order_id": order.order_id}))
-    else:
-        
-        nonjson = not isinstance(verified_resp, dict)
-        if order.payment_status != "PAID":
-            hard_fail = (not nonjson) and status_val in {"failed", "tampered", "bounced"}
-            order.payment_status = "FAILED" if hard_fail else "PENDING"
-            order.save(update_fields=["payment_meta", "easebuzz_payment_id", "payment_status", "updated_at"])
-
-        
-        return redirect(
-            reverse("payments:failed", kwargs={"order_id": order.order_id})
-            if order.payment_status == "FAILED"
-            else reverse("payments:thank_you", kwargs={"order_id": order.order_id})  
-        )
+    if reverse_ok and status_val in FAILED_STATUSES:
+        return redirect(reverse("payments:failed", kwargs={"order_id": order.order_id}))
+    return redirect(reverse("payments:thank_you", kwargs={"order_id": order.order_id}))
 
 
 
 @csrf_exempt
 def easebuzz_webhook(request):
     """
-    Optional but recommended:
-    Configure a webhook URL in Easebuzz dashboard to get authoritative status.
-    We map txn -> order using udf1 or txnid and mark PAID/FAILED.
+    Configure this URL in the Easebuzz dashboard for authoritative status.
+    A delivery is only inserted into the PaymentEvent inbox (a duplicate is
+    dropped by its unique key) and acknowledged; `manage.py
+    process_payment_events` maps it to the order via udf1 and applies it.
     """
     try:
         body = request.body.decode("utf-8") or "{}"
@@ -591,30 +528,8 @@ def easebuzz_webhook(request):
     except Exception:
         data = request.POST.dict()
 
-    order_id = data.get("udf1") or data.get("merchant_ref_no") or ""
-    if not order_id:
-        return JsonResponse({"ok": False, "reason": "missing order_id in payload"}, status=400)
-
-    order = get_object_or_404(order_models.Order, order_id=order_id)
-
-    status_val = (data.get("status", "") or "").lower()
-    easebuzz_id = data.get("easebuzz_id") or data.get("payment_id") or ""
-
-    meta = order.payment_meta or {}
-    meta.update({"easebuzz_webhook": data})
-    order.payment_meta = meta
-    if easebuzz_id:
-        order.easebuzz_payment_id = easebuzz_id
-
-    if status_val in ("success", "captured"):
-        order.payment_status = "PAID"
-        order.status = order_models.Order.OrderStatus.PROCESSING
-    elif status_val in ("failed", "tampered", "bounced"):
-        order.payment_status = "FAILED"
-    else:
-        order.payment_status = order.payment_status or "PENDING"
-
-    order.save(update_fields=["payment_meta", "easebuzz_payment_id", "payment_status", "status", "updated_at"])
+    if not record_event(data):
+        return JsonResponse({"ok": False, "reason": "missing order_id or txnid in payload"}, status=400)
     return JsonResponse({"ok": True})
 
 
@@ -643,6 +558,8 @@ def confirm_payment(request, order_id: str):
     order.payment_meta = meta
 
     order.save(update_fields=["payment_provider", "payment_status", "status", "payment_meta", "updated_at"])
+    record_paid_order(order)
+    commit_order_stock(order)
 
     return redirect("payments:thank_you", order_id=order.order_id)
 
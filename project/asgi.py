@@ -2,6 +2,8 @@
 ASGI config for project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve through it (e.g. uvicorn/daphne) for the vendor notification stream
+(STORE_NOTIFICATION_SSE); under WSGI each open stream would hold a worker.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
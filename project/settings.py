@@ -171,6 +171,46 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 ADDON_GLOBAL_CONTEXT_CACHE_TIMEOUT = env.int("ADDON_GLOBAL_CONTEXT_CACHE_TIMEOUT", default=300)
 
+STORE_SEARCH_BACKEND = env.str("STORE_SEARCH_BACKEND", default="store.search.InvertedIndexBackend")
+STORE_SEARCH_CHANGE_KEEP = env.int("STORE_SEARCH_CHANGE_KEEP", default=500)
+STORE_SUGGEST_WORKERS = env.int("STORE_SUGGEST_WORKERS", default=-1)
+STORE_SUGGEST_FEW_HITS = env.int("STORE_SUGGEST_FEW_HITS", default=3)
+STORE_SUGGEST_VOCAB_TTL = env.int("STORE_SUGGEST_VOCAB_TTL", default=300)
+STORE_SUGGEST_LIMIT = env.int("STORE_SUGGEST_LIMIT", default=5)
+STORE_SUGGEST_MIN_SCORE = env.float("STORE_SUGGEST_MIN_SCORE", default=0.6)
+STORE_HOME_CACHE_TIMEOUT = env.int("STORE_HOME_CACHE_TIMEOUT", default=300)
+STORE_STOCK_HOLD_MINUTES = env.int("STORE_STOCK_HOLD_MINUTES", default=15)
+STORE_COUPON_CACHE_TIMEOUT = env.int("STORE_COUPON_CACHE_TIMEOUT", default=3600)
+STORE_COUPON_MISS_TIMEOUT = env.int("STORE_COUPON_MISS_TIMEOUT", default=60)
+# Guest carts go to the cache only when it is shared (CACHE_URL); per-worker locmem would split and lose them.
+STORE_CART_BACKEND = env.str(
+    "STORE_CART_BACKEND",
+    default="store.carts.CacheCartStorage" if "CACHE_URL" in env.ENVIRON else "store.carts.DatabaseCartStorage",
+)
+STORE_GUEST_CART_TIMEOUT = env.int("STORE_GUEST_CART_TIMEOUT", default=60 * 60 * 24 * 14)
+STORE_SUMMARY_TIMEOUT = env.int("STORE_SUMMARY_TIMEOUT", default=60 * 60 * 24)
+# Used instead while the cache is per-process locmem (no CACHE_URL): other workers cannot see the bumps.
+STORE_SUMMARY_LOCAL_TIMEOUT = env.int("STORE_SUMMARY_LOCAL_TIMEOUT", default=10)
+STORE_VARIANT_MAP_TIMEOUT = env.int("STORE_VARIANT_MAP_TIMEOUT", default=3600)
+STORE_SHIPPING_QUOTE_TTL = env.int("STORE_SHIPPING_QUOTE_TTL", default=900)
+STORE_SHIPPING_QUOTE_STALE = env.int("STORE_SHIPPING_QUOTE_STALE", default=86400)
+STORE_SHIPPING_QUOTE_BACKGROUND = env.bool("STORE_SHIPPING_QUOTE_BACKGROUND", default=True)
+STORE_SHIPPING_WEIGHT_STEP = env.str("STORE_SHIPPING_WEIGHT_STEP", default="0.5")
+STORE_HTTP_POOL_SIZE = env.int("STORE_HTTP_POOL_SIZE", default=10)
+STORE_HTTP_RETRIES = env.int("STORE_HTTP_RETRIES", default=2)
+STORE_HTTP_BACKOFF = env.float("STORE_HTTP_BACKOFF", default=0.2)
+STORE_EASEBUZZ_STATUS_HEDGE_AFTER = env.float("STORE_EASEBUZZ_STATUS_HEDGE_AFTER", default=1.5)
+STORE_PAYMENT_VERIFY_LEASE = env.int("STORE_PAYMENT_VERIFY_LEASE", default=120)
+STORE_PAYMENT_VERIFY_ATTEMPTS = env.int("STORE_PAYMENT_VERIFY_ATTEMPTS", default=6)
+STORE_NOTIFICATION_SSE = env.bool("STORE_NOTIFICATION_SSE", default=False)
+STORE_NOTIFICATION_SSE_INTERVAL = env.float("STORE_NOTIFICATION_SSE_INTERVAL", default=3)
+STORE_NOTIFICATION_SSE_LIFETIME = env.int("STORE_NOTIFICATION_SSE_LIFETIME", default=300)
+STORE_NOTIFICATION_RETENTION_DAYS = env.int("STORE_NOTIFICATION_RETENTION_DAYS", default=90)
+STORE_NOTIFICATION_ARCHIVE_BATCH = env.int("STORE_NOTIFICATION_ARCHIVE_BATCH", default=1000)
+
+# The store caches (and guest carts, once set) live here; point CACHE_URL at Redis in production (redis://host:6379/1).
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
@@ -109,3 +109,34 @@ class ProductReviewAdmin(admin.ModelAdmin):
     search_fields = ("product__name", "user__email", "comment")
     date_hierarchy = "created_at"
     readonly_fields = ("created_at", "uuid")
+
+
+@admin.register(models.ProductCardSnapshot)
+class ProductCardSnapshotAdmin(admin.ModelAdmin):
+    list_display = ("product", "sale_price", "label", "in_stock", "rating_avg", "rating_count", "refreshed_at")
+    list_filter = ("in_stock", "deal_active", "label")
+    search_fields = ("product__name",)
+    readonly_fields = ("refreshed_at",)
+
+
+@admin.register(models.ProductSalesStats)
+class ProductSalesStatsAdmin(admin.ModelAdmin):
+    list_display = ("product", "units_sold", "revenue", "last_sold_at", "updated_at")
+    search_fields = ("product__name",)
+    readonly_fields = ("updated_at",)
+
+
+@admin.register(models.VariationSalesStats)
+class VariationSalesStatsAdmin(admin.ModelAdmin):
+    list_display = ("variation", "product", "units_sold", "revenue", "last_sold_at", "updated_at")
+    search_fields = ("product__name", "variation__sku")
+    readonly_fields = ("updated_at",)
+
+
+@admin.register(models.StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ("order", "variation", "quantity", "status", "expires_at", "created_at")
+    list_filter = ("status",)
+    search_fields = ("order__order_id", "variation__sku")
+    raw_id_fields = ("order", "variation")
+    readonly_fields = ("created_at", "updated_at")
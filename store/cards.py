@@ -0,0 +1,139 @@
+from django.db import connection, transaction
+from django.db.models import Prefetch
+
+from .models import Product, ProductCardSnapshot, ProductImage, ProductVariation
+
+
+SNAPSHOT_FIELDS = [
+    "variation",
+    "sale_price",
+    "regular_price",
+    "show_regular_price",
+    "show_discount_type",
+    "discount_amount",
+    "label",
+    "show_label",
+    "deal_active",
+    "in_stock",
+    "image_url",
+    "rating_avg",
+    "rating_count",
+    "refreshed_at",
+]
+
+
+def _image_url(img):
+    if img is None or not img.image:
+        return ""
+    try:
+        return img.image.url
+    except ValueError:
+        return ""
+
+
+def _build_snapshot(p: Product) -> ProductCardSnapshot:
+    primary = p.card_primary_items[0] if p.card_primary_items else None
+    img = p.card_primary_images[0] if p.card_primary_images else None
+
+    return ProductCardSnapshot(
+        product=p,
+        variation=primary,
+        sale_price=primary.sale_price if primary else None,
+        regular_price=primary.regular_price if primary else None,
+        show_regular_price=primary.show_regular_price if primary else False,
+        show_discount_type=primary.show_discount_type if primary else "none",
+        discount_amount=primary.discount_amount() if primary else 0,
+        label=primary.label if primary else "",
+        show_label=primary.show_label if primary else False,
+        deal_active=primary.deal_active if primary else False,
+        in_stock=(primary.stock_quantity > 0) if primary else False,
+        image_url=_image_url(img),
+        rating_avg=p.rating_avg,
+        rating_count=p.rating_count,
+    )
+
+
+def refresh_product_cards(product_ids):
+    """
+    Rebuild snapshots for the given products in a fixed number of queries.
+    Products that are not published lose their snapshot.
+    Returns {product_id: snapshot} for the rows that were written.
+    """
+    ids = {int(pid) for pid in product_ids if pid}
+    if not ids:
+        return {}
+
+    products = list(
+        Product.objects.filter(pk__in=ids, status=Product.ProductStatus.PUBLISHED)
+        .prefetch_related(
+            Prefetch(
+                "variations",
+                queryset=ProductVariation.objects.filter(is_active=True, is_primary=True),
+                to_attr="card_primary_items",
+            ),
+            Prefetch(
+                "images",
+                queryset=ProductImage.objects.filter(is_primary=True).order_by("id"),
+                to_attr="card_primary_images",
+            ),
+        )
+        .order_by()
+    )
+
+    published_ids = {p.pk for p in products}
+    stale = ids - published_ids
+    if stale:
+        ProductCardSnapshot.objects.filter(product_id__in=stale).delete()
+
+    snapshots = [_build_snapshot(p) for p in products]
+    if snapshots:
+        ProductCardSnapshot.objects.bulk_create(
+            snapshots,
+            update_conflicts=True,
+            unique_fields=["product"],
+            update_fields=SNAPSHOT_FIELDS,
+        )
+    return {s.product_id: s for s in snapshots}
+
+
+def refresh_product_card(product_id):
+    return refresh_product_cards([product_id]).get(product_id)
+
+
+def schedule_card_refresh(product_id):
+    """
+    Refresh once the surrounding transaction commits, so views that flip
+    `is_primary` with a follow-up queryset `.update()` are seen as a whole.
+    The first callback to run refreshes everything queued so far; the rest
+    find nothing left to do.
+    """
+    if not product_id:
+        return
+    pending = getattr(connection, "_pending_card_refresh", None)
+    if pending is None:
+        pending = set()
+        connection._pending_card_refresh = pending
+    pending.add(product_id)
+
+    def _flush():
+        ids = set(pending)
+        pending.clear()
+        if ids:
+            refresh_product_cards(ids)
+
+    transaction.on_commit(_flush)
+
+
+def with_cards(products):
+    """
+    Make sure every product in `products` (already fetched with
+    select_related("card")) carries a snapshot, building any that are missing.
+    """
+    products = list(products)
+    missing = [p.pk for p in products if not hasattr(p, "card")]
+    if missing:
+        built = refresh_product_cards(missing)
+        for p in products:
+            if p.pk in built:
+                p.card = built[p.pk]
+    return products
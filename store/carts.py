@@ -0,0 +1,229 @@
+from decimal import Decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+
+from order.models import Cart, CartItem
+
+from .models import ProductVariation
+
+
+DEFAULT_CART_BACKEND = "store.carts.DatabaseCartStorage"
+GUEST_CART_KEY = "store:guestcart:%s"
+
+
+class GuestLine:
+    """One line of a GuestCart, with the CartItem attributes the cart views read."""
+
+    def __init__(self, variation_id, quantity, price, value_ids=None, display=None):
+        self.product_variation_id = variation_id
+        self.product_variation = None
+        self.quantity = quantity
+        self.price = price
+        self.value_ids = list(value_ids or [])
+        self.display = dict(display or {})
+
+    @property
+    def id(self):
+        # A cart holds one line per variation, so the variation id names the line.
+        return self.product_variation_id
+
+    @property
+    def selected_variations_json(self):
+        return CartItem.selection_json(self.value_ids, self.display)
+
+    def subtotal(self):
+        return (self.price or Decimal("0.00")) * self.quantity
+
+    def dump(self):
+        return {"quantity": self.quantity, "price": self.price, "value_ids": self.value_ids, "display": self.display}
+
+
+class GuestCart:
+    """
+    An anonymous visitor's cart, kept as one cache entry under their session
+    key. It answers the same add_item / total_amount / item_count calls as a
+    Cart row, but browsing and filling it never write to SQL; the lines only
+    reach the database when the visitor signs in and they are merged into
+    their Cart (adopt_guest_cart). Abandoned carts simply expire.
+    """
+
+    pk = id = None
+    user = None
+
+    def __init__(self, storage, session_key, data=None):
+        self.storage = storage
+        self.session_key = session_key
+        self._lines = {vid: GuestLine(vid, **row) for vid, row in (data or {}).items()}
+
+    def dump(self):
+        return {vid: line.dump() for vid, line in self._lines.items()}
+
+    def _line(self, item_id):
+        try:
+            return self._lines.get(int(item_id))
+        except (TypeError, ValueError):
+            return None
+
+    def add_item(self, product_variation, quantity=1, override_quantity=False, value_ids=None, display=None):
+        if quantity < 1:
+            raise ValidationError("Quantity must be >= 1")
+        if not product_variation.is_active:
+            raise ValidationError("Variant is not active")
+
+        line = self._lines.get(product_variation.pk)
+        created = line is None
+        new_qty = quantity if created or override_quantity else line.quantity + quantity
+        if product_variation.stock_quantity < new_qty:
+            raise ValidationError("Insufficient stock for requested quantity")
+
+        if created:
+            line = self._lines[product_variation.pk] = GuestLine(product_variation.pk, 0, product_variation.sale_price)
+        line.previous_quantity, line.previous_subtotal = line.quantity, line.subtotal()
+        line.quantity = new_qty
+        line.price = product_variation.sale_price
+        if value_ids or display:
+            line.value_ids, line.display = list(value_ids or []), dict(display or {})
+        line.product_variation = product_variation
+        self.storage.save(self)
+        return line, created
+
+    def set_item_quantity(self, item_id, quantity):
+        line = self._line(item_id)
+        if line is None:
+            return None
+        if quantity == 0:
+            del self._lines[line.id]
+        else:
+            variation = ProductVariation.objects.only("stock_quantity", "sale_price").get(pk=line.id)
+            if quantity > variation.stock_quantity:
+                raise ValidationError(f"Only {variation.stock_quantity} units available in stock")
+            line.quantity, line.price = quantity, variation.sale_price
+        self.storage.save(self)
+        return line
+
+    def lines(self):
+        """The lines with their variations (and products) loaded in one query; lines of deleted variations drop out."""
+        variations = ProductVariation.objects.select_related("product").in_bulk(list(self._lines))
+        out = []
+        for vid, line in self._lines.items():
+            if vid in variations:
+                line.product_variation = variations[vid]
+                out.append(line)
+        return out
+
+    def item_count(self):
+        return len(self._lines)
+
+    def total_amount(self):
+        return sum((line.subtotal() for line in self._lines.values()), Decimal("0.00"))
+
+    def summary(self):
+        return {
+            "cart_items": len(self._lines),
+            "cart_quantity": sum(line.quantity for line in self._lines.values()),
+            "cart_subtotal": self.total_amount(),
+        }
+
+    def delete(self):
+        self._lines = {}
+        self.storage.discard(self.session_key)
+
+
+class DatabaseCartStorage:
+    """Guest carts as Cart rows keyed by session_key (every change is a SQL write)."""
+
+    def get(self, session_key):
+        if not session_key:
+            return None
+        return Cart.objects.filter(session_key=session_key, user=None).first()
+
+    def guest_cart(self, request, create=False):
+        return Cart.get_for_request(request) if create else Cart.get_existing_for_request(request)
+
+
+class CacheCartStorage:
+    """
+    Guest carts in the default cache. Only safe on a cache every worker
+    shares and that outlives a deploy (Redis via CACHE_URL); settings.py
+    picks it only when CACHE_URL is set.
+    """
+
+    def timeout(self):
+        return getattr(settings, "STORE_GUEST_CART_TIMEOUT", settings.SESSION_COOKIE_AGE)
+
+    def get(self, session_key):
+        if not session_key:
+            return None
+        data = cache.get(GUEST_CART_KEY % session_key)
+        return None if data is None else GuestCart(self, session_key, data)
+
+    def guest_cart(self, request, create=False):
+        session = request.session
+        if not session.session_key:
+            if not create:
+                return None
+            session.create()
+        cart = self.get(session.session_key)
+        if cart is None and create:
+            cart = GuestCart(self, session.session_key)
+        return cart
+
+    def save(self, cart):
+        cache.set(GUEST_CART_KEY % cart.session_key, cart.dump(), self.timeout())
+
+    def discard(self, session_key):
+        cache.delete(GUEST_CART_KEY % session_key)
+
+
+@lru_cache(maxsize=None)
+def get_cart_storage():
+    path = getattr(settings, "STORE_CART_BACKEND", DEFAULT_CART_BACKEND)
+    return import_string(path)()
+
+
+def _reset_cart_storage(*, setting, **kwargs):
+    if setting == "STORE_CART_BACKEND":
+        get_cart_storage.cache_clear()
+
+
+setting_changed.connect(_reset_cart_storage, dispatch_uid="store_carts_setting_changed")
+
+
+def cart_for_request(request, create=True):
+    """
+    The request's cart: the user's Cart row when signed in, otherwise the
+    guest cart from the configured storage. With create=False a visitor who
+    has no cart yet gets None and nothing is created.
+    """
+    if request.user.is_authenticated:
+        return Cart.get_for_request(request) if create else Cart.get_existing_for_request(request)
+    if getattr(request, "session", None) is None:
+        return None
+    return get_cart_storage().guest_cart(request, create=create)
+
+
+def adopt_guest_cart(request, session_key):
+    """
+    Call right after login() with the session key the visitor had before it:
+    their guest cart is merged into the user's Cart row and discarded. A
+    guest Cart row left from before the cache storage was switched on is
+    merged too, so those carts are not orphaned.
+    """
+    storage = get_cart_storage()
+    guests = [storage.get(session_key)]
+    if not isinstance(storage, DatabaseCartStorage):
+        guests.append(DatabaseCartStorage().get(session_key))
+    guests = [guest for guest in guests if guest is not None and guest.item_count()]
+    if not guests:
+        return None
+    # Not Cart.get_for_request: the session's cart_id still names the guest row.
+    cart, _ = Cart.objects.get_or_create(user=request.user)
+    Cart._remember_in_session(request, cart)
+    for guest in guests:
+        cart.merge_from(guest)
+    return cart
@@ -0,0 +1,91 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+
+from order.models import Order, OrderItem
+
+from .stock import reserve_order_stock
+
+
+ZERO = Decimal("0.00")
+
+
+def cart_lines(cart):
+    """Cart items with everything order creation reads: two queries however long the cart is."""
+    return cart.lines()
+
+
+def address_snapshot(addr):
+    return {
+        "full_name": addr.full_name,
+        "phone": addr.phone,
+        "street_address": addr.street_address,
+        "city": addr.city,
+        "state": addr.state,
+        "postal_code": addr.postal_code,
+        "country": addr.country,
+    }
+
+
+def shipping_weight(lines) -> Decimal:
+    return sum(((ci.product_variation.weight or ZERO) * ci.quantity for ci in lines), ZERO)
+
+
+def flat_shipping(lines) -> Decimal:
+    """Per-variation shipping_price × quantity, the fallback when no courier rate is chosen."""
+    return sum(((ci.product_variation.shipping_price or ZERO) * ci.quantity for ci in lines), ZERO)
+
+
+def create_order_from_cart(user, addr, lines, shipping_fee=ZERO):
+    """
+    Turn cart lines into an Order with its items: one INSERT for the order,
+    one bulk INSERT for the items and one for their variation-value through
+    rows, whatever the cart size. Line and order totals are computed in
+    memory, so nothing is re-read afterwards. The ordered units are then held
+    with one conditional UPDATE per distinct variation (store.stock), so the
+    query count is linear in distinct variations; on InsufficientStock the
+    order is rolled back with them.
+    """
+    items, quantities = [], {}
+    for ci in lines:
+        pv = ci.product_variation
+        quantities[pv.pk] = quantities.get(pv.pk, 0) + ci.quantity
+        oi = OrderItem(
+            product_variation=pv,
+            vendor_id=pv.product.vendor_id or user.pk,
+            quantity=ci.quantity,
+            price=ci.price or pv.sale_price,
+        )
+        oi.recompute_line_totals()
+        items.append(oi)
+
+    gross = sum((oi.subtotal for oi in items), ZERO)
+    disc = sum((oi.line_discount_total or ZERO for oi in items), ZERO)
+    order = Order(
+        buyer=user,
+        address=addr,
+        currency=getattr(settings, "DEFAULT_CURRENCY", "INR"),
+        item_total=gross,
+        item_discount_total=disc,
+        item_total_net=max(gross - disc, ZERO),
+        shipping_fee=shipping_fee,
+        shipping_address_snapshot=address_snapshot(addr),
+    )
+    order.recalc_total()
+    with transaction.atomic():
+        order.set_order_id_if_missing()
+        order.save()
+
+        for oi in items:
+            oi.order = order
+        OrderItem.objects.bulk_create(items)
+
+        Through = OrderItem.variation_values.through
+        Through.objects.bulk_create([
+            Through(orderitem_id=oi.pk, variationvalue_id=vv.pk)
+            for oi, ci in zip(items, lines)
+            for vv in ci.variation_values.all()
+        ])
+        reserve_order_stock(order, quantities)
+    return order
@@ -0,0 +1,268 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from order.models import Coupon, CouponRedemption, OrderItem, OrderItemDiscount
+
+
+ZERO = Decimal("0.00")
+ORDER_TOTAL_FIELDS = ["item_total", "item_discount_total", "item_total_net", "amount_payable", "total_amount"]
+LINE_FIELDS = ["line_discount_total", "line_subtotal_net"]
+
+
+def _q(x: Decimal) -> Decimal:
+    return (x or Decimal('0')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def _prorate_fixed(items, target_amount: Decimal):
+    target = _q(target_amount)
+    parts = [(it.id, it.subtotal) for it in items]
+    gross = sum((g for _, g in parts), Decimal('0.00'))
+    if gross <= 0 or target <= 0:
+        return {it.id: Decimal('0.00') for it in items}
+    alloc, running = {}, Decimal('0.00')
+    for idx, (iid, g) in enumerate(parts):
+        if idx < len(parts) - 1:
+            share = _q(target * (g / gross))
+            alloc[iid], running = share, running + share
+        else:
+            alloc[iid] = _q(target - running)
+    return alloc
+
+
+def _prorate_percent(items, percent_off, discount: Decimal):
+    # Each line gets its own percentage; the last line absorbs rounding and the max_discount_amount cap.
+    pct = Decimal(str(percent_off)) / Decimal('100')
+    alloc, running = {}, Decimal('0.00')
+    for idx, it in enumerate(items):
+        if idx < len(items) - 1:
+            share = _q(it.subtotal * pct)
+            alloc[it.id], running = share, running + share
+        else:
+            alloc[it.id] = _q(discount - running)
+    return alloc
+
+
+def coupon_discount(coupon, vendor_gross: Decimal) -> Decimal:
+    if coupon.discount_type == Coupon.DiscountType.PERCENT:
+        discount = vendor_gross * (Decimal(str(coupon.percent_off or 0)) / Decimal('100'))
+        if coupon.max_discount_amount:
+            discount = min(discount, coupon.max_discount_amount)
+    else:
+        discount = min(Decimal(str(coupon.amount_off or 0)), vendor_gross)
+    return _q(discount)
+
+
+def _order_items(order):
+    return list(order.items.order_by("pk"))
+
+
+def _save_totals(order, items):
+    """Order totals from the in-memory lines, the same sums recompute_item_totals_from_items() reads back."""
+    gross = sum((it.subtotal for it in items), ZERO)
+    disc = sum((it.line_discount_total or ZERO for it in items), ZERO)
+    order.item_total = gross
+    order.item_discount_total = disc
+    order.item_total_net = max(gross - disc, ZERO)
+    order.recalc_total()
+    order.save(update_fields=ORDER_TOTAL_FIELDS)
+
+
+def _allocations(item_ids, coupon):
+    return OrderItemDiscount.objects.filter(order_item__in=item_ids, coupon=coupon)
+
+
+def _live_q(now):
+    """Coupon.is_live() as a filter, for checks against the row rather than a cached copy."""
+    return (
+        Q(is_active=True) &
+        (Q(starts_at__isnull=True) | Q(starts_at__lte=now)) &
+        (Q(ends_at__isnull=True) | Q(ends_at__gte=now))
+    )
+
+
+def _claim_use(coupon) -> bool:
+    # Conditional increment: concurrent redemptions of the last use race on the
+    # coupon row and only one UPDATE still matches times_redeemed < limit. The
+    # same UPDATE re-checks that the row is still live, since `coupon` may be a
+    # cached copy from before it was deactivated or its window moved.
+    within_limit = Q(usage_limit_total__isnull=True) | Q(times_redeemed__lt=F("usage_limit_total"))
+    return bool(
+        Coupon.objects.filter(within_limit, _live_q(timezone.now()), pk=coupon.pk)
+        .update(times_redeemed=F("times_redeemed") + 1)
+    )
+
+
+def _refusal(coupon) -> str:
+    """Why _claim_use matched no row: the coupon is gone or no longer live, or its uses ran out."""
+    if not Coupon.objects.filter(_live_q(timezone.now()), pk=coupon.pk).exists():
+        return "Coupon is not active."
+    return "Coupon usage limit reached."
+
+
+def apply_coupon_to_order(order, coupon, user):
+    """
+    Apply a vendor coupon to that vendor's lines of the order. The lines are
+    read once, the allocation is computed in memory and written back with one
+    bulk INSERT/UPDATE each, so the cost does not depend on the order's size.
+    Returns (ok, message).
+    """
+    if not coupon.is_live():
+        return False, "Coupon is not active."
+    vendor_id = coupon.vendor_id
+    items = _order_items(order)
+    vendor_items = [it for it in items if it.vendor_id == vendor_id]
+    if not vendor_items:
+        return False, "Coupon vendor has no items in this order."
+
+    uses = coupon.redemptions.aggregate(
+        mine=Count("id", filter=Q(user=user)),
+        here=Count("id", filter=Q(order=order, vendor_id=vendor_id)),
+    )
+    reapplying = uses["here"] > 0
+    if not reapplying and coupon.usage_limit_per_user is not None and uses["mine"] >= coupon.usage_limit_per_user:
+        return False, "You have already used this coupon the maximum number of times."
+
+    vendor_gross = sum((it.subtotal for it in vendor_items), ZERO)
+    if coupon.min_order_amount and vendor_gross < coupon.min_order_amount:
+        return False, f"Vendor subtotal must be at least {coupon.min_order_amount}."
+
+    discount = coupon_discount(coupon, vendor_gross)
+    if discount <= 0:
+        return False, "Coupon yields no discount for this order."
+
+    if coupon.discount_type == Coupon.DiscountType.FIXED:
+        allocation = _prorate_fixed(vendor_items, discount)
+    else:
+        allocation = _prorate_percent(vendor_items, coupon.percent_off, discount)
+
+    item_ids = [it.id for it in vendor_items]
+    try:
+        with transaction.atomic():
+            if reapplying:
+                if not Coupon.objects.filter(_live_q(timezone.now()), pk=coupon.pk).exists():
+                    return False, "Coupon is not active."
+                CouponRedemption.objects.filter(coupon=coupon, order=order, vendor_id=vendor_id).update(
+                    discount_amount=discount
+                )
+            else:
+                # The total limit and liveness are checked against the row here: `coupon` may be a
+                # cached copy with a stale counter, or one deactivated since in another process.
+                if not _claim_use(coupon):
+                    return False, _refusal(coupon)
+                CouponRedemption.objects.create(
+                    coupon=coupon, order=order, user=user, vendor_id=vendor_id, discount_amount=discount
+                )
+
+            # Re-applying replaces this coupon's earlier share of each line rather than stacking on it.
+            previous = dict(
+                _allocations(item_ids, coupon).values("order_item_id").annotate(total=Sum("amount"))
+                .values_list("order_item_id", "total")
+            )
+            _allocations(item_ids, coupon).delete()
+            OrderItemDiscount.objects.bulk_create([
+                OrderItemDiscount(order_item=it, coupon=coupon, vendor_id=vendor_id, amount=allocation[it.id])
+                for it in vendor_items
+                if allocation.get(it.id, ZERO) > 0
+            ])
+            for it in vendor_items:
+                it.line_discount_total = _q(max(
+                    (it.line_discount_total or ZERO) - previous.get(it.id, ZERO) + allocation.get(it.id, ZERO), ZERO
+                ))
+                it.recompute_line_totals()
+            OrderItem.objects.bulk_update(vendor_items, LINE_FIELDS)
+            _save_totals(order, items)
+    except IntegrityError:
+        # A concurrent request applied it to this order first; our usage claim rolled back with the insert.
+        return False, "Coupon is already applied to this order."
+
+    return True, f"Applied {coupon.code}."
+
+
+def remove_coupon_from_order(order, coupon):
+    """Undo a coupon's allocations on the order and give its use back to the coupon."""
+    vendor_id = coupon.vendor_id
+    items = _order_items(order)
+    vendor_items = [it for it in items if it.vendor_id == vendor_id]
+    item_ids = [it.id for it in vendor_items]
+
+    with transaction.atomic():
+        by_item = dict(
+            _allocations(item_ids, coupon).values("order_item_id").annotate(total=Sum("amount"))
+            .values_list("order_item_id", "total")
+        )
+        _allocations(item_ids, coupon).delete()
+        removed, _ = CouponRedemption.objects.filter(coupon=coupon, order=order, vendor_id=vendor_id).delete()
+        if removed:
+            Coupon.objects.filter(pk=coupon.pk, times_redeemed__gte=removed).update(
+                times_redeemed=F("times_redeemed") - removed
+            )
+
+        changed = []
+        for it in vendor_items:
+            undo = _q(by_item.get(it.id, ZERO))
+            if undo > 0:
+                it.line_discount_total = _q(max((it.line_discount_total or 0) - undo, ZERO))
+                it.recompute_line_totals()
+                changed.append(it)
+        OrderItem.objects.bulk_update(changed, LINE_FIELDS)
+        _save_totals(order, items)
+
+
+# ---------- code lookup cache ----------
+# One entry per normalized code: the Coupon, or MISSING for unknown codes. An
+# entry lives until the coupon's next starts_at/ends_at boundary (capped), so
+# is_live() on a cached coupon never reads a window that has since moved;
+# edits and deletes drop the entry (store.signals).
+COUPON_KEY = "store:coupon:%s"
+MISSING = "missing"
+
+
+def _entry_timeout(coupon, now):
+    cap = getattr(settings, "STORE_COUPON_CACHE_TIMEOUT", 3600)
+    if coupon is None:
+        return min(cap, getattr(settings, "STORE_COUPON_MISS_TIMEOUT", 60))
+    for boundary in (coupon.starts_at, coupon.ends_at):
+        if boundary and boundary > now:
+            return max(1, min(cap, int((boundary - now).total_seconds())))
+    return cap
+
+
+def cached_coupon(code):
+    """The Coupon for a buyer-entered code (any case), or None. Served from cache after the first lookup."""
+    norm = Coupon.normalize_code(code)
+    if not norm:
+        return None
+    key = COUPON_KEY % norm
+    entry = cache.get(key)
+    if entry is None:
+        coupon = Coupon.objects.filter(code_normalized=norm).first()
+        entry = coupon or MISSING
+        cache.set(key, entry, _entry_timeout(coupon, timezone.now()))
+    return None if entry == MISSING else entry
+
+
+def invalidate_coupon_codes(codes):
+    keys = {COUPON_KEY % Coupon.normalize_code(code) for code in codes if code}
+    if keys:
+        cache.delete_many(list(keys))
+
+
+def schedule_coupon_invalidation(codes):
+    """Drop the codes' cache entries once the current transaction commits."""
+    pending = getattr(connection, "_pending_coupon_invalidation", None)
+    if pending is None:
+        pending = set()
+        connection._pending_coupon_invalidation = pending
+    pending.update(code for code in codes if code)
+
+    def _flush():
+        codes = list(pending)
+        pending.clear()
+        invalidate_coupon_codes(codes)
+
+    transaction.on_commit(_flush)
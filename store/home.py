@@ -0,0 +1,187 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count
+
+from .cards import with_cards
+from .models import Category, Product, ProductVariation
+
+
+# Each home page section is a `{% cache %}` fragment in index.html whose key
+# includes the section's version. Bumping the version orphans the fragment, so
+# the next request rebuilds it; untouched sections keep being served from cache.
+VERSION_KEY = "store:home:version:%s"
+STATS_REQUESTS_KEY = "store:home:stats:requests"
+STATS_MISSES_KEY = "store:home:stats:misses:%s"
+
+PRODUCT_SECTIONS = ("trending_products", "top_selling", "recently_added", "top_rated", "deals")
+CATEGORY_SECTIONS = ("categories", "trending_categories")
+HOME_SECTIONS = CATEGORY_SECTIONS + PRODUCT_SECTIONS
+
+
+def _published():
+    return Product.objects.filter(status=Product.ProductStatus.PUBLISHED).select_related(
+        "category", "card", "vendor__vendor_profile"
+    )
+
+
+def _categories():
+    return list(
+        Category.objects.filter(is_active=True, featured=True)
+        .annotate(product_count=Count("products"))
+        .order_by("id")
+    )
+
+
+def _trending_categories():
+    return list(Category.objects.filter(is_active=True, trending=True)[:8])
+
+
+def _top_selling():
+    return with_cards(
+        _published().filter(sales__units_sold__gt=0).order_by('-sales__units_sold', '-sales__last_sold_at')[:4]
+    )
+
+
+def _trending_products():
+    return with_cards(_published().filter(variations__label='Trending').distinct()[:12])
+
+
+def _recently_added():
+    return with_cards(_published().order_by('-created_at')[:12])
+
+
+def _top_rated():
+    return with_cards(_published().filter(card__rating_count__gt=0).order_by('-card__rating_avg')[:12])
+
+
+def _deals():
+    deals = list(
+        ProductVariation.objects.filter(
+            product__status=Product.ProductStatus.PUBLISHED,
+            is_active=True,
+            is_primary=True,
+        ).select_related('product__card', 'product__category', 'product__vendor__vendor_profile')[:4]
+    )
+    with_cards([v.product for v in deals])
+    return deals
+
+
+SECTION_BUILDERS = {
+    "categories": _categories,
+    "trending_categories": _trending_categories,
+    "top_selling": _top_selling,
+    "trending_products": _trending_products,
+    "recently_added": _recently_added,
+    "top_rated": _top_rated,
+    "deals": _deals,
+}
+
+
+class LazySection:
+    """
+    Handed to the template in place of the section's data. Templates call
+    callables when resolving a variable, so the queries only run when the
+    `{% cache %}` fragment around the section misses.
+    """
+
+    def __init__(self, build):
+        self._build = build
+        self._value = None
+        self.built = False
+
+    def __call__(self):
+        if not self.built:
+            self._value = self._build()
+            self.built = True
+        return self._value
+
+
+def _seed_version(key):
+    # Start from the clock so an evicted counter never reuses an old key.
+    cache.add(key, int(time.time() * 1000), None)
+
+
+def section_versions():
+    keys = {name: VERSION_KEY % name for name in HOME_SECTIONS}
+    found = cache.get_many(keys.values())
+    versions = {}
+    for name, key in keys.items():
+        if key not in found:
+            _seed_version(key)
+            found[key] = cache.get(key)
+        versions[name] = found[key]
+    return versions
+
+
+def home_context():
+    sections = {name: LazySection(build) for name, build in SECTION_BUILDERS.items()}
+    context = dict(sections)
+    context["home_versions"] = section_versions()
+    context["home_cache_timeout"] = getattr(settings, "STORE_HOME_CACHE_TIMEOUT", 300)
+    return context, sections
+
+
+def record_section_stats(sections):
+    _incr(STATS_REQUESTS_KEY)
+    for name, section in sections.items():
+        if section.built:
+            _incr(STATS_MISSES_KEY % name)
+
+
+def section_stats():
+    """{section: {"hits", "misses", "hit_ratio"}} since the last reset."""
+    keys = [STATS_REQUESTS_KEY] + [STATS_MISSES_KEY % name for name in HOME_SECTIONS]
+    found = cache.get_many(keys)
+    requests = found.get(STATS_REQUESTS_KEY, 0)
+    stats = {}
+    for name in HOME_SECTIONS:
+        misses = min(found.get(STATS_MISSES_KEY % name, 0), requests)
+        hits = requests - misses
+        stats[name] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / requests, 4) if requests else None,
+        }
+    return stats
+
+
+def reset_section_stats():
+    cache.delete_many([STATS_REQUESTS_KEY] + [STATS_MISSES_KEY % name for name in HOME_SECTIONS])
+
+
+def _incr(key):
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def invalidate_home_sections(sections=HOME_SECTIONS):
+    for name in sections:
+        key = VERSION_KEY % name
+        _seed_version(key)
+        _incr(key)
+
+
+def schedule_home_invalidation(sections=HOME_SECTIONS):
+    """
+    Bump the sections once the current transaction commits. Like card
+    refreshes, requests queued in one transaction are flushed together.
+    """
+    pending = getattr(connection, "_pending_home_invalidation", None)
+    if pending is None:
+        pending = set()
+        connection._pending_home_invalidation = pending
+    pending.update(sections)
+
+    def _flush():
+        names = [name for name in HOME_SECTIONS if name in pending]
+        pending.clear()
+        if names:
+            invalidate_home_sections(names)
+
+    transaction.on_commit(_flush)
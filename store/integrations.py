@@ -0,0 +1,148 @@
+import logging
+import random
+import threading
+import time
+from collections import defaultdict, deque
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+
+log = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+SAMPLES_PER_ENDPOINT = 500
+
+
+class IntegrationClient:
+    """
+    HTTP access to one third-party API (Shiprocket, Easebuzz).
+
+    - One pooled requests.Session per client and process, so keep-alive
+      connections are reused and TLS handshakes are paid once per connection
+      rather than once per call.
+    - Bounded retries with exponential backoff and jitter on connection
+      errors, timeouts and 429/5xx answers. Only calls marked idempotent are
+      retried after the request may have reached the server; others are
+      retried on connect timeouts only.
+    - Latency and outcome per endpoint name, kept in memory (metrics()) and
+      logged one key=value line per attempt.
+    """
+
+    def __init__(self, name, timeout=10):
+        self.name = name
+        self.timeout = timeout
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=SAMPLES_PER_ENDPOINT))
+        self._counts = defaultdict(lambda: defaultdict(int))
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    pool = getattr(settings, "STORE_HTTP_POOL_SIZE", 10)
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=pool, pool_maxsize=pool)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    session.headers["User-Agent"] = "FluxStore/1.0"
+                    self._session = session
+        return self._session
+
+    def _record(self, endpoint, elapsed_ms, outcome):
+        with self._metrics_lock:
+            self._samples[endpoint].append(elapsed_ms)
+            self._counts[endpoint][outcome] += 1
+        log.info("integration=%s endpoint=%s outcome=%s ms=%.1f", self.name, endpoint, outcome, elapsed_ms)
+
+    def request(self, method, url, *, endpoint, idempotent=None, retries=None, timeout=None, **kwargs):
+        if idempotent is None:
+            idempotent = method.upper() in ("GET", "HEAD", "OPTIONS")
+        if retries is None:
+            retries = getattr(settings, "STORE_HTTP_RETRIES", 2)
+        backoff = getattr(settings, "STORE_HTTP_BACKOFF", 0.2)
+
+        for attempt in range(retries + 1):
+            last = attempt == retries
+            started = time.monotonic()
+            try:
+                resp = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            except requests.RequestException as e:
+                self._record(endpoint, (time.monotonic() - started) * 1000, type(e).__name__)
+                retryable = isinstance(e, requests.ConnectTimeout) or (
+                    idempotent and isinstance(e, (requests.ConnectionError, requests.Timeout))
+                )
+                if last or not retryable:
+                    raise
+            else:
+                self._record(endpoint, (time.monotonic() - started) * 1000, resp.status_code)
+                if last or not (idempotent and resp.status_code in RETRY_STATUSES):
+                    return resp
+            time.sleep(backoff * (2 ** attempt) * (1 + random.random() / 2))
+
+    def get(self, url, *, endpoint, **kwargs):
+        return self.request("GET", url, endpoint=endpoint, **kwargs)
+
+    def post(self, url, *, endpoint, **kwargs):
+        return self.request("POST", url, endpoint=endpoint, **kwargs)
+
+    def metrics(self):
+        """{endpoint: {"count", "p50_ms", "p95_ms", "max_ms", "outcomes"}} over the recent calls of this process."""
+        with self._metrics_lock:
+            snapshot = {ep: sorted(samples) for ep, samples in self._samples.items()}
+            counts = {ep: dict(c) for ep, c in self._counts.items()}
+        out = {}
+        for endpoint, samples in snapshot.items():
+            if not samples:
+                continue
+            out[endpoint] = {
+                "count": sum(counts.get(endpoint, {}).values()),
+                "p50_ms": round(samples[len(samples) // 2], 1),
+                "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 1),
+                "max_ms": round(samples[-1], 1),
+                "outcomes": {str(k): v for k, v in counts.get(endpoint, {}).items()},
+            }
+        return out
+
+    def reset_metrics(self):
+        with self._metrics_lock:
+            self._samples.clear()
+            self._counts.clear()
+
+
+shiprocket_client = IntegrationClient("shiprocket", timeout=12)
+easebuzz_client = IntegrationClient("easebuzz", timeout=10)
+
+
+def single_flight(key, produce, *, lock, wait=5.0, ttl=30):
+    """
+    Run `produce()` (which must store its result under cache `key`) in one
+    thread of one process at a time: threads queue on `lock`, other processes
+    see the cache.add marker and poll `key` for up to `wait` seconds instead
+    of producing it too. Returns the cached value.
+    """
+    from django.core.cache import cache
+
+    value = cache.get(key)
+    if value is not None:
+        return value
+    with lock:
+        value = cache.get(key)
+        if value is not None:
+            return value
+        marker = f"{key}:producing"
+        if not cache.add(marker, 1, ttl):
+            deadline = time.monotonic() + wait
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                value = cache.get(key)
+                if value is not None:
+                    return value
+        try:
+            return produce()
+        finally:
+            cache.delete(marker)
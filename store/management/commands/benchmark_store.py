@@ -0,0 +1,387 @@
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+from decimal import Decimal
+from pathlib import Path
+
+import django
+import environ
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from addon.models import SiteConfiguration
+from order.models import Cart, CartItem, Order, OrderItem
+from store.cards import refresh_product_cards
+from store.models import Category, Product, ProductImage, ProductReview, ProductVariation
+from store.sales import rebuild_sales_stats
+from store.search import fts_sync, get_search_backend, request_full_reindex
+from userauths.models import Address, User, UserProfile, VendorProfile
+
+
+ADJECTIVES = [
+    "Smart", "Wireless", "Classic", "Ultra", "Compact", "Organic", "Premium", "Portable",
+    "Vintage", "Eco", "Pro", "Mini", "Deluxe", "Rugged", "Silent", "Turbo",
+]
+NOUNS = [
+    "Headphones", "Keyboard", "Blender", "Backpack", "Lamp", "Sneakers", "Kettle", "Speaker",
+    "Watch", "Camera", "Jacket", "Monitor", "Mouse", "Rice", "Coffee", "Chair", "Charger", "Router",
+]
+LABELS = [choice for choice, _ in ProductVariation.LABEL_CHOICES]
+
+# name, url name, reverse kwargs (filled in after seeding), query string, client
+VIEWS = [
+    ("index", "store:index", None, "", "anon"),
+    ("shop", "store:shop", None, "", "anon"),
+    ("product_list_api", "store:product_list_api", None, "page_size=24", "anon"),
+    ("product_list_api_search", "store:product_list_api", None, "q={term}&page_size=24", "anon"),
+    ("search", "store:search", None, "q={term}", "anon"),
+    ("product_detail", "store:product_detail", "product", "", "anon"),
+    ("cart_detail", "store:cart", None, "", "buyer"),
+    ("begin_checkout", "store:checkout_start", None, "", "buyer"),
+    ("vendor_dashboard", "vendor:dashboard", None, "", "vendor"),
+    ("vendor_orders", "vendor:orders", None, "", "vendor"),
+    ("vendor_product_list", "vendor:products", None, "", "vendor"),
+    ("customer_dashboard", "customer:dashboard", None, "", "buyer"),
+]
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[k]
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        )
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database at the given scale, hit the storefront, vendor and "
+        "customer hot paths through the test client, and print p50/p95 latency and "
+        "SQL query counts per view as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=2000)
+        parser.add_argument("--order-items", type=int, default=20000)
+        parser.add_argument("--buyers", type=int, default=500)
+        parser.add_argument("--vendors", type=int, default=25)
+        parser.add_argument("--categories", type=int, default=20)
+        parser.add_argument("--reviews-max", type=int, default=5, help="Max reviews per product (random 0..N).")
+        parser.add_argument("--iterations", type=int, default=20, help="Timed requests per view.")
+        parser.add_argument("--warmup", type=int, default=3, help="Untimed requests per view before timing.")
+        parser.add_argument("--views", default="", help="Comma-separated subset of view names to run.")
+        parser.add_argument("--cold-cache", action="store_true", help="Clear the cache before every request.")
+        parser.add_argument("--cache-url", default="locmemcache://store-benchmark",
+                            help="Cache to run against, in CACHE_URL form. It is cleared, so it must not be "
+                                 "the site's cache (default: a private in-process cache).")
+        parser.add_argument("--keepdb", action="store_true",
+                            help="Keep the benchmark database (and reuse it if it already holds the catalog).")
+        parser.add_argument("--output", default="", help="Write the JSON report to this file instead of stdout.")
+        parser.add_argument("--compare", default="", help="Print p50/p95/query deltas against an earlier report.")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **opts):
+        wanted = {v.strip() for v in opts["views"].split(",") if v.strip()}
+        unknown = wanted - {v[0] for v in VIEWS}
+        if unknown:
+            raise CommandError(f"Unknown views: {', '.join(sorted(unknown))}")
+
+        # The run clears its cache (and --cold-cache does so per request); the
+        # site's cache holds guest carts, coupons and summaries, so never use it.
+        bench_cache = environ.Env.cache_url_config(opts["cache_url"])
+        configured = settings.CACHES["default"]
+        if (bench_cache["BACKEND"], bench_cache.get("LOCATION")) == (configured["BACKEND"], configured.get("LOCATION")):
+            raise CommandError("--cache-url is the configured default cache; the benchmark would clear it.")
+
+        random.seed(opts["seed"])
+        with override_settings(CACHES={"default": bench_cache}):
+            report = self._benchmark(opts, wanted)
+
+        payload = json.dumps(report, indent=2)
+        if opts["output"]:
+            Path(opts["output"]).write_text(payload + "\n")
+            self.stderr.write(self.style.SUCCESS(f"✅ Report written to {opts['output']}"))
+        else:
+            self.stdout.write(payload)
+
+        if opts["compare"]:
+            self._compare(json.loads(Path(opts["compare"]).read_text()), report)
+
+    def _benchmark(self, opts, wanted):
+        setup_test_environment()
+        settings_dict = connection.settings_dict
+        old_name = settings_dict["NAME"]
+        if connection.vendor == "sqlite":
+            # A file rather than the default in-memory test DB: closer to real I/O and reusable with --keepdb.
+            settings_dict.setdefault("TEST", {})["NAME"] = str(Path(settings.BASE_DIR) / "benchmark.sqlite3")
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=opts["keepdb"])
+        try:
+            if Product.objects.count() < opts["products"]:
+                started = time.perf_counter()
+                self._seed(opts)
+                self.stderr.write(f"Seeded in {time.perf_counter() - started:.1f}s")
+            # Build the index now rather than timing the ORM fallback while it builds in the background.
+            get_search_backend().rebuild()
+            cache.clear()
+            return self._run(opts, wanted)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=opts["keepdb"])
+            teardown_test_environment()
+
+    # ---------- seeding ----------
+    def _seed(self, opts):
+        self.stderr.write("Seeding benchmark catalog…")
+        password = make_password("benchmark")
+        batch = 5000
+
+        # Templates read the branding images unconditionally; a name is enough for .url.
+        SiteConfiguration.objects.update_or_create(pk=1, defaults={
+            "site_logo": "branding/bench.png", "login_logo": "branding/bench.png", "favicon": "branding/bench.png",
+        })
+
+        categories = Category.objects.bulk_create([
+            Category(name=f"Bench Category {i}", slug=f"bench-category-{i}", featured=i < 8, trending=i < 8)
+            for i in range(max(1, opts["categories"]))
+        ])
+
+        vendors = User.objects.bulk_create([
+            User(email=f"vendor{i}@bench.test", username=f"bench-vendor-{i}", role=User.Role.VENDOR, password=password)
+            for i in range(max(1, opts["vendors"]))
+        ])
+        buyers = User.objects.bulk_create([
+            User(email=f"buyer{i}@bench.test", username=f"bench-buyer-{i}", password=password)
+            for i in range(max(1, opts["buyers"]))
+        ], batch_size=batch)
+        UserProfile.objects.bulk_create([UserProfile(user=u) for u in vendors + buyers], batch_size=batch)
+        VendorProfile.objects.bulk_create([
+            VendorProfile(
+                user=v, business_name=f"Bench Vendor {i}", slug=f"bench-vendor-{i}",
+                contact_email=f"shop{i}@bench.test", business_phone="000", business_address="Bench Street",
+            )
+            for i, v in enumerate(vendors)
+        ])
+
+        now = time.time()
+        products = []
+        for i in range(opts["products"]):
+            name = f"{random.choice(ADJECTIVES)} {random.choice(NOUNS)} {i}"
+            products.append(Product(
+                vendor=random.choice(vendors), category=random.choice(categories), name=name,
+                slug=f"bench-product-{i}", description=f"<p>{name} for benchmarking.</p>",
+                status=Product.ProductStatus.PUBLISHED if random.random() < 0.95 else Product.ProductStatus.DRAFT,
+            ))
+        products = Product.objects.bulk_create(products, batch_size=batch)
+
+        variations, images = [], []
+        for p in products:
+            for n in range(random.randint(1, 3)):
+                price = Decimal(random.randint(500, 50000)) / 100
+                variations.append(ProductVariation(
+                    product=p, sku=f"BENCH-{p.pk}-{n}", is_primary=(n == 0),
+                    sale_price=price, regular_price=price + Decimal("5.00"), stock_quantity=random.randint(0, 50),
+                    weight=1, length=10, height=10, width=10, label=random.choice(LABELS),
+                    deal_active=random.random() < 0.05,
+                ))
+            images.append(ProductImage(product=p, image="product_images/bench.png", is_primary=True))
+        variations = ProductVariation.objects.bulk_create(variations, batch_size=batch)
+        ProductImage.objects.bulk_create(images, batch_size=batch)
+
+        self._seed_reviews(products, vendors, buyers, opts["reviews_max"], batch)
+        self._seed_orders(variations, buyers, opts["order_items"], batch)
+        self._seed_session_users(vendors[0], buyers[0], variations)
+
+        rebuild_sales_stats()
+        ids = [p.pk for p in products]
+        for start in range(0, len(ids), 1000):
+            refresh_product_cards(ids[start:start + 1000])
+            fts_sync(ids[start:start + 1000])
+        request_full_reindex()
+        self.stderr.write(f"  catalog ready ({time.time() - now:.1f}s)")
+
+    def _seed_reviews(self, products, vendors, buyers, reviews_max, batch):
+        reviews, vendor_totals = [], {}
+        for p in products:
+            raters = random.sample(buyers, min(len(buyers), random.randint(0, max(0, reviews_max))))
+            counts = {}
+            for user in raters:
+                rating = random.choice((3, 4, 4, 5, 5, 2, 1))
+                counts[rating] = counts.get(rating, 0) + 1
+                reviews.append(ProductReview(product=p, user=user, rating=rating, comment="Bench review"))
+            if counts:
+                p.rating_count = sum(counts.values())
+                p.rating_sum = sum(r * n for r, n in counts.items())
+                p.rating_avg = (Decimal(p.rating_sum) / p.rating_count).quantize(Decimal("0.01"))
+                for star, n in counts.items():
+                    setattr(p, f"rating_{star}_count", n)
+                s, c = vendor_totals.get(p.vendor_id, (0, 0))
+                vendor_totals[p.vendor_id] = (s + p.rating_sum, c + p.rating_count)
+        ProductReview.objects.bulk_create(reviews, batch_size=batch)
+        Product.objects.bulk_update(
+            [p for p in products if p.rating_count],
+            ["rating_sum", "rating_count", "rating_avg"] + [f"rating_{n}_count" for n in range(1, 6)],
+            batch_size=batch,
+        )
+        for vendor_id, (s, c) in vendor_totals.items():
+            VendorProfile.objects.filter(user_id=vendor_id).update(
+                rating_sum=s, rating_count=c, rating_avg=(Decimal(s) / c).quantize(Decimal("0.01")),
+            )
+
+    def _seed_orders(self, variations, buyers, item_target, batch):
+        statuses = [s for s, _ in Order.OrderStatus.choices]
+        written, n = 0, 0
+        while written < item_target:
+            orders, plans = [], []
+            while len(orders) < batch and written < item_target:
+                lines = random.sample(variations, min(len(variations), random.randint(1, 4)))
+                lines = lines[:item_target - written]
+                orders.append(Order(
+                    buyer=random.choice(buyers), order_id=f"BENCH{n:09d}",
+                    payment_status="PAID" if random.random() < 0.8 else random.choice(["UNPAID", "FAILED"]),
+                    status=random.choice(statuses), sales_recorded=False,
+                ))
+                plans.append(lines)
+                written += len(lines)
+                n += 1
+            orders = Order.objects.bulk_create(orders)
+            items = []
+            for order, lines in zip(orders, plans):
+                for pv in lines:
+                    qty = random.randint(1, 3)
+                    items.append(OrderItem(
+                        order=order, product_variation=pv, vendor_id=pv.product.vendor_id,
+                        quantity=qty, price=pv.sale_price, line_subtotal_net=pv.sale_price * qty,
+                    ))
+            OrderItem.objects.bulk_create(items, batch_size=batch)
+
+    def _seed_session_users(self, vendor, buyer, variations):
+        Address.objects.create(
+            profile=buyer.profile, address_type=Address.AddressType.SHIPPING, full_name="Bench Buyer",
+            phone="000", street_address="1 Bench Road", city="Lagos", state="Lagos",
+            postal_code="100001", country="NG", is_default=True,
+        )
+        cart = Cart.objects.create(user=buyer)
+        # begin_checkout holds stock on every request; keep the benchmark cart buyable.
+        ProductVariation.objects.filter(pk__in=[pv.pk for pv in variations[:3]]).update(stock_quantity=10 ** 6)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product_variation=pv, quantity=1, price=pv.sale_price)
+            for pv in variations[:3]
+        ])
+
+    # ---------- measuring ----------
+    def _clients(self):
+        vendor = User.objects.filter(email="vendor0@bench.test").first()
+        buyer = User.objects.filter(email="buyer0@bench.test").first()
+        if vendor is None or buyer is None:
+            raise CommandError("Benchmark users are missing; rerun without --keepdb to reseed.")
+        clients = {"anon": Client(), "buyer": Client(), "vendor": Client()}
+        clients["buyer"].force_login(buyer)
+        clients["vendor"].force_login(vendor)
+        return clients, vendor
+
+    def _run(self, opts, wanted):
+        clients, vendor = self._clients()
+        product = (
+            Product.objects.filter(status=Product.ProductStatus.PUBLISHED, vendor=vendor)
+            .order_by("-rating_count", "pk").first()
+        )
+        term = product.name.split()[1].lower() if product else "bench"
+
+        # Captured before measuring: begin_checkout creates an order on every request.
+        scale = {
+            "products": Product.objects.count(),
+            "variations": ProductVariation.objects.count(),
+            "order_items": OrderItem.objects.count(),
+            "reviews": ProductReview.objects.count(),
+            "users": User.objects.count(),
+        }
+
+        results = {}
+        for name, url_name, kwarg, query, who in VIEWS:
+            if wanted and name not in wanted:
+                continue
+            url = reverse(url_name, kwargs={"slug": product.slug} if kwarg == "product" else None)
+            if query:
+                url = f"{url}?{query.format(term=term)}"
+            results[name] = self._measure(clients[who], url, opts)
+            self.stderr.write(
+                f"  {name:<24} p50={results[name]['p50_ms']:>8.2f}ms "
+                f"p95={results[name]['p95_ms']:>8.2f}ms queries={results[name]['queries']}"
+            )
+
+        return {
+            "meta": {
+                "git_commit": _git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "db_vendor": connection.vendor,
+                "iterations": opts["iterations"],
+                "warmup": opts["warmup"],
+                "cold_cache": opts["cold_cache"],
+                "cache_backend": settings.CACHES["default"]["BACKEND"],
+                "scale": scale,
+            },
+            "views": results,
+        }
+
+    def _request(self, client, url, cold):
+        if cold:
+            cache.clear()
+        return client.get(url)
+
+    def _measure(self, client, url, opts):
+        cold = opts["cold_cache"]
+        for _ in range(max(0, opts["warmup"])):
+            self._request(client, url, cold)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self._request(client, url, cold)
+        queries = len(ctx.captured_queries)
+
+        timings = []
+        for _ in range(max(1, opts["iterations"])):
+            started = time.perf_counter()
+            self._request(client, url, cold)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+
+        return {
+            "url": url,
+            "status": response.status_code,
+            "queries": queries,
+            "p50_ms": round(_percentile(timings, 50), 3),
+            "p95_ms": round(_percentile(timings, 95), 3),
+            "mean_ms": round(statistics.fmean(timings), 3),
+            "max_ms": round(timings[-1], 3),
+        }
+
+    def _compare(self, before, after):
+        self.stderr.write(f"\nvs {before.get('meta', {}).get('git_commit')}:")
+        for name, now in after["views"].items():
+            then = before.get("views", {}).get(name)
+            if not then:
+                continue
+            self.stderr.write(
+                f"  {name:<24} p50 {now['p50_ms'] - then['p50_ms']:+8.2f}ms  "
+                f"p95 {now['p95_ms'] - then['p95_ms']:+8.2f}ms  "
+                f"queries {now['queries'] - then['queries']:+d}"
+            )
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from store.home import HOME_SECTIONS, invalidate_home_sections, reset_section_stats, section_stats
+
+
+class Command(BaseCommand):
+    help = "Show the home page section cache hit/miss counts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Zero the counters after printing.")
+        parser.add_argument("--invalidate", nargs="*", metavar="SECTION",
+                            help="Rebuild the given sections (all when none given) on the next request.")
+
+    def handle(self, *args, **opts):
+        for name, row in section_stats().items():
+            ratio = "-" if row["hit_ratio"] is None else f"{row['hit_ratio'] * 100:.1f}%"
+            self.stdout.write(f"{name:<20} hits={row['hits']:<8} misses={row['misses']:<8} hit_ratio={ratio}")
+
+        if opts["reset"]:
+            reset_section_stats()
+            self.stdout.write(self.style.SUCCESS("✅ Counters reset"))
+
+        if opts["invalidate"] is not None:
+            sections = opts["invalidate"] or HOME_SECTIONS
+            unknown = set(sections) - set(HOME_SECTIONS)
+            if unknown:
+                self.stderr.write(f"Unknown sections: {', '.join(sorted(unknown))}")
+                return
+            invalidate_home_sections(sections)
+            self.stdout.write(self.style.SUCCESS(f"✅ Invalidated: {', '.join(sections)}"))
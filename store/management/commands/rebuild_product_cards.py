@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from store.cards import refresh_product_cards
+from store.models import Product, ProductCardSnapshot
+
+
+class Command(BaseCommand):
+    help = "Rebuild the ProductCardSnapshot rows used to render product cards."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500,
+                            help="Products refreshed per batch (default 500).")
+
+    def handle(self, *args, **opts):
+        batch_size = max(1, int(opts["batch_size"]))
+
+        orphaned, _ = ProductCardSnapshot.objects.exclude(
+            product__status=Product.ProductStatus.PUBLISHED
+        ).delete()
+
+        ids = list(
+            Product.objects.filter(status=Product.ProductStatus.PUBLISHED)
+            .order_by("pk").values_list("pk", flat=True)
+        )
+        written = 0
+        for start in range(0, len(ids), batch_size):
+            written += len(refresh_product_cards(ids[start:start + batch_size]))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Product cards rebuilt: {written} (removed {orphaned} stale)"
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from store.sales import rebuild_sales_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute ProductSalesStats / VariationSalesStats from all PAID orders that are not cancelled or "
+        "refunded. Safe to schedule (e.g. nightly) to correct drift from bulk status updates."
+    )
+
+    def handle(self, *args, **opts):
+        products, variations = rebuild_sales_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Sales stats rebuilt: {products} products, {variations} variations"
+        ))
@@ -0,0 +1,56 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.search import InvertedIndexBackend, OrmSearchBackend, request_full_reindex
+
+
+DEFAULT_QUERIES = ["phone", "shirt", "smart tv", "air", "pro 11", "lotion"]
+
+
+class Command(BaseCommand):
+    help = "Rebuild the in-process product search index, optionally benchmarking it against the ORM search."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--benchmark", action="store_true",
+                            help="Time the index against the ORM icontains path.")
+        parser.add_argument("--query", action="append", dest="queries",
+                            help="Query to benchmark (repeatable). Defaults to a small built-in set.")
+        parser.add_argument("--repeat", type=int, default=20,
+                            help="Runs per query and backend when benchmarking (default 20).")
+
+    def handle(self, *args, **opts):
+        # Mark first, so this index starts at the marker and doesn't rebuild again when benchmarked.
+        request_full_reindex()
+        index = InvertedIndexBackend()
+        started = time.perf_counter()
+        index.rebuild()
+        elapsed = (time.perf_counter() - started) * 1000
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Search index rebuilt: {len(index._docs)} products, {len(index._postings)} tokens in {elapsed:.1f} ms"
+        ))
+        self.stdout.write("Running web processes will rebuild in the background on their next search.")
+
+        if opts["benchmark"]:
+            self._benchmark(index, opts["queries"] or DEFAULT_QUERIES, max(1, int(opts["repeat"])))
+
+    def _time(self, backend, q, repeat):
+        timings, result = [], []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = backend.search(q)
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), result
+
+    def _benchmark(self, index, queries, repeat):
+        orm = OrmSearchBackend()
+        self.stdout.write(f"{'query':<20}{'orm ms':>10}{'index ms':>10}{'orm hits':>10}{'idx hits':>10}{'common':>8}")
+        for q in queries:
+            orm_ms, orm_ids = self._time(orm, q, repeat)
+            idx_ms, idx_ids = self._time(index, q, repeat)
+            common = len(set(orm_ids) & set(idx_ids))
+            self.stdout.write(
+                f"{q[:19]:<20}{orm_ms:>10.2f}{idx_ms:>10.3f}{len(orm_ids):>10}{len(idx_ids):>10}{common:>8}"
+            )
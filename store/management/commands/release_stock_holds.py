@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from store.stock import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = "Return the units of expired stock holds (unpaid checkouts) to ProductVariation.stock_quantity."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=None, help="Release at most this many holds.")
+
+    def handle(self, *args, **opts):
+        released = release_expired_holds(limit=opts["limit"])
+        self.stdout.write(self.style.SUCCESS(f"✅ Released {released} expired stock hold(s)"))
@@ -28,6 +28,7 @@ from order.models import (
     Order,
     OrderItem,
 )
+from store.sales import rebuild_sales_stats
 from customer.models import (
     Wishlist,
     WishlistItem,
@@ -197,6 +198,7 @@ class Command(BaseCommand):
         
         orders = self._seed_orders(orders_target, buyers, products)
         self.stdout.write(self.style.SUCCESS(f"✅ Orders created: {len(orders)}"))
+        rebuild_sales_stats()
 
         
         if make_wishlist:
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0023_alter_productvariation_shipping_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCardSnapshot',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='store.product')),
+                ('sale_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('regular_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('show_regular_price', models.BooleanField(default=False)),
+                ('show_discount_type', models.CharField(default='none', max_length=100)),
+                ('discount_amount', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('label', models.CharField(blank=True, max_length=50)),
+                ('show_label', models.BooleanField(default=False)),
+                ('deal_active', models.BooleanField(default=False)),
+                ('in_stock', models.BooleanField(default=False)),
+                ('image_url', models.CharField(blank=True, max_length=500)),
+                ('rating_avg', models.DecimalField(decimal_places=2, default=0, max_digits=3)),
+                ('rating_count', models.PositiveIntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+                ('variation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='store.productvariation')),
+            ],
+        ),
+    ]
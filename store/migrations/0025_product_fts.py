@@ -0,0 +1,51 @@
+import html
+
+from django.db import OperationalError, migrations
+from django.utils.html import strip_tags
+
+
+FTS_TABLE = "store_product_fts"
+
+
+def create_fts(apps, schema_editor):
+    conn = schema_editor.connection
+    if conn.vendor != "sqlite":
+        return
+    try:
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "name, description, category, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+    except OperationalError:
+        # SQLite built without FTS5: product_list_api keeps its icontains path.
+        return
+
+    Product = apps.get_model("store", "Product")
+    rows = Product.objects.using(conn.alias).filter(status="PUBLISHED").values_list(
+        "id", "name", "description", "category__name"
+    )
+    with conn.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, description, category) VALUES (%s, %s, %s, %s)",
+            [
+                (pid, name or "", html.unescape(strip_tags(description or "")), category or "")
+                for pid, name, description, category in rows
+            ],
+        )
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0024_productcardsnapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
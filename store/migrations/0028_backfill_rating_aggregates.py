@@ -0,0 +1,52 @@
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Count, Sum
+
+
+def _avg(total, count):
+    return (Decimal(total) / count).quantize(Decimal("0.01")) if count else Decimal("0")
+
+
+def backfill(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    Product = apps.get_model("store", "Product")
+    ProductReview = apps.get_model("store", "ProductReview")
+    VendorProfile = apps.get_model("userauths", "VendorProfile")
+
+    hist = {}
+    for row in ProductReview.objects.using(alias).values("product_id", "rating").annotate(n=Count("id")).order_by():
+        if 1 <= row["rating"] <= 5:
+            hist.setdefault(row["product_id"], {})[row["rating"]] = row["n"]
+
+    fields = ["rating_sum", "rating_count", "rating_avg"] + [f"rating_{n}_count" for n in range(1, 6)]
+    products = list(Product.objects.using(alias).filter(pk__in=hist))
+    for p in products:
+        counts = hist[p.pk]
+        p.rating_count = sum(counts.values())
+        p.rating_sum = sum(star * n for star, n in counts.items())
+        p.rating_avg = _avg(p.rating_sum, p.rating_count)
+        for star in range(1, 6):
+            setattr(p, f"rating_{star}_count", counts.get(star, 0))
+    Product.objects.using(alias).bulk_update(products, fields, batch_size=500)
+
+    rollup = (
+        Product.objects.using(alias).filter(rating_count__gt=0)
+        .values("vendor_id").annotate(s=Sum("rating_sum"), c=Sum("rating_count")).order_by()
+    )
+    for row in rollup:
+        VendorProfile.objects.using(alias).filter(user_id=row["vendor_id"]).update(
+            rating_sum=row["s"], rating_count=row["c"], rating_avg=_avg(row["s"], row["c"]),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0027_product_rating_aggregates"),
+        ("userauths", "0008_vendorprofile_rating_rollup"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+from django.db.models import F
+from django.db.models.functions import Round
+
+
+def round_averages(apps, schema_editor):
+    # Averages moved by reviews before they were rounded in SQL may hold the
+    # full float on SQLite; bring them to the column's 2 places.
+    alias = schema_editor.connection.alias
+    for app_label, model_name in (("store", "Product"), ("userauths", "VendorProfile")):
+        model = apps.get_model(app_label, model_name)
+        model.objects.using(alias).update(rating_avg=Round(F("rating_avg"), 2))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0030_searchindexchange'),
+        ('userauths', '0008_vendorprofile_rating_rollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(round_averages, migrations.RunPython.noop),
+    ]
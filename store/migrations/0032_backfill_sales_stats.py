@@ -0,0 +1,62 @@
+# Generated by Django 5.2.5 on 2026-10-17 06:10
+
+from django.db import migrations
+from django.db.models import DecimalField, ExpressionWrapper, F, Max, Q, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill(apps, schema_editor):
+    # Orders paid before the counters existed; the same totals rebuild_sales_stats writes.
+    alias = schema_editor.connection.alias
+    Order = apps.get_model("order", "Order")
+    OrderItem = apps.get_model("order", "OrderItem")
+    ProductSalesStats = apps.get_model("store", "ProductSalesStats")
+    VariationSalesStats = apps.get_model("store", "VariationSalesStats")
+
+    counted = Order.objects.using(alias).filter(
+        Q(payment_status="PAID") & ~Q(status__in=["CANCELED", "REFUNDED"])
+    )
+    line_total = ExpressionWrapper(F("quantity") * F("price"), output_field=DecimalField(max_digits=14, decimal_places=2))
+    lines = (
+        OrderItem.objects.using(alias)
+        .filter(order__in=counted, product_variation__isnull=False)
+        .values("product_variation_id", "product_variation__product_id")
+        .annotate(
+            units=Sum("quantity"), revenue=Sum(line_total),
+            last_sold_at=Max(Coalesce("order__paid_at", "order__created_at")),
+        )
+        .order_by()
+    )
+
+    variations, products = [], {}
+    for line in lines:
+        pid = line["product_variation__product_id"]
+        variations.append(VariationSalesStats(
+            variation_id=line["product_variation_id"], product_id=pid,
+            units_sold=line["units"] or 0, revenue=line["revenue"] or 0, last_sold_at=line["last_sold_at"],
+        ))
+        p = products.get(pid)
+        if p is None:
+            p = products[pid] = ProductSalesStats(product_id=pid, units_sold=0, revenue=0)
+        p.units_sold += line["units"] or 0
+        p.revenue += line["revenue"] or 0
+        if p.last_sold_at is None or (line["last_sold_at"] and line["last_sold_at"] > p.last_sold_at):
+            p.last_sold_at = line["last_sold_at"]
+
+    VariationSalesStats.objects.using(alias).all().delete()
+    ProductSalesStats.objects.using(alias).all().delete()
+    VariationSalesStats.objects.using(alias).bulk_create(variations, batch_size=500)
+    ProductSalesStats.objects.using(alias).bulk_create(products.values(), batch_size=500)
+    counted.filter(sales_recorded=False).update(sales_recorded=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0020_coupon_code_normalized_unique'),
+        ('store', '0031_round_rating_avg'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
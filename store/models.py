@@ -1,8 +1,7 @@
-from django.db import models
+from django.db import DatabaseError, models, transaction
 from django.conf import settings
 from django.utils.text import slugify
 from django_ckeditor_5.fields import CKEditor5Field
-from django.db.models import Avg, Count
 from django.utils import timezone
 
 from shortuuid.django_fields import ShortUUIDField
@@ -52,6 +51,16 @@ class Product(models.Model):
     show_rating = models.BooleanField(default=True, help_text="Turn on if you want to show rating on product list page")
     show_vendor_name = models.BooleanField(default=True, help_text="Turn on if you want to show vendor store name on product list page")
 
+    # Review aggregates, kept exact by store.ratings on every review write.
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0, db_index=True)
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=0, db_index=True)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     uuid = ShortUUIDField(length=12, max_length=50, alphabet="1234567890")
@@ -59,10 +68,34 @@ class Product(models.Model):
     class Meta:
         ordering = ['-created_at']
 
+    RATING_FIELDS = (
+        "rating_sum", "rating_count", "rating_avg",
+        "rating_1_count", "rating_2_count", "rating_3_count", "rating_4_count", "rating_5_count",
+    )
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(f"{self.name}-{self.uuid}")
-        super().save(*args, **kwargs)
+        if args or self._state.adding or kwargs.get("update_fields") is not None or kwargs.get("force_insert"):
+            return super().save(*args, **kwargs)
+        # store.ratings moves the aggregates with F() updates; a full save
+        # would write back whatever this instance read, losing reviews since.
+        # Deferred fields stay unloaded, as a plain save would leave them.
+        deferred = self.get_deferred_fields()
+        fields = [
+            f.name for f in self._meta.concrete_fields
+            if not f.primary_key and f.name not in self.RATING_FIELDS and f.attname not in deferred
+        ]
+        using = kwargs.get("using") or self._state.db
+        try:
+            # In a savepoint, so a failed update doesn't doom the caller's transaction.
+            with transaction.atomic(using=using):
+                super().save(*args, **kwargs, update_fields=fields)
+        except DatabaseError:
+            # The row is gone: insert it again, as a plain save would.
+            if type(self)._base_manager.using(using).filter(pk=self.pk).exists():
+                raise
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -78,11 +111,15 @@ class Product(models.Model):
         return self.variations.filter(product=self, is_active=True, is_primary=True).first()
     
     def total_reviews(self):
-        return self.reviews.count()
+        return self.rating_count
 
     def average_rating(self):
-        avg = self.reviews.aggregate(avg=Avg('rating'))['avg'] or 0
-        return round(avg, 1)  
+        if not self.rating_count:
+            return 0
+        return round(self.rating_sum / self.rating_count, 1)
+
+    def rating_histogram(self):
+        return {n: getattr(self, f"rating_{n}_count") for n in range(5, 0, -1)}
 
     def average_rating_int(self):
         return int(round(self.average_rating()))
@@ -224,6 +261,44 @@ class ProductReview(models.Model):
 
     def __str__(self):
         return f"Review for {self.product.name} by {self.user.email}"
+
+
+class ProductCardSnapshot(models.Model):
+    """
+    Denormalized copy of everything a product card needs, one row per
+    published product. Kept fresh by store.signals; rebuild with
+    `manage.py rebuild_product_cards`.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='card')
+    variation = models.ForeignKey(ProductVariation, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    sale_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    regular_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    show_regular_price = models.BooleanField(default=False)
+    show_discount_type = models.CharField(max_length=100, default="none")
+    discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    label = models.CharField(max_length=50, blank=True)
+    show_label = models.BooleanField(default=False)
+    deal_active = models.BooleanField(default=False)
+    in_stock = models.BooleanField(default=False)
+    image_url = models.CharField(max_length=500, blank=True)
+
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Card for product #{self.product_id}"
+
+    @property
+    def label_color(self):
+        return LABEL_COLORS.get(self.label, "bg-gray-300 text-black")
+
+    @property
+    def rating_int(self):
+        return int(round(round(self.rating_avg, 1)))
+
 LABEL_COLORS = {
         'Hot': 'bg-red-500 text-white',
         'New': 'bg-green-500 text-white',
@@ -240,3 +315,77 @@ LABEL_COLORS = {
         'Gift': 'bg-fuchsia-500 text-white',
     }
 
+
+
+class ProductSalesStats(models.Model):
+    """
+    Running totals of paid sales per product, bumped when an order is marked
+    PAID and taken back when it is cancelled or refunded (store.sales).
+    Rebuild with `manage.py rebuild_sales_stats`.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='sales')
+    units_sold = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    last_sold_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'Product sales stats'
+
+    def __str__(self):
+        return f"Sales for product #{self.product_id}"
+
+
+class VariationSalesStats(models.Model):
+    variation = models.OneToOneField(ProductVariation, on_delete=models.CASCADE, primary_key=True, related_name='sales')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='variation_sales')
+    units_sold = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    last_sold_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'Variation sales stats'
+
+    def __str__(self):
+        return f"Sales for variation #{self.variation_id}"
+
+
+class StockReservation(models.Model):
+    """
+    Units taken off ProductVariation.stock_quantity for an unpaid order
+    (store.stock). HELD until the order is paid (COMMITTED) or the hold
+    expires / payment fails (RELEASED, units handed back).
+    """
+    class Status(models.TextChoices):
+        HELD = "HELD", "Held"
+        COMMITTED = "COMMITTED", "Committed"
+        RELEASED = "RELEASED", "Released"
+
+    variation = models.ForeignKey(ProductVariation, on_delete=models.CASCADE, related_name='reservations')
+    order = models.ForeignKey("order.Order", on_delete=models.CASCADE, related_name='stock_reservations')
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.HELD)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "expires_at"])]
+
+    def __str__(self):
+        return f"{self.quantity} × {self.variation_id} for order #{self.order_id} ({self.status})"
+
+
+class SearchIndexChange(models.Model):
+    """
+    Change log for the in-process search index (store.search): one row per
+    committed catalog change, listing the products to re-index, or `full`
+    for a rebuild. Every process replays the rows past the last id it applied.
+    """
+    product_ids = models.JSONField(default=list, blank=True)
+    full = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Search change #{self.pk}"
@@ -0,0 +1,55 @@
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, FloatField, Value, When
+from django.db.models.functions import Cast, Round
+
+from userauths.models import VendorProfile
+
+from .models import Product
+
+
+STAR_FIELDS = {n: f"rating_{n}_count" for n in range(1, 6)}
+
+
+def _aggregate_updates(sum_delta, count_delta):
+    # Every SET expression reads the row's pre-update values (SQLite and
+    # Postgres both follow the standard here), so the average is computed
+    # from the new sum and count in the same statement. It is rounded to the
+    # column's 2 places in SQL: SQLite would otherwise store the full float,
+    # and filters and keyset cursors would compare against a value the ORM
+    # never shows.
+    new_sum = F("rating_sum") + sum_delta
+    new_count = F("rating_count") + count_delta
+    return {
+        "rating_sum": new_sum,
+        "rating_count": new_count,
+        "rating_avg": Case(
+            When(rating_count__lte=-count_delta, then=Value(Decimal("0"))),
+            default=Round(Cast(new_sum, FloatField()) / new_count, 2),
+            output_field=DecimalField(max_digits=3, decimal_places=2),
+        ),
+    }
+
+
+def apply_rating_change(product_id, removed=None, added=None):
+    """
+    Move one review's rating on a product's aggregates and its vendor's
+    rollup: `removed` is the rating it had (None for a new review), `added`
+    the rating it has now (None once deleted).
+    """
+    if not product_id or removed == added:
+        return
+    sum_delta = (added or 0) - (removed or 0)
+    count_delta = (added is not None) - (removed is not None)
+
+    updates = _aggregate_updates(sum_delta, count_delta)
+    for star, delta in ((removed, -1), (added, 1)):
+        field = STAR_FIELDS.get(star)
+        if field:
+            updates[field] = F(field) + delta
+    Product.objects.filter(pk=product_id).update(**updates)
+
+    if sum_delta or count_delta:
+        VendorProfile.objects.filter(user__products=product_id).update(
+            **_aggregate_updates(sum_delta, count_delta)
+        )
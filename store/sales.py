@@ -0,0 +1,154 @@
+from django.db import transaction
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, IntegerField, Max, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from order.models import Order, OrderItem
+
+from .home import schedule_home_invalidation
+from .models import ProductSalesStats, VariationSalesStats
+
+
+PAID = "PAID"
+REVERSED_STATUSES = (Order.OrderStatus.CANCELED, Order.OrderStatus.REFUNDED)
+
+# The orders the counters cover: paid, and not cancelled or refunded since.
+COUNTED = Q(payment_status=PAID) & ~Q(status__in=REVERSED_STATUSES)
+
+LINE_TOTAL = ExpressionWrapper(
+    F("quantity") * F("price"),
+    output_field=DecimalField(max_digits=14, decimal_places=2),
+)
+
+
+def _lines(items):
+    """Per-variation units and revenue for the given OrderItem queryset."""
+    return (
+        items.filter(product_variation__isnull=False)
+        .values("product_variation_id", "product_variation__product_id")
+        .annotate(units=Sum("quantity"), revenue=Sum(LINE_TOTAL))
+        .order_by()
+    )
+
+
+def _bump(model, key, totals, now, extra=None, sold=True):
+    """
+    Add {pk: (units, revenue)} to the counters: one INSERT for missing rows,
+    one CASE-keyed UPDATE for all. Negative totals take a sale back; pass
+    sold=False so that doesn't move last_sold_at.
+    """
+    if not totals:
+        return
+    model.objects.bulk_create(
+        [model(**{key: pk}, **(extra or {}).get(pk, {})) for pk in totals],
+        ignore_conflicts=True,
+    )
+    units = Case(
+        *[When(pk=pk, then=Value(u)) for pk, (u, _) in totals.items()],
+        default=Value(0), output_field=IntegerField(),
+    )
+    revenue = Case(
+        *[When(pk=pk, then=Value(r)) for pk, (_, r) in totals.items()],
+        default=Value(0), output_field=LINE_TOTAL.output_field,
+    )
+    fields = {"units_sold": F("units_sold") + units, "revenue": F("revenue") + revenue, "updated_at": now}
+    if sold:
+        fields["last_sold_at"] = now
+    model.objects.filter(pk__in=list(totals)).update(**fields)
+
+
+def _order_totals(order, sign=1):
+    by_variation, by_product, product_of = {}, {}, {}
+    for line in _lines(OrderItem.objects.filter(order=order)):
+        vid, pid = line["product_variation_id"], line["product_variation__product_id"]
+        units, revenue = sign * (line["units"] or 0), sign * (line["revenue"] or 0)
+        by_variation[vid] = (units, revenue)
+        product_of[vid] = {"product_id": pid}
+        u, r = by_product.get(pid, (0, 0))
+        by_product[pid] = (u + units, r + revenue)
+    return by_variation, by_product, product_of
+
+
+def record_paid_order(order) -> bool:
+    """
+    Add an order's lines to the sales counters. Only the first call for an
+    order counts (Order.sales_recorded is claimed with a conditional UPDATE),
+    so the return view, webhook and manual confirm can all call it. The
+    claim also stamps Order.paid_at, which last_sold_at is taken from.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        claimed = Order.objects.filter(pk=order.pk, sales_recorded=False).update(sales_recorded=True, paid_at=now)
+        if not claimed:
+            return False
+        order.sales_recorded, order.paid_at = True, now
+
+        by_variation, by_product, product_of = _order_totals(order)
+        _bump(VariationSalesStats, "variation_id", by_variation, now, extra=product_of)
+        _bump(ProductSalesStats, "product_id", by_product, now)
+        schedule_home_invalidation(("top_selling",))
+    return True
+
+
+def reverse_paid_order(order) -> bool:
+    """
+    Take a counted order back out of the sales counters (it was cancelled or
+    refunded). Releasing the sales_recorded claim makes this count once too.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        released = Order.objects.filter(pk=order.pk, sales_recorded=True).update(sales_recorded=False)
+        if not released:
+            return False
+        order.sales_recorded = False
+
+        by_variation, by_product, product_of = _order_totals(order, sign=-1)
+        _bump(VariationSalesStats, "variation_id", by_variation, now, extra=product_of, sold=False)
+        _bump(ProductSalesStats, "product_id", by_product, now, sold=False)
+        schedule_home_invalidation(("top_selling",))
+    return True
+
+
+def rebuild_sales_stats():
+    """
+    Recompute both tables from every PAID order (less cancelled and refunded
+    ones) and re-mark which orders are counted. Returns (products, variations)
+    rows written. Also worth running periodically: orders whose status is
+    changed with a queryset update() bypass reverse_paid_order.
+
+    last_sold_at is the latest payment time (paid_at); orders paid before
+    that was stamped fall back to when they were placed, not updated_at,
+    which moves whenever the order is edited.
+    """
+    with transaction.atomic():
+        lines = _lines(OrderItem.objects.filter(order__in=Order.objects.filter(COUNTED))).annotate(
+            last_sold_at=Max(Coalesce("order__paid_at", "order__created_at"))
+        )
+
+        variations, products = [], {}
+        for line in lines:
+            pid = line["product_variation__product_id"]
+            variations.append(VariationSalesStats(
+                variation_id=line["product_variation_id"],
+                product_id=pid,
+                units_sold=line["units"] or 0,
+                revenue=line["revenue"] or 0,
+                last_sold_at=line["last_sold_at"],
+            ))
+            p = products.get(pid)
+            if p is None:
+                p = products[pid] = ProductSalesStats(product_id=pid)
+            p.units_sold += line["units"] or 0
+            p.revenue += line["revenue"] or 0
+            if p.last_sold_at is None or (line["last_sold_at"] and line["last_sold_at"] > p.last_sold_at):
+                p.last_sold_at = line["last_sold_at"]
+
+        VariationSalesStats.objects.all().delete()
+        ProductSalesStats.objects.all().delete()
+        VariationSalesStats.objects.bulk_create(variations, batch_size=500)
+        ProductSalesStats.objects.bulk_create(products.values(), batch_size=500)
+
+        Order.objects.filter(COUNTED, sales_recorded=False).update(sales_recorded=True)
+        Order.objects.exclude(COUNTED).filter(sales_recorded=True).update(sales_recorded=False)
+        schedule_home_invalidation(("top_selling",))
+    return len(products), len(variations)
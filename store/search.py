@@ -0,0 +1,440 @@
+import abc
+import html
+import logging
+import re
+import threading
+from bisect import bisect_left
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Case, IntegerField, Max, Q, Value, When
+from django.utils.html import strip_tags
+from django.utils.module_loading import import_string
+
+from .models import Product, ProductVariation, SearchIndexChange
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_SEARCH_BACKEND = "store.search.InvertedIndexBackend"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str):
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def description_text(value: str) -> str:
+    return html.unescape(strip_tags(value or ""))
+
+
+def query_terms(q: str):
+    return [t for t in re.split(r"\s+", (q or "").strip()) if t]
+
+
+class BaseSearchBackend(abc.ABC):
+    """
+    A search backend answers `search(q)` with published product ids, best
+    match first. Backends that keep their own index are told about changes
+    through `index_products` and can be rebuilt wholesale.
+    """
+
+    @abc.abstractmethod
+    def search(self, q: str):
+        """Published product ids matching q, best match first."""
+
+    def index_products(self, product_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class OrmSearchBackend(BaseSearchBackend):
+    """The original icontains query, kept as the reference and fallback."""
+
+    def queryset(self, q: str):
+        combined = Q()
+        for t in query_terms(q):
+            combined &= (
+                Q(name__icontains=t) |
+                Q(description__icontains=t) |
+                Q(category__name__icontains=t) |
+                Q(variations__sku__icontains=t) |
+                Q(variations__variations__value__icontains=t)
+            )
+
+        name_hit = Case(When(name__icontains=q, then=Value(3)), default=Value(0), output_field=IntegerField())
+        sku_hit  = Case(When(variations__sku__icontains=q, then=Value(2)), default=Value(0), output_field=IntegerField())
+        cat_hit  = Case(When(category__name__icontains=q, then=Value(1)), default=Value(0), output_field=IntegerField())
+
+        return (
+            Product.objects
+            .filter(status=Product.ProductStatus.PUBLISHED)
+            .filter(combined)
+            .annotate(_rank=name_hit + sku_hit + cat_hit)
+            .distinct()
+            .order_by("-_rank", "-updated_at")
+        )
+
+    def search(self, q: str):
+        q = (q or "").strip()
+        if not q:
+            return []
+        ids, seen = [], set()
+        for pid in self.queryset(q).values_list("id", flat=True):
+            if pid not in seen:
+                seen.add(pid)
+                ids.append(pid)
+        return ids
+
+
+class _Doc:
+    __slots__ = ("tokens", "name", "skus", "category", "updated_at")
+
+    def __init__(self, tokens, name, skus, category, updated_at):
+        self.tokens = tokens
+        self.name = name
+        self.skus = skus
+        self.category = category
+        self.updated_at = updated_at
+
+
+def index_version() -> int:
+    """Id of the newest SearchIndexChange; moves whenever the searchable catalog does."""
+    return SearchIndexChange.objects.aggregate(v=Max("id"))["v"] or 0
+
+
+class InvertedIndexBackend(BaseSearchBackend):
+    """
+    Token -> product id postings held in process memory.
+
+    Covers product name, description (HTML stripped), category name, SKUs and
+    variation values. A query term matches every indexed token that contains
+    it, which mirrors icontains within a word, and all terms must match (as the
+    ORM path ANDs its terms). Hits are ranked like the ORM path: whole query in
+    the name (3), in a SKU (2), in the category (1), then most recently updated.
+
+    Substring lookups go through a sorted list of (suffix, token) pairs over
+    the vocabulary. Tokens first seen after that list was built are kept in a
+    small side set and scanned directly until the next rebuild of the list.
+
+    Changes reach every process through the SearchIndexChange table: each
+    search replays the rows newer than the last one applied. Full builds (the
+    first search in a process, or a requested rebuild) run on a background
+    thread; until the first one lands, searches are answered by the ORM
+    backend, and during a rebuild by the current index.
+    """
+
+    FRESH_TOKEN_LIMIT = 2000
+    build_in_background = True
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = {}
+        self._docs = {}
+        self._suffixes = []
+        self._fresh_tokens = set()
+        self._version = None
+        self._building = False
+
+    # ----- building -----
+    def _load_docs(self, product_ids=None):
+        products = Product.objects.filter(status=Product.ProductStatus.PUBLISHED)
+        if product_ids is not None:
+            products = products.filter(pk__in=product_ids)
+        rows = list(products.values_list("id", "name", "description", "category__name", "updated_at"))
+
+        ids = [r[0] for r in rows]
+        skus, values = {}, {}
+        for pid, sku in ProductVariation.objects.filter(product_id__in=ids).values_list("product_id", "sku"):
+            skus.setdefault(pid, []).append((sku or "").lower())
+        through = ProductVariation.variations.through
+        for pid, value in through.objects.filter(productvariation__product_id__in=ids).values_list(
+            "productvariation__product_id", "variationvalue__value"
+        ):
+            values.setdefault(pid, []).append(value or "")
+
+        docs = {}
+        for pid, name, description, category, updated_at in rows:
+            tokens = set(tokenize(name))
+            tokens.update(tokenize(description_text(description)))
+            tokens.update(tokenize(category))
+            for sku in skus.get(pid, ()):
+                tokens.add(sku)
+                tokens.update(tokenize(sku))
+            for value in values.get(pid, ()):
+                tokens.update(tokenize(value))
+            docs[pid] = _Doc(
+                tokens=frozenset(tokens),
+                name=(name or "").lower(),
+                skus=tuple(skus.get(pid, ())),
+                category=(category or "").lower(),
+                updated_at=updated_at.timestamp() if updated_at else 0.0,
+            )
+        return docs
+
+    def _drop(self, pid):
+        doc = self._docs.pop(pid, None)
+        if doc is None:
+            return
+        for token in doc.tokens:
+            bucket = self._postings.get(token)
+            if bucket is not None:
+                bucket.discard(pid)
+                if not bucket:
+                    del self._postings[token]
+
+    def _add(self, pid, doc):
+        self._docs[pid] = doc
+        for token in doc.tokens:
+            bucket = self._postings.get(token)
+            if bucket is None:
+                bucket = self._postings[token] = set()
+                self._fresh_tokens.add(token)
+            bucket.add(pid)
+
+    def _build_suffixes(self):
+        self._suffixes = sorted(
+            (token[i:], token) for token in self._postings for i in range(len(token))
+        )
+        self._fresh_tokens = set()
+
+    def rebuild(self):
+        version = index_version()
+        docs = self._load_docs()
+        with self._lock:
+            self._postings = {}
+            self._docs = {}
+            for pid, doc in docs.items():
+                self._add(pid, doc)
+            self._build_suffixes()
+            self._version = version
+
+    def index_products(self, product_ids):
+        ids = {int(pid) for pid in product_ids if pid}
+        if not ids:
+            return
+        docs = self._load_docs(ids)
+        with self._lock:
+            for pid in ids:
+                self._drop(pid)
+                if pid in docs:
+                    self._add(pid, docs[pid])
+            if len(self._fresh_tokens) > self.FRESH_TOKEN_LIMIT:
+                self._build_suffixes()
+
+    def _build(self):
+        try:
+            self.rebuild()
+        except Exception:
+            log.exception("Building the search index failed")
+        finally:
+            self._building = False
+            if self.build_in_background:
+                connections.close_all()
+
+    def warm(self):
+        """Start a full build unless one is already running."""
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        if self.build_in_background:
+            threading.Thread(target=self._build, name="search-index-build", daemon=True).start()
+        else:
+            self._build()
+
+    def _sync(self) -> bool:
+        """Apply pending changes; False while there is no index to answer from yet."""
+        if self._version is None:
+            self.warm()
+            return self._version is not None
+        changes = list(
+            SearchIndexChange.objects.filter(pk__gt=self._version)
+            .order_by("pk").values_list("pk", "full", "product_ids")
+        )
+        if not changes:
+            return True
+        if any(full for _, full, _ in changes):
+            self.warm()
+            return True
+        ids = set()
+        for _, _, changed in changes:
+            ids.update(changed)
+        self.index_products(ids)
+        with self._lock:
+            self._version = max(self._version, changes[-1][0])
+        return True
+
+    # ----- querying -----
+    def _tokens_containing(self, needle):
+        found = {t for t in self._fresh_tokens if needle in t}
+        suffixes = self._suffixes
+        i = bisect_left(suffixes, (needle,))
+        while i < len(suffixes) and suffixes[i][0].startswith(needle):
+            found.add(suffixes[i][1])
+            i += 1
+        return found
+
+    def _match(self, token):
+        hits = set()
+        for t in self._tokens_containing(token):
+            bucket = self._postings.get(t)
+            if bucket:
+                hits |= bucket
+        return hits
+
+    def search(self, q: str):
+        q = (q or "").strip()
+        if not q:
+            return []
+        if not self._sync():
+            return OrmSearchBackend().search(q)
+
+        tokens = []
+        for term in query_terms(q):
+            tokens.extend(tokenize(term))
+        if not tokens:
+            return []
+
+        with self._lock:
+            candidates = None
+            for token in sorted(set(tokens), key=len, reverse=True):
+                hits = self._match(token)
+                candidates = hits if candidates is None else candidates & hits
+                if not candidates:
+                    return []
+
+            needle = q.lower()
+            ranked = []
+            for pid in candidates:
+                doc = self._docs[pid]
+                rank = (
+                    (3 if needle in doc.name else 0) +
+                    (2 if any(needle in sku for sku in doc.skus) else 0) +
+                    (1 if needle in doc.category else 0)
+                )
+                ranked.append((-rank, -doc.updated_at, pid))
+        ranked.sort()
+        return [pid for _, _, pid in ranked]
+
+
+@lru_cache(maxsize=None)
+def get_search_backend() -> BaseSearchBackend:
+    path = getattr(settings, "STORE_SEARCH_BACKEND", DEFAULT_SEARCH_BACKEND)
+    return import_string(path)()
+
+
+def schedule_search_reindex(product_ids):
+    """Queue products for re-indexing once the current transaction commits."""
+    ids = sorted({int(pid) for pid in product_ids if pid})
+    if ids:
+        transaction.on_commit(lambda: _log_change(ids))
+
+
+COMPACT_EVERY = 100
+COMPACT_MAX_IDS = 5000
+
+
+def _log_change(ids):
+    change = SearchIndexChange.objects.create(product_ids=ids)
+    if change.pk % COMPACT_EVERY == 0:
+        compact_search_changes()
+
+
+def compact_search_changes(keep=None) -> int:
+    """
+    Fold every change older than the newest `keep` rows into the oldest kept
+    one, so the log stays short. Safe for processes at any version: one that
+    has not reached the kept row replays it and gets the union of the folded
+    products (or a full rebuild once that union passes COMPACT_MAX_IDS); one
+    already past it has applied them all. Returns the number of rows removed.
+    """
+    keep = max(1, keep or getattr(settings, "STORE_SEARCH_CHANGE_KEEP", 500))
+    with transaction.atomic():
+        boundary = SearchIndexChange.objects.order_by("-pk").values_list("pk", flat=True)[keep - 1:keep].first()
+        if boundary is None:
+            return 0
+        rows = list(SearchIndexChange.objects.filter(pk__lte=boundary).values_list("full", "product_ids"))
+        if len(rows) < 2:
+            return 0
+        ids = set()
+        for _, changed in rows:
+            ids.update(changed)
+        full = any(f for f, _ in rows) or len(ids) > COMPACT_MAX_IDS
+        SearchIndexChange.objects.filter(pk=boundary).update(full=full, product_ids=[] if full else sorted(ids))
+        removed, _ = SearchIndexChange.objects.filter(pk__lt=boundary).delete()
+    return removed
+
+
+def request_full_reindex():
+    """
+    Have every process rebuild its index. The change log is truncated first:
+    the rebuild marker supersedes everything before it.
+    """
+    with transaction.atomic():
+        SearchIndexChange.objects.all().delete()
+        SearchIndexChange.objects.create(full=True)
+
+
+# ---------- SQLite FTS5 ----------
+# A standalone FTS5 table (rowid = product id) created by migration 0025 when
+# the database is SQLite and FTS5 is compiled in. Only published products are
+# stored; rows are rewritten in the same transaction as the product change.
+FTS_TABLE = "store_product_fts"
+FTS_BM25_WEIGHTS = (10.0, 1.0, 3.0)  # name, description, category
+
+_fts_ready = {}
+
+
+def fts_available(using=DEFAULT_DB_ALIAS) -> bool:
+    conn = connections[using]
+    if conn.vendor != "sqlite":
+        return False
+    key = str(conn.settings_dict["NAME"])
+    if key not in _fts_ready:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+            _fts_ready[key] = cursor.fetchone() is not None
+    return _fts_ready[key]
+
+
+def fts_sync(product_ids, using=DEFAULT_DB_ALIAS):
+    ids = sorted({int(pid) for pid in product_ids if pid})
+    if not ids or not fts_available(using):
+        return
+    rows = (
+        Product.objects.using(using)
+        .filter(pk__in=ids, status=Product.ProductStatus.PUBLISHED)
+        .values_list("id", "name", "description", "category__name")
+    )
+    with connections[using].cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(pid,) for pid in ids])
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, description, category) VALUES (%s, %s, %s, %s)",
+            [(pid, name or "", description_text(description), category or "") for pid, name, description, category in rows],
+        )
+
+
+def fts_match_expression(q: str) -> str:
+    """Every token as a quoted prefix query, ORed, e.g. `"smart"* OR "tv"*`."""
+    tokens = []
+    for token in tokenize(q):
+        if token not in tokens:
+            tokens.append(token)
+    return " OR ".join(f'"{token}"*' for token in tokens)
+
+
+def fts_match_sql() -> str:
+    return f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+
+
+def fts_rank_sql(outer_table: str) -> str:
+    weights = ", ".join(str(w) for w in FTS_BM25_WEIGHTS)
+    return (
+        f"SELECT bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH %s AND rowid = {outer_table}.id"
+    )
@@ -1,29 +1,45 @@
 # yourapp/services/shiprocket.py
+import logging
+import math
+import threading
 import time
-import requests
+from decimal import Decimal
+
 from django.conf import settings
 from django.core.cache import cache
 
-API_BASE = getattr(settings, "SHIPROCKET_API_BASE", "https://apiv2.shiprocket.in/v1/external")
-EMAIL = getattr(settings, "SHIPROCKET_API_USER_EMAIL", None)
-PASSWORD = getattr(settings, "SHIPROCKET_API_USER_PASSWORD", None)
+from .integrations import shiprocket_client, single_flight
+
+DEFAULT_API_BASE = "https://apiv2.shiprocket.in/v1/external"
 
 CACHE_KEY = "shiprocket_token_v1"
 CACHE_TTL = 60 * 50  
 
+# Threads of this process queue here for a token refresh; other processes wait
+# on single_flight's cache marker, so one expiry costs one login.
+_token_lock = threading.Lock()
+
+log = logging.getLogger(__name__)
+
+
+def _api_base():
+    # Read per call rather than at import, so tests can point the client at a stub server.
+    return getattr(settings, "SHIPROCKET_API_BASE", DEFAULT_API_BASE).rstrip("/")
+
+
 class ShiprocketError(Exception):
     pass
 
-def _get_token():
-    token = cache.get(CACHE_KEY)
-    if token:
-        return token
-
-    if not (EMAIL and PASSWORD):
+def _login():
+    email = getattr(settings, "SHIPROCKET_API_USER_EMAIL", None)
+    password = getattr(settings, "SHIPROCKET_API_USER_PASSWORD", None)
+    if not (email and password):
         raise ShiprocketError("Shiprocket credentials not configured in settings.")
 
-    url = f"{API_BASE}/auth/login"
-    resp = requests.post(url, json={"email": EMAIL, "password": PASSWORD}, timeout=12)
+    url = f"{_api_base()}/auth/login"
+    resp = shiprocket_client.post(
+        url, endpoint="auth.login", json={"email": email, "password": password}, idempotent=True
+    )
     if resp.status_code != 200:
         raise ShiprocketError(f"Auth failed: {resp.status_code} {resp.text}")
 
@@ -38,6 +54,19 @@ def _get_token():
     cache.set(CACHE_KEY, token, CACHE_TTL)
     return token
 
+
+def _get_token():
+    return single_flight(CACHE_KEY, _login, lock=_token_lock)
+
+
+def _authorized(method, url, endpoint, **kwargs):
+    """A call with the bearer token; a 401 (token revoked before CACHE_TTL) drops it and retries once with a fresh one."""
+    resp = shiprocket_client.request(method, url, endpoint=endpoint, headers=_headers(), **kwargs)
+    if resp.status_code == 401:
+        cache.delete(CACHE_KEY)
+        resp = shiprocket_client.request(method, url, endpoint=endpoint, headers=_headers(), **kwargs)
+    return resp
+
 def _headers():
     token = _get_token()
     return {
@@ -51,7 +80,7 @@ def get_serviceability_and_rates(pickup_pincode, delivery_pincode, weight_kg, co
     Returns list of available couriers with rate, serviceability info.
     - weight_kg: Decimal or float in KG
     """
-    url = f"{API_BASE}/courier/serviceability/"
+    url = f"{_api_base()}/courier/serviceability/"
     params = {
         "pickup_postcode": str(pickup_pincode),
         "delivery_postcode": str(delivery_pincode),
@@ -59,7 +88,7 @@ def get_serviceability_and_rates(pickup_pincode, delivery_pincode, weight_kg, co
         "cod": int(cod),  
     }
     
-    resp = requests.get(url, headers=_headers(), params=params, timeout=12)
+    resp = _authorized("GET", url, "courier.serviceability", params=params)
     if resp.status_code != 200:
         raise ShiprocketError(f"Serviceability failed: {resp.status_code} {resp.text}")
     return resp.json()
@@ -91,8 +120,68 @@ def create_shiprocket_order(order_payload):
       "payment_method": "Prepaid"  
     }
     """
-    url = f"{API_BASE}/orders/create/adhoc"
-    resp = requests.post(url, headers=_headers(), json=order_payload, timeout=15)
+    url = f"{_api_base()}/orders/create/adhoc"
+    # Not idempotent: a retry after the request reached Shiprocket could book a second shipment.
+    resp = _authorized("POST", url, "orders.create", json=order_payload, timeout=15)
     if resp.status_code not in (200, 201):
         raise ShiprocketError(f"Create order failed: {resp.status_code} {resp.text}")
     return resp.json()
+
+
+# ---------- rate quotes ----------
+# Quotes are cached per (pickup, delivery, weight band, cod). A quote is fresh
+# for STORE_SHIPPING_QUOTE_TTL; for STORE_SHIPPING_QUOTE_STALE after that it is
+# still served while one background refresh (guarded by a cache.add lock)
+# fetches the next one, so only a never-seen route waits on Shiprocket.
+QUOTE_KEY = "shiprocket:quote:%s:%s:%s:%s"
+QUOTE_LOCK_KEY = "shiprocket:quote-lock:%s"
+
+
+def weight_bucket(weight_kg) -> Decimal:
+    """Round up to the next STORE_SHIPPING_WEIGHT_STEP slab (Shiprocket bills in 0.5 kg steps)."""
+    step = Decimal(str(getattr(settings, "STORE_SHIPPING_WEIGHT_STEP", "0.5")))
+    slabs = max(1, math.ceil(Decimal(str(weight_kg or 0)) / step))
+    return (step * slabs).normalize()
+
+
+def _quote_key(pickup_pincode, delivery_pincode, bucket, cod):
+    return QUOTE_KEY % (str(pickup_pincode).strip(), str(delivery_pincode).strip(), bucket, int(cod))
+
+
+def _fetch_quote(key, pickup_pincode, delivery_pincode, bucket, cod):
+    data = get_serviceability_and_rates(pickup_pincode, delivery_pincode, bucket, cod=cod)
+    fresh = getattr(settings, "STORE_SHIPPING_QUOTE_TTL", 900)
+    stale = getattr(settings, "STORE_SHIPPING_QUOTE_STALE", 86400)
+    cache.set(key, {"data": data, "fetched_at": time.time()}, fresh + stale)
+    return data
+
+
+def _revalidate(key, *args):
+    try:
+        _fetch_quote(key, *args)
+    except Exception:
+        log.warning("Shiprocket quote refresh failed for %s; serving the stale quote", key, exc_info=True)
+    finally:
+        cache.delete(QUOTE_LOCK_KEY % key)
+
+
+def quote_rates(pickup_pincode, delivery_pincode, weight_kg, cod=0):
+    """
+    get_serviceability_and_rates() through the quote cache. The rate is asked
+    for the top of the weight band, so one quote covers every cart in it.
+    Raises ShiprocketError only when there is no quote at all to fall back on.
+    """
+    bucket = weight_bucket(weight_kg)
+    key = _quote_key(pickup_pincode, delivery_pincode, bucket, cod)
+    args = (pickup_pincode, delivery_pincode, bucket, int(cod))
+    entry = cache.get(key)
+    if entry is None:
+        return _fetch_quote(key, *args)
+
+    age = time.time() - entry["fetched_at"]
+    if age > getattr(settings, "STORE_SHIPPING_QUOTE_TTL", 900) and cache.add(QUOTE_LOCK_KEY % key, 1, 60):
+        if getattr(settings, "STORE_SHIPPING_QUOTE_BACKGROUND", True):
+            threading.Thread(target=_revalidate, args=(key, *args), daemon=True).start()
+        else:
+            _revalidate(key, *args)
+    return entry["data"]
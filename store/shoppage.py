@@ -1,24 +1,35 @@
+import base64
+import binascii
 import json
 import re
+import threading
+import time
 from decimal import Decimal
 from typing import List, Tuple
 
 from django.conf import settings
 from django.db import connection
-from django.db.models import Q, F, Value, Avg, Count, Min, Max
-from django.db.models.functions import Lower, Greatest
+from django.db.models import (
+    Q, F, Value, Min, Max, Prefetch, OuterRef, Subquery, DecimalField
+)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Lower, Greatest, Coalesce
 from django.http import JsonResponse
 from django.shortcuts import render
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.core.paginator import Paginator
 
 from .models import (
     Product, ProductVariation, ProductImage, Category, ProductReview
 )
+from .search import fts_available, fts_match_expression, fts_match_sql, fts_rank_sql, index_version
 
 # ---------- Optional fuzzy libs ----------
 try:
-    from rapidfuzz import fuzz
+    from rapidfuzz import fuzz, process
+    import numpy as np
     _HAVE_RAPIDFUZZ = True
 except Exception:
     from difflib import SequenceMatcher
@@ -66,15 +77,22 @@ def similarity_cutoffs(q: str) -> Tuple[float, float]:
     return primary, suggest
 
 # ---------- Serializers ----------
+def _first(items):
+    return items[0] if items else None
+
 def _serialize_product(p: Product):
-    
-    primary = p.primary_item()  
-    img = p.primary_image
-    avg_int = p.average_rating_int()  
+    """
+    Serialize one product for the shop grid. Expects the queryset shape built
+    by `_api_queryset` (primary variation/image prefetched into lists,
+    category and vendor profile joined; ratings come from the stored
+    aggregates), so it never queries on its own.
+    """
+    primary = _first(p.api_primary_items)
+    img = _first(p.api_primary_images)
     avg = p.average_rating()
-    total_reviews = p.total_reviews()
+    avg_int = int(round(avg))
+    total_reviews = p.rating_count
 
-    
     sale_price = float(primary.sale_price) if primary else 0.0
     regular_price = float(primary.regular_price) if (primary and primary.show_regular_price) else float(primary.sale_price) if primary else 0.0
     show_regular = bool(primary.show_regular_price) if primary else False
@@ -83,13 +101,14 @@ def _serialize_product(p: Product):
     show_discount_type = primary.show_discount_type if primary else "none"
     discount_amount = float(primary.discount_amount()) if primary else 0.0
 
+    vendor_profile = getattr(p.vendor, "vendor_profile", None) if p.vendor_id else None
+
     return {
         "id": p.id,
         "name": p.name,
         "slug": p.slug,
         "category": {"name": p.category.name if p.category else "", "slug": p.category.slug if p.category else ""},
-        "vendor_name": getattr(getattr(p, "vendor", None), "vendor_profile", None).business_name
-                         if getattr(p, "vendor", None) and getattr(p.vendor, "vendor_profile", None) else "",
+        "vendor_name": vendor_profile.business_name if vendor_profile else "",
         "average_rating_int": avg_int,
         "average_rating": float(avg),
         "reviews_count": total_reviews,
@@ -109,6 +128,264 @@ def _serialize_product(p: Product):
         }
     }
 
+def serialize_products(products) -> List[dict]:
+    return [_serialize_product(p) for p in products]
+
+def _api_queryset():
+    return Product.objects.filter(
+        status=Product.ProductStatus.PUBLISHED
+    ).select_related("category", "vendor__vendor_profile").prefetch_related(
+        Prefetch(
+            "variations",
+            queryset=ProductVariation.objects.filter(is_active=True, is_primary=True),
+            to_attr="api_primary_items",
+        ),
+        Prefetch(
+            "images",
+            queryset=ProductImage.objects.filter(is_primary=True).order_by("id"),
+            to_attr="api_primary_images",
+        ),
+    )
+
+# ---------- Keyset (cursor) pagination ----------
+# Each sort pages by its key columns plus `id` as the tie-breaker, so a page
+# is "rows after the last one we sent" instead of an OFFSET scan.
+_CURSOR_SORTS = {
+    "newest":     (("created_at", "desc"), ("id", "desc")),
+    "price_low":  (("primary_price", "asc"), ("id", "asc")),
+    "price_high": (("primary_price", "desc"), ("id", "desc")),
+    "rating":     (("rating_avg", "desc"), ("rating_count", "desc"), ("id", "desc")),
+    "popular":    (("rating_count", "desc"), ("rating_avg", "desc"), ("id", "desc")),
+}
+
+_CURSOR_DECODERS = {
+    "created_at": parse_datetime,
+    "primary_price": Decimal,
+    "rating_avg": Decimal,
+    "rating_count": int,
+    "id": int,
+}
+
+class InvalidCursor(ValueError):
+    pass
+
+def _encode_cursor(sort: str, values) -> str:
+    payload = json.dumps([sort, [v.isoformat() if hasattr(v, "isoformat") else str(v) if isinstance(v, Decimal) else v for v in values]])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str, sort: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, values = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+    keys = _CURSOR_SORTS[sort]
+    if cursor_sort != sort or not isinstance(values, list) or len(values) != len(keys):
+        raise InvalidCursor("Cursor does not match this sort")
+    try:
+        decoded = [_CURSOR_DECODERS[field](value) for (field, _), value in zip(keys, values)]
+    except Exception:
+        raise InvalidCursor("Malformed cursor")
+    if any(v is None for v in decoded):
+        raise InvalidCursor("Malformed cursor")
+    return decoded
+
+def _keyset_after(keys, values) -> Q:
+    """(a, b, id) > (a0, b0, id0) in each column's own direction."""
+    condition, equal = Q(), {}
+    for (field, direction), value in zip(keys, values):
+        op = "gt" if direction == "asc" else "lt"
+        condition |= Q(**equal, **{f"{field}__{op}": value})
+        equal[field] = value
+    return condition
+
+def _with_sort_keys(qs, sort: str):
+    if sort in ("price_low", "price_high"):
+        primary_price = ProductVariation.objects.filter(
+            product=OuterRef("pk"), is_active=True, is_primary=True
+        ).order_by("sale_price").values("sale_price")[:1]
+        qs = qs.annotate(primary_price=Coalesce(
+            Subquery(primary_price), Value(Decimal("0.00")), output_field=DecimalField(max_digits=10, decimal_places=2)
+        ))
+    return qs
+
+def _keyset_page(request, qs, sort: str, page_size: int, q: str = ""):
+    if sort not in _CURSOR_SORTS:
+        sort = "newest"
+    keys = _CURSOR_SORTS[sort]
+
+    qs = _with_sort_keys(qs, sort)
+    total = qs.count() if request.GET.get("with_total") == "1" else None
+
+    cursor = (request.GET.get("cursor") or "").strip()
+    if cursor:
+        try:
+            qs = qs.filter(_keyset_after(keys, _decode_cursor(cursor, sort)))
+        except InvalidCursor as e:
+            return JsonResponse({"ok": False, "message": str(e)}, status=400)
+
+    qs = qs.order_by(*[f"-{f}" if d == "desc" else f for f, d in keys])
+    rows = list(qs[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = _encode_cursor(sort, [getattr(last, f) for f, _ in keys])
+
+    data = {
+        "ok": True,
+        "items": serialize_products(rows),
+        "next_cursor": next_cursor,
+        "has_more": has_more,
+    }
+    if total is not None:
+        data["total"] = total
+    if q and not cursor and not has_more:
+        data["suggestions"] = suggestions_for(q, len(rows))
+    return JsonResponse(data)
+
+# ---------- "Did you mean" suggestions ----------
+# Published product names and active category names are held in process
+# memory and scored in batches. A plain ratio over every entry, plus one over
+# the distinct words (so a typo in one word of a long name still finds it),
+# picks a shortlist; only the shortlist gets the _fuzzy_score blend.
+SUGGEST_SHORTLIST = 200
+SUGGEST_WORD_MATCHES = 5
+SUGGEST_WORD_CUTOFF = 70
+
+def _suggest_text(s: str) -> str:
+    return " ".join(re.findall(r'\w+', (s or '').lower()))
+
+class _SuggestVocabulary:
+    def __init__(self, entries):
+        # entries: [(text, label, kind, url)]
+        self.entries = entries
+        self.texts = [e[0] for e in entries]
+        word_entries = {}
+        for i, text in enumerate(self.texts):
+            for word in set(text.split()):
+                if len(word) > 2:
+                    word_entries.setdefault(word, []).append(i)
+        self.words = list(word_entries)
+        self.word_entries = [word_entries[w] for w in self.words]
+
+def _load_suggest_vocabulary() -> _SuggestVocabulary:
+    entries, seen = [], set()
+    products = (
+        Product.objects.filter(status=Product.ProductStatus.PUBLISHED)
+        .order_by("-updated_at")
+        .values_list("name", "slug")
+    )
+    for name, slug in products:
+        text = _suggest_text(name)
+        if text and ("product", text) not in seen:
+            seen.add(("product", text))
+            entries.append((text, name, "product", reverse("store:product_detail", args=[slug]) if slug else ""))
+    for pk, name, slug in Category.objects.filter(is_active=True).values_list("pk", "name", "slug"):
+        text = _suggest_text(name)
+        if text and ("category", text) not in seen:
+            seen.add(("category", text))
+            url = reverse("store:category_detail", kwargs={"slug": slug, "pk": pk}) if slug else ""
+            entries.append((text, name, "category", url))
+    return _SuggestVocabulary(entries)
+
+_suggest_lock = threading.Lock()
+_suggest_state = {"vocab": None, "version": None, "loaded_at": 0.0}
+
+def _suggest_vocabulary_stale(version) -> bool:
+    ttl = getattr(settings, "STORE_SUGGEST_VOCAB_TTL", 300)
+    return (
+        _suggest_state["vocab"] is None or
+        _suggest_state["version"] != version or
+        time.monotonic() - _suggest_state["loaded_at"] > ttl
+    )
+
+def suggestion_vocabulary() -> _SuggestVocabulary:
+    """Loaded once per process; reloaded when the search index version moves or the TTL runs out."""
+    version = index_version()
+    if _suggest_vocabulary_stale(version):
+        with _suggest_lock:
+            if _suggest_vocabulary_stale(version):
+                vocab = _load_suggest_vocabulary()
+                _suggest_state.update(vocab=vocab, version=version, loaded_at=time.monotonic())
+    return _suggest_state["vocab"]
+
+def _shortlist(query: str, vocab: _SuggestVocabulary, workers: int):
+    """
+    Candidate entry indexes, plus a per-entry word score: the mean over query
+    words of how well each one matched a word in that entry (0..1).
+    """
+    texts = vocab.texts
+    scores = process.cdist([query], texts, scorer=fuzz.ratio, dtype=np.uint8, workers=workers)[0]
+    n = min(SUGGEST_SHORTLIST, len(texts))
+    picked = set(np.argpartition(scores, -n)[-n:].tolist())
+
+    word_hits = {}
+    tokens = [t for t in query.split() if len(t) > 2][:4]
+    if tokens and vocab.words:
+        word_scores = process.cdist(
+            tokens, vocab.words, scorer=fuzz.ratio, dtype=np.uint8,
+            workers=workers, score_cutoff=SUGGEST_WORD_CUTOFF,
+        )
+        m = min(SUGGEST_WORD_MATCHES, len(vocab.words))
+        per_word = max(1, SUGGEST_SHORTLIST // (len(tokens) * m))
+        for t, row in enumerate(word_scores):
+            for w in np.argpartition(row, -m)[-m:]:
+                if not row[w]:
+                    continue
+                for i in vocab.word_entries[w][:per_word]:
+                    best = word_hits.setdefault(i, [0] * len(tokens))
+                    best[t] = max(best[t], int(row[w]))
+        picked.update(word_hits)
+    word_score = {i: sum(best) / (100.0 * len(best)) for i, best in word_hits.items()}
+    return sorted(picked), word_score
+
+def _rank_suggestions(query: str, vocab: _SuggestVocabulary):
+    """(score, entry index) pairs, best first."""
+    if not _HAVE_RAPIDFUZZ:
+        scored = [(_fuzzy_score(query, t), i) for i, t in enumerate(vocab.texts)]
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        return scored
+
+    workers = getattr(settings, "STORE_SUGGEST_WORKERS", -1)
+    candidates, word_score = _shortlist(query, vocab, workers)
+    texts = [vocab.texts[i] for i in candidates]
+    blend = (
+        0.6 * process.cdist([query], texts, scorer=fuzz.token_set_ratio, workers=workers)[0] +
+        0.4 * process.cdist([query], texts, scorer=fuzz.partial_ratio, workers=workers)[0]
+    ) / 100.0
+    blend = np.maximum(blend, [word_score.get(i, 0.0) for i in candidates])
+    order = np.argsort(-blend, kind="stable")
+    return [(float(blend[j]), candidates[j]) for j in order]
+
+def suggest(q: str, limit: int = None) -> List[dict]:
+    query = _suggest_text(q)
+    if len(query) < 3:
+        return []
+    vocab = suggestion_vocabulary()
+    if not vocab.texts:
+        return []
+
+    limit = limit or getattr(settings, "STORE_SUGGEST_LIMIT", 5)
+    min_score = getattr(settings, "STORE_SUGGEST_MIN_SCORE", 0.6)
+    out = []
+    for score, i in _rank_suggestions(query, vocab):
+        if score < min_score or len(out) >= limit:
+            break
+        text, label, kind, url = vocab.entries[i]
+        if text == query:
+            continue
+        out.append({"text": label, "kind": kind, "url": url, "score": round(score, 3)})
+    return out
+
+def suggestions_for(q: str, hits: int) -> List[dict]:
+    """Suggestions only when a search came back empty or nearly so."""
+    if not q or hits > getattr(settings, "STORE_SUGGEST_FEW_HITS", 3):
+        return []
+    return suggest(q)
+
 # ---------- Shop page ----------
 def shop(request):
     categories = Category.objects.filter(is_active=True).order_by("name")
@@ -132,16 +409,7 @@ def shop(request):
 
 # ---------- JSON API (GET) ----------
 def product_list_api(request):
-    qs = Product.objects.filter(
-        status=Product.ProductStatus.PUBLISHED
-    ).select_related("category", "vendor").prefetch_related(
-        "reviews",
-        "images",
-        "variations",
-    ).annotate(
-        avg_rating=Avg("reviews__rating"),
-        reviews_count=Count("reviews"),
-    )
+    qs = _api_queryset()
 
     
     q = (request.GET.get("q") or "").strip()
@@ -182,7 +450,7 @@ def product_list_api(request):
 
     if rating_min:
         try:
-            qs = qs.filter(avg_rating__gte=float(rating_min))
+            qs = qs.filter(rating_avg__gte=Decimal(rating_min))
         except Exception:
             pass
 
@@ -206,6 +474,11 @@ def product_list_api(request):
                 Q(rank__gt=0.0) | Q(sim__gt=p_cut) |
                 Q(name__icontains=loose_q) | Q(description__icontains=loose_q)
             )
+        elif fts_available() and fts_match_expression(loose_q):
+            match = fts_match_expression(loose_q)
+            qs = qs.filter(pk__in=RawSQL(fts_match_sql(), (match,)))
+            if sort == "relevance":
+                qs = qs.annotate(fts_rank=RawSQL(fts_rank_sql(Product._meta.db_table), (match,)))
         else:
             loose = Q(name__icontains=loose_q) | Q(description__icontains=loose_q)
             token_or = Q()
@@ -213,15 +486,25 @@ def product_list_api(request):
                 token_or |= Q(name__icontains=t) | Q(description__icontains=t)
             qs = qs.filter(loose | token_or | Q(name__icontains=q) | Q(description__icontains=q))
 
+    if "cursor" in request.GET:
+        return _keyset_page(request, qs, sort, page_size, q=q)
+
     
     if sort == "price_low":
         qs = qs.order_by("variations__sale_price")
     elif sort == "price_high":
         qs = qs.order_by("-variations__sale_price")
     elif sort == "rating":
-        qs = qs.order_by("-avg_rating", "-reviews_count")
+        qs = qs.order_by("-rating_avg", "-rating_count")
     elif sort == "popular":
-        qs = qs.order_by("-reviews_count", "-avg_rating")
+        qs = qs.order_by("-rating_count", "-rating_avg")
+    elif sort == "relevance" and q:
+        if "fts_rank" in qs.query.annotations:
+            qs = qs.order_by("fts_rank", "-id")
+        elif "rank" in qs.query.annotations:
+            qs = qs.order_by("-rank", "-sim")
+        else:
+            qs = qs.order_by("-created_at")
     else:  
         qs = qs.order_by("-created_at")
 
@@ -230,12 +513,15 @@ def product_list_api(request):
     paginator = Paginator(qs, page_size)
     page_obj = paginator.get_page(page)
 
-    items = [_serialize_product(p) for p in page_obj.object_list]
+    items = serialize_products(page_obj.object_list)
 
-    return JsonResponse({
+    data = {
         "ok": True,
         "page": page_obj.number,
         "total_pages": paginator.num_pages,
         "total": paginator.count,
         "items": items,
-    })
\ No newline at end of file
+    }
+    if q:
+        data["suggestions"] = suggestions_for(q, paginator.count)
+    return JsonResponse(data)
\ No newline at end of file
@@ -0,0 +1,295 @@
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
+
+from order.models import Coupon, Order
+
+from .cards import schedule_card_refresh
+from .coupons import schedule_coupon_invalidation
+from .home import HOME_SECTIONS, PRODUCT_SECTIONS, schedule_home_invalidation
+from .ratings import apply_rating_change
+from .sales import PAID, REVERSED_STATUSES, reverse_paid_order
+from .models import (
+    Category, Product, ProductImage, ProductReview, ProductVariation, VariationCategory, VariationValue,
+)
+from .search import fts_sync, schedule_search_reindex
+from .variants import schedule_variant_invalidation
+
+
+def _refresh_card_for_product(sender, instance, **kwargs):
+    schedule_card_refresh(instance.pk)
+
+
+def _refresh_card_for_child(sender, instance, **kwargs):
+    schedule_card_refresh(instance.product_id)
+
+
+post_save.connect(
+    _refresh_card_for_product,
+    sender=Product,
+    dispatch_uid="store_card_post_save_Product",
+)
+
+for model in (ProductVariation, ProductImage, ProductReview):
+    post_save.connect(
+        _refresh_card_for_child,
+        sender=model,
+        dispatch_uid=f"store_card_post_save_{model.__name__}",
+    )
+    post_delete.connect(
+        _refresh_card_for_child,
+        sender=model,
+        dispatch_uid=f"store_card_post_delete_{model.__name__}",
+    )
+
+
+# ---------- search index ----------
+def _reindex_product(sender, instance, **kwargs):
+    schedule_search_reindex([instance.pk])
+
+
+def _reindex_variation_product(sender, instance, **kwargs):
+    schedule_search_reindex([instance.product_id])
+
+
+def _reindex_category_products(sender, instance, **kwargs):
+    schedule_search_reindex(instance.products.values_list("id", flat=True))
+
+
+def _reindex_value_products(sender, instance, **kwargs):
+    schedule_search_reindex(
+        ProductVariation.objects.filter(variations=instance).values_list("product_id", flat=True)
+    )
+
+
+def _reindex_on_variation_values(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear", "pre_clear"):
+        return
+    if not reverse:
+        schedule_search_reindex([instance.product_id])
+    elif pk_set:
+        schedule_search_reindex(
+            ProductVariation.objects.filter(pk__in=pk_set).values_list("product_id", flat=True)
+        )
+    elif action == "pre_clear":
+        _reindex_value_products(sender, instance)
+
+
+for model, handler in ((Product, _reindex_product), (ProductVariation, _reindex_variation_product)):
+    post_save.connect(handler, sender=model, dispatch_uid=f"store_search_post_save_{model.__name__}")
+    post_delete.connect(handler, sender=model, dispatch_uid=f"store_search_post_delete_{model.__name__}")
+
+post_save.connect(
+    _reindex_category_products,
+    sender=Category,
+    dispatch_uid="store_search_post_save_Category",
+)
+# Before the delete: afterwards the products' category is already NULL.
+pre_delete.connect(
+    _reindex_category_products,
+    sender=Category,
+    dispatch_uid="store_search_pre_delete_Category",
+)
+post_save.connect(
+    _reindex_value_products,
+    sender=VariationValue,
+    dispatch_uid="store_search_post_save_VariationValue",
+)
+pre_delete.connect(
+    _reindex_value_products,
+    sender=VariationValue,
+    dispatch_uid="store_search_pre_delete_VariationValue",
+)
+m2m_changed.connect(
+    _reindex_on_variation_values,
+    sender=ProductVariation.variations.through,
+    dispatch_uid="store_search_m2m_ProductVariation_variations",
+)
+
+
+# ---------- SQLite FTS5 ----------
+def _fts_sync_product(sender, instance, using, **kwargs):
+    fts_sync([instance.pk], using=using)
+
+
+def _fts_sync_category_products(sender, instance, using, created, **kwargs):
+    if not created:
+        fts_sync(instance.products.values_list("id", flat=True), using=using)
+
+
+post_save.connect(_fts_sync_product, sender=Product, dispatch_uid="store_fts_post_save_Product")
+post_delete.connect(_fts_sync_product, sender=Product, dispatch_uid="store_fts_post_delete_Product")
+post_save.connect(
+    _fts_sync_category_products,
+    sender=Category,
+    dispatch_uid="store_fts_post_save_Category",
+)
+
+
+def _fts_remember_category_products(sender, instance, **kwargs):
+    instance._fts_product_ids = list(instance.products.values_list("id", flat=True))
+
+
+def _fts_sync_deleted_category_products(sender, instance, using, **kwargs):
+    fts_sync(getattr(instance, "_fts_product_ids", ()), using=using)
+
+
+# The ids are read before the delete; the rows are rewritten after it, once category is NULL.
+pre_delete.connect(
+    _fts_remember_category_products,
+    sender=Category,
+    dispatch_uid="store_fts_pre_delete_Category",
+)
+post_delete.connect(
+    _fts_sync_deleted_category_products,
+    sender=Category,
+    dispatch_uid="store_fts_post_delete_Category",
+)
+
+
+# ---------- home page sections ----------
+def _invalidate_product_sections(sender, **kwargs):
+    schedule_home_invalidation(PRODUCT_SECTIONS)
+
+
+def _invalidate_all_sections(sender, **kwargs):
+    schedule_home_invalidation(HOME_SECTIONS)
+
+
+for model in (Product, ProductVariation, ProductImage, ProductReview):
+    post_save.connect(
+        _invalidate_product_sections,
+        sender=model,
+        dispatch_uid=f"store_home_post_save_{model.__name__}",
+    )
+    post_delete.connect(
+        _invalidate_product_sections,
+        sender=model,
+        dispatch_uid=f"store_home_post_delete_{model.__name__}",
+    )
+
+post_save.connect(_invalidate_all_sections, sender=Category, dispatch_uid="store_home_post_save_Category")
+post_delete.connect(_invalidate_all_sections, sender=Category, dispatch_uid="store_home_post_delete_Category")
+
+
+# The categories section shows per-category product counts: they move when a
+# product is added, removed or put in another category.
+def _remember_product_category(sender, instance, **kwargs):
+    instance._category_was = instance.__dict__.get("category_id") if instance.pk else None
+
+
+def _product_saved_for_counts(sender, instance, created, **kwargs):
+    if created or instance.category_id != getattr(instance, "_category_was", instance.category_id):
+        schedule_home_invalidation(("categories",))
+    instance._category_was = instance.category_id
+
+
+def _product_deleted_for_counts(sender, instance, **kwargs):
+    schedule_home_invalidation(("categories",))
+
+
+post_init.connect(_remember_product_category, sender=Product, dispatch_uid="store_home_post_init_Product")
+post_save.connect(_product_saved_for_counts, sender=Product, dispatch_uid="store_home_counts_post_save_Product")
+post_delete.connect(_product_deleted_for_counts, sender=Product, dispatch_uid="store_home_counts_post_delete_Product")
+
+
+# ---------- rating aggregates ----------
+def _remember_review_rating(sender, instance, **kwargs):
+    instance._rating_was = (instance.product_id, instance.rating) if instance.pk else None
+
+
+def _review_saved(sender, instance, created, **kwargs):
+    was = None if created else getattr(instance, "_rating_was", None)
+    now = (instance.product_id, instance.rating)
+    if was and was[0] != now[0]:
+        apply_rating_change(was[0], removed=was[1])
+        apply_rating_change(now[0], added=now[1])
+    elif was != now:
+        apply_rating_change(now[0], removed=was[1] if was else None, added=now[1])
+    instance._rating_was = now
+
+
+def _review_deleted(sender, instance, **kwargs):
+    product_id, rating = getattr(instance, "_rating_was", None) or (instance.product_id, instance.rating)
+    apply_rating_change(product_id, removed=rating)
+
+
+post_init.connect(_remember_review_rating, sender=ProductReview, dispatch_uid="store_rating_post_init_ProductReview")
+post_save.connect(_review_saved, sender=ProductReview, dispatch_uid="store_rating_post_save_ProductReview")
+post_delete.connect(_review_deleted, sender=ProductReview, dispatch_uid="store_rating_post_delete_ProductReview")
+
+
+# ---------- coupon code cache ----------
+def _remember_coupon_code(sender, instance, **kwargs):
+    instance._code_was = instance.code if instance.pk else None
+
+
+def _invalidate_coupon(sender, instance, **kwargs):
+    # Covers the vendor coupon create/update/toggle/delete endpoints and admin edits;
+    # a renamed coupon drops both its old and new code.
+    schedule_coupon_invalidation([getattr(instance, "_code_was", None), instance.code])
+    instance._code_was = instance.code
+
+
+post_init.connect(_remember_coupon_code, sender=Coupon, dispatch_uid="store_coupon_post_init_Coupon")
+post_save.connect(_invalidate_coupon, sender=Coupon, dispatch_uid="store_coupon_post_save_Coupon")
+post_delete.connect(_invalidate_coupon, sender=Coupon, dispatch_uid="store_coupon_post_delete_Coupon")
+
+
+# ---------- variant maps ----------
+def _drop_variant_map(sender, instance, **kwargs):
+    schedule_variant_invalidation([instance.product_id])
+
+
+def _drop_variant_maps_for_value(sender, instance, **kwargs):
+    schedule_variant_invalidation(
+        ProductVariation.objects.filter(variations=instance).values_list("product_id", flat=True)
+    )
+
+
+def _drop_variant_maps_for_category(sender, instance, **kwargs):
+    schedule_variant_invalidation(
+        ProductVariation.objects.filter(variations__category=instance).values_list("product_id", flat=True)
+    )
+
+
+def _drop_variant_maps_on_values(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear", "pre_clear"):
+        return
+    if not reverse:
+        schedule_variant_invalidation([instance.product_id])
+    elif pk_set:
+        schedule_variant_invalidation(
+            ProductVariation.objects.filter(pk__in=pk_set).values_list("product_id", flat=True)
+        )
+    elif action == "pre_clear":
+        _drop_variant_maps_for_value(sender, instance)
+
+
+post_save.connect(_drop_variant_map, sender=ProductVariation, dispatch_uid="store_variants_post_save_ProductVariation")
+post_delete.connect(_drop_variant_map, sender=ProductVariation, dispatch_uid="store_variants_post_delete_ProductVariation")
+post_save.connect(
+    _drop_variant_maps_for_value, sender=VariationValue, dispatch_uid="store_variants_post_save_VariationValue"
+)
+pre_delete.connect(
+    _drop_variant_maps_for_value, sender=VariationValue, dispatch_uid="store_variants_pre_delete_VariationValue"
+)
+post_save.connect(
+    _drop_variant_maps_for_category, sender=VariationCategory, dispatch_uid="store_variants_post_save_VariationCategory"
+)
+pre_delete.connect(
+    _drop_variant_maps_for_category, sender=VariationCategory, dispatch_uid="store_variants_pre_delete_VariationCategory"
+)
+m2m_changed.connect(
+    _drop_variant_maps_on_values,
+    sender=ProductVariation.variations.through,
+    dispatch_uid="store_variants_m2m_ProductVariation_variations",
+)
+
+
+# ---------- sales counters ----------
+def _reverse_cancelled_sale(sender, instance, **kwargs):
+    # A counted order that is cancelled, refunded or no longer paid leaves the counters.
+    if instance.sales_recorded and (instance.payment_status != PAID or instance.status in REVERSED_STATUSES):
+        reverse_paid_order(instance)
+
+
+post_save.connect(_reverse_cancelled_sale, sender=Order, dispatch_uid="store_sales_post_save_Order")
@@ -0,0 +1,162 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .cards import schedule_card_refresh
+from .models import ProductVariation, StockReservation
+
+
+log = logging.getLogger(__name__)
+
+HELD = StockReservation.Status.HELD
+COMMITTED = StockReservation.Status.COMMITTED
+RELEASED = StockReservation.Status.RELEASED
+
+
+class InsufficientStock(Exception):
+    def __init__(self, variation_id, requested):
+        self.variation_id = variation_id
+        self.requested = requested
+        super().__init__(f"Not enough stock for variation #{variation_id} (wanted {requested})")
+
+
+def _take(variation_id, quantity) -> bool:
+    # A single conditional UPDATE: the database serializes concurrent buyers on
+    # the row and the WHERE clause is re-checked after any wait, so stock never
+    # goes negative and nothing is read-then-written.
+    return bool(
+        ProductVariation.objects.filter(pk=variation_id, stock_quantity__gte=quantity)
+        .update(stock_quantity=F("stock_quantity") - quantity)
+    )
+
+
+def _give_back(variation_id, quantity):
+    ProductVariation.objects.filter(pk=variation_id).update(stock_quantity=F("stock_quantity") + quantity)
+
+
+def _refresh_cards(variation_ids):
+    # Queryset updates fire no signals; a card's in_stock follows its product's primary variation.
+    ids = set(variation_ids)
+    if not ids:
+        return
+    for product_id in ProductVariation.objects.filter(pk__in=ids, is_primary=True).values_list("product_id", flat=True):
+        schedule_card_refresh(product_id)
+
+
+def _release(holds) -> int:
+    """Hand back the units of each HELD row in `holds`; each row is claimed first, so it is returned once."""
+    released, restocked = 0, set()
+    for pk, variation_id, quantity in holds.filter(status=HELD).values_list("pk", "variation_id", "quantity"):
+        with transaction.atomic():
+            claimed = StockReservation.objects.filter(pk=pk, status=HELD).update(
+                status=RELEASED, updated_at=timezone.now()
+            )
+            if claimed:
+                _give_back(variation_id, quantity)
+                restocked.add(variation_id)
+                released += 1
+    _refresh_cards(restocked)
+    return released
+
+
+def hold_expiry(now=None):
+    return (now or timezone.now()) + timedelta(minutes=getattr(settings, "STORE_STOCK_HOLD_MINUTES", 15))
+
+
+def reserve_order_stock(order, quantities):
+    """
+    Take {variation_id: quantity} off stock and record HELD reservations for
+    the order. Variations are decremented in id order so two multi-line carts
+    never wait on each other's rows in opposite orders. Raises
+    InsufficientStock, with every decrement of this call rolled back.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        for variation_id in sorted(quantities):
+            quantity = quantities[variation_id]
+            if _take(variation_id, quantity):
+                continue
+            # Out of stock may only mean abandoned holds that have not been swept yet.
+            expired = StockReservation.objects.filter(variation_id=variation_id, expires_at__lte=now)
+            if not (_release(expired) and _take(variation_id, quantity)):
+                raise InsufficientStock(variation_id, quantity)
+
+        expires_at = hold_expiry(now)
+        StockReservation.objects.bulk_create([
+            StockReservation(order=order, variation_id=variation_id, quantity=quantity, expires_at=expires_at)
+            for variation_id, quantity in quantities.items()
+        ])
+        _refresh_cards(quantities)
+
+
+def commit_order_stock(order) -> int:
+    """
+    Payment captured: the order's holds become permanent. A hold that lapsed
+    (or was released by an earlier failure callback) before the payment landed
+    is taken again; if the units are gone by then the oversell is logged,
+    since the money is already in.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        committed = StockReservation.objects.filter(order=order, status=HELD).update(
+            status=COMMITTED, updated_at=now
+        )
+        lapsed = StockReservation.objects.filter(order=order, status=RELEASED)
+        taken = set()
+        for pk, variation_id, quantity in lapsed.values_list("pk", "variation_id", "quantity"):
+            if not StockReservation.objects.filter(pk=pk, status=RELEASED).update(status=COMMITTED, updated_at=now):
+                continue
+            committed += 1
+            if _take(variation_id, quantity):
+                taken.add(variation_id)
+            else:
+                log.warning(
+                    "Order %s paid after its hold on variation %s lapsed; %s unit(s) oversold",
+                    order.order_id, variation_id, quantity,
+                )
+        _refresh_cards(taken)
+    return committed
+
+
+def release_order_stock(order) -> int:
+    """Payment failed or checkout abandoned: return the order's held units."""
+    return _release(StockReservation.objects.filter(order=order))
+
+
+def release_abandoned_checkouts(user, keep=None) -> int:
+    """
+    Return the units held by the user's other unpaid orders (they started a
+    new checkout). Orders whose payment is still being verified keep theirs,
+    and so does an order already sent to the gateway (it has a txnid) until
+    its hold expires: it may still be paid from another tab.
+    """
+    holds = (
+        StockReservation.objects.filter(order__buyer=user)
+        .exclude(order__payment_status__in=["PAID", "PENDING_VERIFICATION"])
+        .filter(
+            Q(expires_at__lte=timezone.now())
+            | Q(order__easebuzz_txnid__isnull=True)
+            | Q(order__easebuzz_txnid="")
+        )
+    )
+    if keep is not None:
+        holds = holds.exclude(order=keep)
+    return _release(holds)
+
+
+def extend_holds(order, until) -> int:
+    """Push the order's HELD reservations out to `until` (never shortening one)."""
+    return StockReservation.objects.filter(order=order, status=HELD, expires_at__lt=until).update(
+        expires_at=until, updated_at=timezone.now()
+    )
+
+
+def release_expired_holds(now=None, limit=None) -> int:
+    holds = StockReservation.objects.filter(status=HELD, expires_at__lte=now or timezone.now()).order_by("expires_at")
+    if limit:
+        holds = StockReservation.objects.filter(pk__in=list(holds.values_list("pk", flat=True)[:limit]))
+    return _release(holds)
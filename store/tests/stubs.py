@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+DEFAULT_RATES = [
+    {"courier_name": "Shiprocket Surface", "courier_company_id": 10, "rate": 49.0, "etd": "4 days", "estimated_delivery_days": "4"},
+    {"courier_name": "Express Air", "courier_company_id": 11, "rate": 95.0, "etd": "2 days", "estimated_delivery_days": "2"},
+]
+
+
+class StubServer:
+    """
+    A real HTTP server on 127.0.0.1 (random port) answering from `routes`,
+    {(method, path): handler(stub, query, body) -> (status, payload)}. Every
+    request is appended to `calls` as (method, path, query, body). Use it as a
+    context manager and point the integration's base URL at `base_url`.
+    """
+
+    routes = {}
+
+    def __init__(self):
+        self.calls = []
+        self.peers = []
+        self.status = None
+        self._server = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def hits(self, path):
+        return sum(1 for _, p, _, _ in self.calls if p == path)
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _serve(self, method):
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length).decode("utf-8") if length else ""
+                try:
+                    body = json.loads(raw) if raw else {}
+                except ValueError:
+                    body = {k: v[0] for k, v in parse_qs(raw).items()}
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                stub.calls.append((method, url.path, query, body))
+                stub.peers.append(self.client_address)
+
+                route = stub.routes.get((method, url.path))
+                if route is None:
+                    status, payload = 404, {"message": "not found"}
+                else:
+                    status, payload = route(stub, query, body)
+                status = stub.status or status
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._serve("GET")
+
+            def do_POST(self):
+                self._serve("POST")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class StubShiprocket(StubServer):
+    """
+    Shiprocket's login, serviceability and adhoc-order endpoints. `rates` is
+    what serviceability answers; set `status` to make every call fail with it.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = list(DEFAULT_RATES if rates is None else rates)
+
+    def _login(self, query, body):
+        return 200, {"token": "stub-token"}
+
+    def _serviceability(self, query, body):
+        return 200, {"status": 200, "data": {"available_courier_companies": self.rates}}
+
+    def _create_order(self, query, body):
+        n = self.hits("/orders/create/adhoc")
+        return 200, {"order_id": 9000 + n, "shipment_id": 7000 + n, "status": "NEW"}
+
+    routes = {
+        ("POST", "/auth/login"): _login,
+        ("GET", "/courier/serviceability/"): _serviceability,
+        ("POST", "/orders/create/adhoc"): _create_order,
+    }
+
+
+class StubEasebuzz(StubServer):
+    """
+    Easebuzz's v2 and v1 transaction retrieve endpoints, both answering with
+    `txn_status` for the posted txnid. Paths in `down` answer 503; paths in
+    `slow` answer after that many seconds.
+    """
+
+    def __init__(self, txn_status="success"):
+        super().__init__()
+        self.txn_status = txn_status
+        self.down = set()
+        self.slow = {}
+
+    def _answer(self, path, body):
+        time.sleep(self.slow.get(path, 0))
+        if path in self.down:
+            return 503, {"status": False, "error": "unavailable"}
+        version = path.split("/")[2]
+        txn = {"txnid": body.get("txnid"), "status": self.txn_status, "easebuzz_id": "EZ" + body.get("txnid", ""), "api": version}
+        return 200, {"status": True, "data": txn}
+
+    def _retrieve_v2(self, query, body):
+        return self._answer("/transaction/v2/retrieve", body)
+
+    def _retrieve_v1(self, query, body):
+        return self._answer("/transaction/v1/retrieve", body)
+
+    routes = {
+        ("POST", "/transaction/v2/retrieve"): _retrieve_v2,
+        ("POST", "/transaction/v1/retrieve"): _retrieve_v1,
+    }
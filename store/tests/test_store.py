@@ -0,0 +1,1314 @@
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Sum
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from addon.models import SiteConfiguration
+from order import models as order_models
+from order.context_processors import global_context
+from store import models as store_models
+from store.carts import GUEST_CART_KEY, DatabaseCartStorage, GuestCart, cart_for_request, get_cart_storage
+from store.checkout import cart_lines, create_order_from_cart
+from store.coupons import _claim_use, _entry_timeout, apply_coupon_to_order, cached_coupon
+from store.home import CATEGORY_SECTIONS, HOME_SECTIONS, PRODUCT_SECTIONS, SECTION_BUILDERS, section_versions
+from store.sales import rebuild_sales_stats, record_paid_order
+from store.search import (
+    InvertedIndexBackend, OrmSearchBackend, compact_search_changes, fts_available, request_full_reindex,
+)
+from store.shoppage import _suggest_state, suggest
+from store.variants import resolve_variant
+from payments.views import _easebuzz_txn_status
+from store.integrations import shiprocket_client
+from store.shiprocket import (
+    CACHE_KEY, QUOTE_KEY, ShiprocketError, _get_token, create_shiprocket_order, get_serviceability_and_rates,
+    quote_rates,
+)
+from store.tests.stubs import StubEasebuzz, StubShiprocket
+from store.stock import (
+    InsufficientStock, commit_order_stock, release_abandoned_checkouts, release_expired_holds, release_order_stock,
+)
+from userauths import models as userauths_models
+
+
+class ProductListApiQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        vendor = userauths_models.User.objects.create_user(
+            email="vendor@example.com", username="vendor", password="x",
+            role=userauths_models.User.Role.VENDOR,
+        )
+        userauths_models.VendorProfile.objects.create(
+            user=vendor, business_name="Vendor Co", contact_email="shop@example.com",
+            business_phone="000", business_address="Somewhere",
+        )
+        buyer = userauths_models.User.objects.create_user(
+            email="buyer@example.com", username="buyer", password="x",
+        )
+        category = store_models.Category.objects.create(name="Gadgets")
+
+        for i in range(30):
+            product = store_models.Product.objects.create(
+                vendor=vendor, category=category, name=f"Gadget {i}",
+                description="<p>Gadget</p>", status=store_models.Product.ProductStatus.PUBLISHED,
+            )
+            for n, primary in enumerate((True, False)):
+                store_models.ProductVariation.objects.create(
+                    product=product, sku=f"SKU-{i}-{n}", is_primary=primary,
+                    sale_price=Decimal("10.00") + i, regular_price=Decimal("15.00") + i,
+                    stock_quantity=5, weight=1, length=1, height=1, width=1,
+                )
+            store_models.ProductImage.objects.create(product=product, image="product_images/x.png", is_primary=True)
+            store_models.ProductReview.objects.create(product=product, user=buyer, rating=(i % 5) + 1)
+
+    def _query_count(self, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("store:product_list_api"), params)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.json()
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        small, small_data = self._query_count(page_size=1)
+        large, large_data = self._query_count(page_size=30)
+
+        self.assertEqual(len(small_data["items"]), 1)
+        self.assertEqual(len(large_data["items"]), 30)
+        self.assertEqual(small, large)
+
+    def test_items_carry_primary_variation_rating_and_vendor(self):
+        _, data = self._query_count(page_size=30, sort="price_low")
+        item = data["items"][0]
+
+        self.assertEqual(item["name"], "Gadget 0")
+        self.assertEqual(item["vendor_name"], "Vendor Co")
+        self.assertEqual(item["primary"]["sale_price"], 10.0)
+        self.assertEqual(item["reviews_count"], 1)
+        self.assertEqual(item["average_rating_int"], 1)
+        self.assertTrue(item["image_url"].endswith("product_images/x.png"))
+
+    def test_cursor_pages_cover_every_product_once_for_each_sort(self):
+        for sort in ("newest", "price_low", "price_high", "rating", "popular"):
+            seen, cursor = [], ""
+            while True:
+                response = self.client.get(
+                    reverse("store:product_list_api"), {"sort": sort, "cursor": cursor, "page_size": 7}
+                )
+                data = response.json()
+                self.assertNotIn("total", data)
+                seen += [item["id"] for item in data["items"]]
+                if not data["has_more"]:
+                    break
+                cursor = data["next_cursor"]
+            self.assertEqual(len(seen), 30, sort)
+            self.assertEqual(len(set(seen)), 30, sort)
+
+    def test_cursor_from_another_sort_is_rejected(self):
+        first = self.client.get(reverse("store:product_list_api"), {"sort": "newest", "cursor": "", "page_size": 5})
+        response = self.client.get(
+            reverse("store:product_list_api"), {"sort": "rating", "cursor": first.json()["next_cursor"]}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class InvertedIndexTests(TestCase):
+    def setUp(self):
+        self.vendor = userauths_models.User.objects.create_user(
+            email="idx@example.com", username="idx", password="x",
+            role=userauths_models.User.Role.VENDOR,
+        )
+        self.kitchen = store_models.Category.objects.create(name="Kitchen")
+        self.sets = self._product("Ceramic Tea Set", category=self.kitchen, sku="TEA-SET")
+        self.towel = self._product("Tea Towel", description="<p>Cotton &amp; linen</p>", sku="TOW-1")
+        self.cup = self._product("Cup", description="Pairs with any teapot", category=self.kitchen, sku="CUP-1")
+        self.backend = InvertedIndexBackend()
+        self.backend.build_in_background = False
+
+    def _product(self, name, description="", category=None, sku=""):
+        product = store_models.Product.objects.create(
+            vendor=self.vendor, name=name, description=description or name, category=category,
+            status=store_models.Product.ProductStatus.PUBLISHED,
+        )
+        store_models.ProductVariation.objects.create(
+            product=product, sku=sku, sale_price=Decimal("5.00"), regular_price=Decimal("5.00"),
+            stock_quantity=1, weight=1, length=1, height=1, width=1,
+        )
+        return product
+
+    def test_terms_match_within_words_and_all_must_match(self):
+        self.assertEqual(set(self.backend.search("tea")), {self.sets.pk, self.towel.pk, self.cup.pk})
+        self.assertEqual(self.backend.search("linen"), [self.towel.pk])
+        self.assertEqual(self.backend.search("tow-1"), [self.towel.pk])
+        self.assertEqual(self.backend.search("kitchen cup"), [self.cup.pk])
+        self.assertEqual(self.backend.search("tea linen"), [self.towel.pk])
+        self.assertEqual(self.backend.search("espresso"), [])
+
+    def test_ranking_prefers_name_then_sku_then_category(self):
+        # Name and SKU (5), name (3), then the description-only hit (0).
+        self.assertEqual(self.backend.search("tea"), [self.sets.pk, self.towel.pk, self.cup.pk])
+        self.assertEqual(self.backend.search("cup"), [self.cup.pk])
+        # Equal category hits: the most recently updated first.
+        self.assertEqual(self.backend.search("kitchen"), [self.cup.pk, self.sets.pk])
+
+    def test_committed_changes_reach_every_process(self):
+        other = InvertedIndexBackend()
+        other.build_in_background = False
+        self.backend.search("tea")
+        other.search("tea")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            mug = self._product("Tea Mug", sku="MUG-1")
+            self.kitchen.name = "Pantry"
+            self.kitchen.save()
+        for backend in (self.backend, other):
+            self.assertIn(mug.pk, backend.search("mug"))
+            self.assertEqual(set(backend.search("pantry")), {self.sets.pk, self.cup.pk})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kitchen.delete()
+            self.towel.delete()
+        for backend in (self.backend, other):
+            self.assertEqual(backend.search("pantry"), [])
+            self.assertNotIn(self.towel.pk, backend.search("tea"))
+
+    def test_full_rebuild_is_requested_through_the_log(self):
+        self.backend.search("tea")
+        store_models.Product.objects.filter(pk=self.cup.pk).update(name="Beaker")  # no signal
+        self.assertEqual(self.backend.search("beaker"), [])
+        request_full_reindex()
+        self.assertEqual(self.backend.search("beaker"), [self.cup.pk])
+        self.assertEqual(store_models.SearchIndexChange.objects.count(), 1)
+
+    def test_compacting_the_log_keeps_lagging_processes_correct(self):
+        self.backend.search("tea")
+        with self.captureOnCommitCallbacks(execute=True):
+            mugs = [self._product(f"Tea Mug {n}", sku=f"MUG-{n}") for n in range(4)]
+        logged = store_models.SearchIndexChange.objects.count()
+        self.assertGreater(logged, 2)
+        self.assertEqual(compact_search_changes(keep=2), logged - 2)
+        self.assertEqual(store_models.SearchIndexChange.objects.count(), 2)
+        # This index applied none of the folded rows; the kept row carries them all.
+        self.assertEqual({m.pk for m in mugs}, set(self.backend.search("mug")))
+
+    def test_first_search_answers_from_the_orm_while_the_index_builds(self):
+        backend = InvertedIndexBackend()
+        backend.warm = lambda: None  # the background build has not finished yet
+        self.assertEqual(set(backend.search("tea")), set(OrmSearchBackend().search("tea")))
+        self.assertEqual(backend._docs, {})
+
+
+class FtsSearchTests(TestCase):
+    def setUp(self):
+        if not fts_available():
+            self.skipTest("SQLite without FTS5")
+        self.vendor = userauths_models.User.objects.create_user(
+            email="fts@example.com", username="fts", password="x",
+            role=userauths_models.User.Role.VENDOR,
+        )
+
+    def _product(self, name, description):
+        product = store_models.Product.objects.create(
+            vendor=self.vendor, name=name, description=description,
+            status=store_models.Product.ProductStatus.PUBLISHED,
+        )
+        store_models.ProductVariation.objects.create(
+            product=product, sku=f"FTS-{product.pk}", is_primary=True,
+            sale_price=Decimal("5.00"), regular_price=Decimal("5.00"),
+            stock_quantity=1, weight=1, length=1, height=1, width=1,
+        )
+        return product
+
+    def _ids(self, q, sort="relevance"):
+        response = self.client.get(reverse("store:product_list_api"), {"q": q, "sort": sort})
+        return [item["id"] for item in response.json()["items"]]
+
+    def test_index_follows_save_unpublish_and_delete(self):
+        lamp = self._product("Brass Lamp", "<p>Warm light</p>")
+        self.assertEqual(self._ids("brass"), [lamp.pk])
+        self.assertEqual(self._ids("warm"), [lamp.pk])
+
+        lamp.name = "Copper Lamp"
+        lamp.save()
+        self.assertEqual(self._ids("brass"), [])
+        self.assertEqual(self._ids("copp"), [lamp.pk])
+
+        lamp.status = store_models.Product.ProductStatus.DRAFT
+        lamp.save()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM store_product_fts WHERE rowid = %s", [lamp.pk])
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+        lamp.status = store_models.Product.ProductStatus.PUBLISHED
+        lamp.save()
+        self.assertEqual(self._ids("copper"), [lamp.pk])
+        lamp.delete()
+        self.assertEqual(self._ids("copper"), [])
+
+    def test_category_rename_and_delete_rewrite_rows(self):
+        category = store_models.Category.objects.create(name="Outdoor")
+        bench = self._product("Bench", "Teak")
+        bench.category = category
+        bench.save()
+        self.assertEqual(self._ids("outdoor"), [bench.pk])
+
+        category.name = "Garden"
+        category.save()
+        self.assertEqual(self._ids("outdoor"), [])
+        self.assertEqual(self._ids("garden"), [bench.pk])
+
+        category.delete()
+        self.assertEqual(self._ids("garden"), [])
+        self.assertEqual(self._ids("teak"), [bench.pk])
+
+    def test_best_match_puts_name_hits_first(self):
+        named = self._product("Walnut Desk", "A sturdy desk")
+        described = self._product("Side Table", "Goes well with a walnut finish and a lamp")
+        self.assertEqual(self._ids("walnut"), [named.pk, described.pk])
+        self.assertEqual(self._ids("walnut", sort="newest"), [described.pk, named.pk])
+        self.assertEqual(self._ids("sturdy walnut"), [named.pk, described.pk])
+
+
+class SuggestionTests(TestCase):
+    def setUp(self):
+        vendor = userauths_models.User.objects.create_user(
+            email="sugg@example.com", username="sugg", password="x",
+            role=userauths_models.User.Role.VENDOR,
+        )
+        for name in ("Wireless Noise Cancelling Headphones", "Wired Earbuds", "Bluetooth Speaker", "Desk Lamp"):
+            store_models.Product.objects.create(
+                vendor=vendor, name=name, description=name,
+                status=store_models.Product.ProductStatus.PUBLISHED,
+            )
+        store_models.Category.objects.create(name="Headphones", slug="headphones")
+        _suggest_state["vocab"] = None
+
+    def _texts(self, q, **kwargs):
+        return [s["text"] for s in suggest(q, **kwargs)]
+
+    def test_typos_rank_the_intended_name_first(self):
+        self.assertEqual(self._texts("wirless headphnes")[0], "Wireless Noise Cancelling Headphones")
+        self.assertEqual(self._texts("bluetoth speker")[0], "Bluetooth Speaker")
+        # One misspelt word of a long name is enough.
+        self.assertIn("Wireless Noise Cancelling Headphones", self._texts("canceling"))
+
+    def test_scores_are_ordered_and_cut_off(self):
+        results = suggest("headphone")
+        self.assertEqual([r["text"] for r in results][:2], ["Headphones", "Wireless Noise Cancelling Headphones"])
+        self.assertEqual(results[0]["kind"], "category")
+        scores = [r["score"] for r in results]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertTrue(all(score >= 0.6 for score in scores))
+        self.assertNotIn("Desk Lamp", [r["text"] for r in results])
+
+        self.assertEqual(len(suggest("wire", limit=1)), 1)
+        self.assertEqual(suggest("zzzzqqq"), [])
+        # An exact name is not suggested back to the user.
+        self.assertNotIn("Desk Lamp", self._texts("desk lamp"))
+
+
+class CardSnapshotTests(TestCase):
+    def setUp(self):
+        vendor = userauths_models.User.objects.create_user(
+            email="cards@example.com", username="cards", password="x",
+            role=userauths_models.User.Role.VENDOR,
+        )
+        self.product = store_models.Product.objects.create(
+            vendor=vendor, name="Kettle", description="Kettle",
+            status=store_models.Product.ProductStatus.PUBLISHED,
+        )
+
+    def _variation(self, **kwargs):
+        fields = dict(
+            product=self.product, sku="KET-1", is_primary=True,
+            sale_price=Decimal("30.00"), regular_price=Decimal("40.00"),
+            stock_quantity=3, weight=1, length=1, height=1, width=1,
+        )
+        return store_models.ProductVariation.objects.create(**{**fields, **kwargs})
+
+    def test_snapshot_is_refreshed_when_the_write_commits(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            variation = self._variation()
+            self.assertFalse(store_models.ProductCardSnapshot.objects.filter(product=self.product).exists())
+        card = store_models.ProductCardSnapshot.objects.get(product=self.product)
+        self.assertEqual((card.variation_id, card.sale_price, card.in_stock), (variation.pk, Decimal("30.00"), True))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            variation.sale_price, variation.stock_quantity = Decimal("25.00"), 0
+            variation.save()
+        card.refresh_from_db()
+        self.assertEqual((card.sale_price, card.in_stock), (Decimal("25.00"), False))
+
+    def test_deals_build_missing_snapshots(self):
+        self._variation()
+        self.assertFalse(store_models.ProductCardSnapshot.objects.exists())
+
+        (deal,) = SECTION_BUILDERS["deals"]()
+        self.assertEqual(deal.product.card.sale_price, Decimal("30.00"))
+        self.assertTrue(store_models.ProductCardSnapshot.objects.filter(product=self.product).exists())
+
+
+class HomeSectionCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Templates read the branding images unconditionally; a name is enough for .url.
+        SiteConfiguration.objects.update_or_create(pk=1, defaults={
+            "site_logo": "branding/t.png", "login_logo": "branding/t.png", "favicon": "branding/t.png",
+        })
+        vendor = userauths_models.User.objects.create_user(
+            email="home@example.com", username="home", password="x",
+            role=userauths_models.User.Role.VENDOR,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category = store_models.Category.objects.create(name="Decor", featured=True)
+            self.product = store_models.Product.objects.create(
+                vendor=vendor, name="Linen Cushion", description="Cushion", category=self.category,
+                status=store_models.Product.ProductStatus.PUBLISHED,
+            )
+
+    def test_writes_bump_only_the_sections_they_feed(self):
+        before = section_versions()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = "Wool Cushion"
+            self.product.save()
+        after_product = section_versions()
+        for name in PRODUCT_SECTIONS:
+            self.assertGreater(after_product[name], before[name], name)
+        for name in CATEGORY_SECTIONS:
+            self.assertEqual(after_product[name], before[name], name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = "Home Decor"
+            self.category.save()
+        after_category = section_versions()
+        for name in HOME_SECTIONS:
+            self.assertGreater(after_category[name], after_product[name], name)
+
+    def test_product_counts_move_the_categories_section(self):
+        other = store_models.Category.objects.create(name="Garden", featured=True)
+        versions = [section_versions()["categories"]]
+        with self.captureOnCommitCallbacks(execute=True):
+            extra = store_models.Product.objects.create(
+                vendor=self.product.vendor, name="Throw", description="Throw", category=self.category,
+            )
+        versions.append(section_versions()["categories"])
+        with self.captureOnCommitCallbacks(execute=True):
+            extra.category = other
+            extra.save()
+        versions.append(section_versions()["categories"])
+        with self.captureOnCommitCallbacks(execute=True):
+            extra.delete()
+        versions.append(section_versions()["categories"])
+        # Created, moved, deleted: each bumps the section once more.
+        self.assertEqual(versions, sorted(set(versions)))
+        self.assertEqual(len(versions), 4)
+
+    def test_fragment_is_served_from_cache_until_its_version_moves(self):
+        url = reverse("store:index")
+        self.assertContains(self.client.get(url), "Linen Cushion")
+
+        # A write that skips the signals leaves the cached fragment in place.
+        store_models.Product.objects.filter(pk=self.product.pk).update(name="Velvet Cushion")
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertContains(response, "Linen Cushion")
+        self.assertNotContains(response, "Velvet Cushion")
+        self.assertFalse([q for q in ctx.captured_queries if "store_product" in q["sql"]])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.refresh_from_db()
+            self.product.save()
+        response = self.client.get(url)
+        self.assertContains(response, "Velvet Cushion")
+        self.assertNotContains(response, "Linen Cushion")
+
+
+class SalesStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = userauths_models.User.objects.create_user(
+            email="seller@example.com", username="seller", password="x",
+            role=userauths_models.User.Role.VENDOR,
+        )
+        cls.buyer = userauths_models.User.objects.create_user(
+            email="payer@example.com", username="payer", password="x",
+        )
+        cls.product = store_models.Product.objects.create(
+            vendor=cls.vendor, name="Lamp", description="Lamp",
+            status=store_models.Product.ProductStatus.PUBLISHED,
+        )
+        cls.variations = [
+            store_models.ProductVariation.objects.create(
+                product=cls.product, sku=f"LAMP-{n}", is_primary=(n == 0),
+                sale_price=Decimal("20.00"), regular_price=Decimal("25.00"),
+                stock_quantity=10, weight=1, length=1, height=1, width=1,
+            )
+            for n in range(2)
+        ]
+
+    def _order(self, *lines, status="PAID"):
+        order = order_models.Order(buyer=self.buyer, payment_status=status)
+        order.set_order_id_if_missing()
+        order.save()
+        for variation, qty, price in lines:
+            order_models.OrderItem.objects.create(
+                order=order, product_variation=variation, vendor=self.vendor,
+                quantity=qty, price=Decimal(price),
+            )
+        return order
+
+    def test_paid_order_is_counted_once(self):
+        order = self._order((self.variations[0], 2, "20.00"), (self.variations[1], 1, "18.50"))
+
+        self.assertTrue(record_paid_order(order))
+        self.assertFalse(record_paid_order(order))
+
+        stats = store_models.ProductSalesStats.objects.get(product=self.product)
+        self.assertEqual(stats.units_sold, 3)
+        self.assertEqual(stats.revenue, Decimal("58.50"))
+        self.assertIsNotNone(stats.last_sold_at)
+        self.assertEqual(
+            store_models.VariationSalesStats.objects.get(variation=self.variations[1]).units_sold, 1
+        )
+
+    def test_rebuild_matches_incremental_counts(self):
+        for qty in (1, 4):
+            record_paid_order(self._order((self.variations[0], qty, "20.00")))
+        self._order((self.variations[0], 7, "20.00"), status="FAILED")
+        before = store_models.ProductSalesStats.objects.values_list("units_sold", "revenue").get()
+
+        self.assertEqual(rebuild_sales_stats(), (1, 1))
+        self.assertEqual(store_models.ProductSalesStats.objects.values_list("units_sold", "revenue").get(), before)
+        self.assertEqual(before, (5, Decimal("100.00")))
+
+    def test_cancelled_or_refunded_orders_leave_the_counters(self):
+        kept = self._order((self.variations[0], 1, "20.00"))
+        refunded = self._order((self.variations[0], 2, "20.00"), (self.variations[1], 1, "18.50"))
+        record_paid_order(kept)
+        record_paid_order(refunded)
+        sold_at = store_models.ProductSalesStats.objects.get().last_sold_at
+
+        refunded.status = order_models.Order.OrderStatus.REFUNDED
+        refunded.save()
+        refunded.save()
+        stats = store_models.ProductSalesStats.objects.get()
+        self.assertEqual((stats.units_sold, stats.revenue, stats.last_sold_at), (1, Decimal("20.00"), sold_at))
+        self.assertEqual(store_models.VariationSalesStats.objects.get(variation=self.variations[1]).units_sold, 0)
+
+        rebuild_sales_stats()
+        self.assertEqual(store_models.ProductSalesStats.objects.values_list("units_sold", "revenue").get(), (1, Decimal("20.00")))
+
+    def test_one_update_per_table_and_last_sold_is_the_payment_time(self):
+        order = self._order((self.variations[0], 2, "20.00"), (self.variations[1], 1, "18.50"))
+        with CaptureQueriesContext(connection) as ctx:
+            record_paid_order(order)
+        updates = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 3)  # the claim, then one per counter table
+
+        order.refresh_from_db()
+        paid_at = order.paid_at
+        self.assertEqual(store_models.ProductSalesStats.objects.get().last_sold_at, paid_at)
+
+        # Editing the order later must not move last_sold_at on a rebuild.
+        order.courier_name = "Later"
+        order.save()
+        rebuild_sales_stats()
+        self.assertEqual(store_models.ProductSalesStats.objects.get().last_sold_at, paid_at)
+        self.assertEqual(
+            store_models.VariationSalesStats.objects.get(variation=self.variations[1]).revenue, Decimal("18.50")
+        )
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.vendor = userauths_models.User.objects.create_user(
+            email="maker@example.com", username="maker", password="x",
+            role=userauths_models.User.Role.VENDOR,
+        )
+        self.profile = userauths_models.VendorProfile.objects.create(
+            user=self.vendor, business_name="Maker", contact_email="maker-shop@example.com",
+            business_phone="000", business_address="Somewhere",
+        )
+        self.product = store_models.Product.objects.create(vendor=self.vendor, name="Mug", description="Mug")
+        self.users = [
+            userauths_models.User.objects.create_user(email=f"r{i}@example.com", username=f"r{i}", password="x")
+            for i in range(3)
+        ]
+
+    def _assert_matches_reviews(self):
+        self.product.refresh_from_db()
+        self.profile.refresh_from_db()
+        ratings = list(self.product.reviews.values_list("rating", flat=True))
+        self.assertEqual(self.product.rating_count, len(ratings))
+        self.assertEqual(self.product.rating_sum, sum(ratings))
+        self.assertEqual(self.product.rating_histogram(), {n: ratings.count(n) for n in range(5, 0, -1)})
+        expected_avg = Decimal(sum(ratings)) / len(ratings) if ratings else Decimal("0")
+        self.assertEqual(self.product.rating_avg, expected_avg.quantize(Decimal("0.01")))
+        self.assertEqual((self.profile.rating_sum, self.profile.rating_count), (sum(ratings), len(ratings)))
+
+    def test_create_update_and_delete_keep_aggregates_exact(self):
+        for user, rating in zip(self.users, (5, 4, 2)):
+            store_models.ProductReview.objects.update_or_create(
+                product=self.product, user=user, defaults={"rating": rating}
+            )
+        self._assert_matches_reviews()
+
+        store_models.ProductReview.objects.update_or_create(
+            product=self.product, user=self.users[2], defaults={"rating": 3}
+        )
+        self._assert_matches_reviews()
+
+        store_models.ProductReview.objects.get(user=self.users[0]).delete()
+        self._assert_matches_reviews()
+
+        store_models.ProductReview.objects.all().delete()
+        self._assert_matches_reviews()
+
+    def test_average_is_stored_rounded(self):
+        for user, rating in zip(self.users, (5, 4, 2)):
+            store_models.ProductReview.objects.create(product=self.product, user=user, rating=rating)
+        products = store_models.Product.objects.filter(pk=self.product.pk)
+        self.assertEqual(products.values_list("rating_avg", flat=True).get(), Decimal("3.67"))
+        # The stored value is what filters and cursors compare against.
+        self.assertEqual(products.filter(rating_avg=Decimal("3.67")).count(), 1)
+        self.assertEqual(products.filter(rating_avg__lt=Decimal("3.67")).count(), 0)
+        self.assertEqual(products.filter(rating_avg__gte=Decimal("3.67")).count(), 1)
+        self.assertEqual(
+            userauths_models.VendorProfile.objects.filter(pk=self.profile.pk, rating_avg=Decimal("3.67")).count(), 1
+        )
+
+    def test_full_saves_leave_the_aggregates_alone(self):
+        product = store_models.Product.objects.get(pk=self.product.pk)
+        profile = userauths_models.VendorProfile.objects.get(pk=self.profile.pk)
+        # A review lands while the vendor is editing.
+        store_models.ProductReview.objects.create(product=self.product, user=self.users[0], rating=4)
+        product.name = "Big Mug"
+        product.save()
+        profile.business_name = "Maker & Co"
+        profile.save()
+
+        self._assert_matches_reviews()
+        self.assertEqual((self.product.name, self.profile.business_name), ("Big Mug", "Maker & Co"))
+
+    def test_full_saves_of_partial_or_deleted_rows_behave_like_plain_saves(self):
+        product = store_models.Product.objects.only("id", "name").get(pk=self.product.pk)
+        product.name = "Tall Mug"
+        with CaptureQueriesContext(connection) as ctx:
+            product.save()
+        update = next(q["sql"] for q in ctx.captured_queries if q["sql"].startswith("UPDATE"))
+        self.assertIn('"name"', update)
+        self.assertNotIn('"status"', update)
+
+        profile = userauths_models.VendorProfile.objects.get(pk=self.profile.pk)
+        userauths_models.VendorProfile.objects.filter(pk=profile.pk).delete()
+        profile.save()
+        self.assertTrue(userauths_models.VendorProfile.objects.filter(pk=profile.pk).exists())
+
+
+class CheckoutServiceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = userauths_models.User.objects.create_user(
+            email="stall@example.com", username="stall", password="x",
+            role=userauths_models.User.Role.VENDOR,
+        )
+        product = store_models.Product.objects.create(
+            vendor=cls.vendor, name="Tee", description="Tee",
+            status=store_models.Product.ProductStatus.PUBLISHED,
+        )
+        size = store_models.VariationCategory.objects.create(vendor=cls.vendor, name="Size")
+        cls.value = store_models.VariationValue.objects.create(category=size, value="M")
+        cls.variations = [
+            store_models.ProductVariation.objects.create(
+                product=product, sku=f"TEE-{n}", sale_price=Decimal("12.50"), regular_price=Decimal("15.00"),
+                shipping_price=Decimal("1.00"), stock_quantity=10, weight=1, length=1, height=1, width=1,
+            )
+            for n in range(8)
+        ]
+
+    def _checkout(self, email, lines):
+        user = userauths_models.User.objects.create_user(email=email, username=email, password="x")
+        userauths_models.Address.objects.create(
+            profile=user.profile, address_type=userauths_models.Address.AddressType.SHIPPING,
+            street_address="1 Road", city="Pune", state="MH", postal_code="411001", country="IN",
+            is_default=True,
+        )
+        cart = order_models.Cart.objects.create(user=user)
+        for variation in self.variations[:lines]:
+            item = order_models.CartItem.objects.create(
+                cart=cart, product_variation=variation, quantity=2, price=variation.sale_price,
+            )
+            item.variation_values.add(self.value)
+
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("store:checkout_start"))
+        self.assertEqual(response.status_code, 302)
+        return len(ctx.captured_queries), order_models.Order.objects.get(buyer=user)
+
+    def test_query_count_grows_only_by_one_stock_update_per_variation(self):
+        small, _ = self._checkout("one@example.com", 1)
+        large, order = self._checkout("eight@example.com", 8)
+
+        # Only the stock holds scale: one conditional UPDATE per extra variation.
+        self.assertEqual(large - small, 7)
+        self.assertEqual(order.items.count(), 8)
+        self.assertEqual(order.item_total, Decimal("200.00"))
+        self.assertEqual(order.shipping_fee, Decimal("16.00"))
+        self.assertEqual(order.amount_payable, Decimal("216.00"))
+        item = order.items.get(product_variation=self.variations[3])
+        self.assertEqual(item.line_subtotal_net, Decimal("25.00"))
+        self.assertEqual(item.vendor, self.vendor)
+        self.assertEqual(list(item.variation_values.all()), [self.value])
+
+
+@override_settings(STORE_CART_BACKEND="store.carts.CacheCartStorage")
+class GuestCartTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        vendor = userauths_models.User.objects.create_user(
+            email="kiosk@example.com", username="kiosk", password="x",
+            role=userauths_models.User.Role.VENDOR,
+        )
+        product = store_models.Product.objects.create(
+            vendor=vendor, name="Mug", description="Mug", status=store_models.Product.ProductStatus.PUBLISHED,
+        )
+        colour = store_models.VariationCategory.objects.create(vendor=vendor, name="Colour")
+        self.value = store_models.VariationValue.objects.create(category=colour, value="Red")
+        self.variation = store_models.ProductVariation.objects.create(
+            product=product, sku="MUG-1", sale_price=Decimal("4.00"), regular_price=Decimal("6.00"),
+            stock_quantity=5, weight=1, length=1, height=1, width=1,
+        )
+        self.variation.variations.add(self.value)
+        self.buyer = userauths_models.User.objects.create_user(email="guest@example.com", username="guest", password="pw")
+
+    def _add(self, quantity):
+        return self.client.post(
+            reverse("store:cart_add"), {
+                "variation_id": self.variation.pk, "quantity": quantity,
+                "selected_value_ids": [self.value.pk], "selected_variations": {"Colour": "Red"},
+            }, content_type="application/json",
+        )
+
+    def test_guest_cart_lives_in_cache_until_login(self):
+        self.assertEqual(self._add(2).json()["cart"], {"item_count": 1, "quantity": 2, "total_amount": "8.00"})
+        self._add(1)
+        self.assertFalse(order_models.Cart.objects.exists())
+        self.assertFalse(order_models.CartItem.objects.exists())
+
+        response = self.client.post(
+            reverse("store:update_cart_item_qty"), {"cart_item_id": self.variation.pk, "quantity": 9},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            reverse("store:update_cart_item_qty"), {"cart_item_id": self.variation.pk, "quantity": 4},
+            content_type="application/json",
+        )
+        self.assertEqual(response.json()["cart_total"], "16.00")
+
+        guest_key = self.client.session.session_key
+        with override_settings(SEND_AUTH_EMAIL=False):
+            self.client.post(reverse("userauths:login"), {"email": "guest@example.com", "password": "pw"})
+        item = order_models.CartItem.objects.get(cart__user=self.buyer)
+        self.assertEqual((item.quantity, item.price), (4, Decimal("4.00")))
+        self.assertEqual(item.selected_variations_json, {"value_ids": [self.value.pk], "display": {"Colour": "Red"}})
+        self.assertFalse(order_models.Cart.objects.filter(user=None).exists())
+        self.assertIsNone(cache.get(GUEST_CART_KEY % guest_key))
+
+    def test_merge_reads_each_cart_once_and_clamps_to_stock(self):
+        others = [
+            store_models.ProductVariation.objects.create(
+                product=self.variation.product, sku=f"MUG-{n}", sale_price=Decimal("3.00"),
+                regular_price=Decimal("6.00"), stock_quantity=20, weight=1, length=1, height=1, width=1,
+            )
+            for n in range(2, 12)
+        ]
+        guest = GuestCart(get_cart_storage(), "guest-session")
+        guest.add_item(self.variation, quantity=4, value_ids=[self.value.pk], display={"Colour": "Red"})
+        for variation in others:
+            guest.add_item(variation, quantity=2)
+        cart = order_models.Cart.objects.create(user=self.buyer)
+        cart.items.create(product_variation=self.variation, quantity=3, price=Decimal("4.00"))
+
+        # Read the user's lines, load the guest's variations, INSERT lines, INSERT values, UPDATE (+ savepoint pair).
+        with self.assertNumQueries(7):
+            cart.merge_from(guest)
+
+        self.assertEqual(cart.items.count(), 11)
+        self.assertEqual(cart.items.get(product_variation=self.variation).quantity, 5)
+        self.assertEqual(cart.items.get(product_variation=others[0]).quantity, 2)
+        self.assertIsNone(get_cart_storage().get("guest-session"))
+
+    def test_merged_lines_keep_their_selected_values(self):
+        guest = GuestCart(get_cart_storage(), "guest-session")
+        guest.add_item(self.variation, quantity=1, value_ids=[self.value.pk], display={"Colour": "Red"})
+        cart = order_models.Cart.objects.create(user=self.buyer)
+        cart.merge_from(guest)
+
+        item = cart.items.get()
+        self.assertEqual(list(item.variation_values.all()), [self.value])
+        self.assertEqual(item.selected_variations_json["display"], {"Colour": "Red"})
+
+    def test_looking_up_a_missing_guest_cart_creates_nothing(self):
+        request = RequestFactory().get("/")
+        request.user = AnonymousUser()
+        request.session = SessionStore()
+        with self.assertNumQueries(0):
+            self.assertIsNone(cart_for_request(request, create=False))
+        self.assertIsNone(request.session.session_key)
+
+        cart = cart_for_request(request)
+        self.assertIsInstance(cart, GuestCart)
+        self.assertEqual((cart.item_count(), cart.total_amount()), (0, Decimal("0.00")))
+
+    def test_guest_cart_row_from_the_database_storage_is_adopted_on_login(self):
+        with override_settings(STORE_CART_BACKEND="store.carts.DatabaseCartStorage"):
+            self._add(2)
+        guest_key = self.client.session.session_key
+        self.assertTrue(order_models.Cart.objects.filter(session_key=guest_key, user=None).exists())
+
+        self._add(1)
+        with override_settings(SEND_AUTH_EMAIL=False):
+            self.client.post(reverse("userauths:login"), {"email": "guest@example.com", "password": "pw"})
+        item = order_models.CartItem.objects.get(cart__user=self.buyer)
+        self.assertEqual(item.quantity, 3)
+        self.assertFalse(order_models.Cart.objects.filter(user=None).exists())
+        self.assertIsNone(cache.get(GUEST_CART_KEY % guest_key))
+
+    def test_database_storage_is_the_default_without_a_shared_cache(self):
+        self.addCleanup(get_cart_storage.cache_clear)
+        with override_settings():
+            del settings.STORE_CART_BACKEND
+            get_cart_storage.cache_clear()
+            self.assertIsInstance(get_cart_storage(), DatabaseCartStorage)
+
+
+class HeaderSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        vendor = userauths_models.User.objects.create_user(
+            email="corner@example.com", username="corner", password="x",
+            role=userauths_models.User.Role.VENDOR,
+        )
+        self.product = store_models.Product.objects.create(
+            vendor=vendor, name="Pen", description="Pen", status=store_models.Product.ProductStatus.PUBLISHED,
+        )
+        self.variation = store_models.ProductVariation.objects.create(
+            product=self.product, sku="PEN-1", sale_price=Decimal("2.50"), regular_price=Decimal("3.00"),
+            stock_quantity=50, weight=1, length=1, height=1, width=1,
+        )
+        self.user = userauths_models.User.objects.create_user(email="writer@example.com", username="writer", password="x")
+        cart = order_models.Cart.objects.create(user=self.user)
+        cart.items.create(product_variation=self.variation, quantity=3, price=Decimal("2.50"))
+        self.client.force_login(self.user)
+
+    def _header(self):
+        request = RequestFactory().get("/")
+        request.user = self.user
+        request.session = self.client.session
+        return global_context(request)
+
+    def test_header_is_built_once_then_kept_current_by_the_writers(self):
+        header = self._header()
+        self.assertEqual((header["cart_item_count"], header["wishlist_count"]), (1, 0))
+        self.assertEqual(header["cart_summary"]["cart_subtotal"], Decimal("7.50"))
+        with self.assertNumQueries(0):
+            self._header()
+
+        response = self.client.post(
+            reverse("store:cart_add"), {"variation_id": self.variation.pk, "quantity": 2}, content_type="application/json",
+        )
+        self.assertEqual(response.json()["cart"], {"item_count": 1, "quantity": 5, "total_amount": "12.50"})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("customer:wishlist_toggle"), {"product_id": self.product.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("customer:wishlist_toggle"), {"variation_id": self.variation.pk})
+
+        with self.assertNumQueries(0):
+            header = self._header()
+        # Items on the wishlist, not wishlists.
+        self.assertEqual((header["cart_summary"]["cart_quantity"], header["wishlist_count"]), (5, 2))
+
+    @override_settings(STORE_SUMMARY_LOCAL_TIMEOUT=1)
+    def test_per_process_caches_do_not_keep_a_stale_count(self):
+        with self._worker("b"):
+            self.assertEqual(self._header()["cart_summary"]["cart_quantity"], 3)
+        with self._worker("a"):
+            self._header()
+            self.client.post(
+                reverse("store:cart_add"), {"variation_id": self.variation.pk, "quantity": 2},
+                content_type="application/json",
+            )
+            self.assertEqual(self._header()["cart_summary"]["cart_quantity"], 5)
+        # Worker b never saw the bump; its copy lapses within the local timeout.
+        time.sleep(1.1)
+        with self._worker("b"):
+            self.assertEqual(self._header()["cart_summary"]["cart_quantity"], 5)
+
+    def _worker(self, name):
+        # A web process of its own: a separate locmem store.
+        return override_settings(CACHES={"default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": f"summary-{name}",
+        }})
+
+
+class AddToCartTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        vendor = userauths_models.User.objects.create_user(
+            email="looms@example.com", username="looms", password="x",
+            role=userauths_models.User.Role.VENDOR,
+        )
+        self.product = store_models.Product.objects.create(
+            vendor=vendor, name="Scarf", description="Scarf", status=store_models.Product.ProductStatus.PUBLISHED,
+        )
+        size = store_models.VariationCategory.objects.create(vendor=vendor, name="Size")
+        colour = store_models.VariationCategory.objects.create(vendor=vendor, name="Colour")
+        self.values = {
+            name: store_models.VariationValue.objects.create(category=cat, value=name)
+            for cat, name in ((size, "S"), (size, "L"), (colour, "Blue"))
+        }
+        self.small, self.large = (
+            store_models.ProductVariation.objects.create(
+                product=self.product, sku=f"SCARF-{size}", sale_price=price, regular_price=Decimal("20.00"),
+                stock_quantity=10, is_primary=size == "S", weight=1, length=1, height=1, width=1,
+            )
+            for size, price in (("S", Decimal("10.00")), ("L", Decimal("12.00")))
+        )
+        self.small.variations.add(self.values["S"], self.values["Blue"])
+        self.large.variations.add(self.values["L"], self.values["Blue"])
+        self.user = userauths_models.User.objects.create_user(email="knit@example.com", username="knit", password="x")
+        self.client.force_login(self.user)
+
+    def _add(self, **payload):
+        return self.client.post(reverse("store:cart_add"), payload, content_type="application/json")
+
+    def test_selections_resolve_through_the_variant_map(self):
+        self.assertEqual(resolve_variant(self.product.pk, selections={"size": "l", "COLOUR": "blue"})[0], self.large.pk)
+        self.assertEqual(resolve_variant(self.product.pk, [self.values["L"].pk])[0], self.large.pk)
+        self.assertEqual(resolve_variant(self.product.pk)[0], self.small.pk)
+        self.assertEqual(resolve_variant(self.product.pk, selections={"Size": "XL"}), (None, []))
+
+        response = self._add(product_id=self.product.pk, selected_variations={"Size": "L", "Colour": "Blue"}, quantity=2)
+        item = order_models.CartItem.objects.get()
+        self.assertEqual(item.product_variation, self.large)
+        self.assertEqual(sorted(item.value_ids), sorted([self.values["L"].pk, self.values["Blue"].pk]))
+        self.assertEqual(response.json()["cart"], {"item_count": 1, "quantity": 2, "total_amount": "24.00"})
+
+    def test_repeat_adds_shift_the_cached_totals(self):
+        global_context(self._request())
+        self._add(variation_id=self.small.pk, quantity=1)
+        self._add(variation_id=self.large.pk, quantity=1)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self._add(variation_id=self.small.pk, quantity=2)
+        self.assertEqual(response.json()["cart"], {"item_count": 2, "quantity": 4, "total_amount": "42.00"})
+        self.assertEqual(order_models.Cart.objects.get().summary()["cart_subtotal"], Decimal("42.00"))
+        writes = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith(("INSERT", "UPDATE"))]
+        self.assertEqual(len(writes), 1)
+        self.assertFalse(any("SUM(" in q["sql"] or "COUNT(" in q["sql"] for q in ctx.captured_queries))
+
+    def test_variation_edits_drop_the_map(self):
+        self.assertEqual(resolve_variant(self.product.pk, selections={"Size": "L"})[0], self.large.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.large.is_active = False
+            self.large.save()
+        self.assertEqual(resolve_variant(self.product.pk, selections={"Size": "L"}), (None, []))
+
+    def test_a_stale_map_does_not_decide_the_line_values(self):
+        resolve_variant(self.product.pk)
+        # Another worker swaps the sizes; this process's map never hears of it.
+        Through = store_models.ProductVariation.variations.through
+        Through.objects.filter(variationvalue__in=[self.values["S"], self.values["L"]]).delete()
+        Through.objects.bulk_create([
+            Through(productvariation=self.small, variationvalue=self.values["L"]),
+            Through(productvariation=self.large, variationvalue=self.values["S"]),
+        ])
+
+        self._add(variation_id=self.large.pk, quantity=1)
+        item = order_models.CartItem.objects.get(product_variation=self.large)
+        self.assertEqual(sorted(item.value_ids), sorted([self.values["S"].pk, self.values["Blue"].pk]))
+
+        self._add(product_id=self.product.pk, selected_variations={"Size": "L", "Colour": "Blue"}, quantity=1)
+        item = order_models.CartItem.objects.get(product_variation=self.small)
+        self.assertEqual(sorted(item.value_ids), sorted([self.values["L"].pk, self.values["Blue"].pk]))
+
+    def _request(self):
+        request = RequestFactory().get("/")
+        request.user = self.user
+        request.session = self.client.session
+        return request
+
+
+@override_settings(STORE_HTTP_BACKOFF=0)
+class ShippingQuoteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _age(self, pickup, delivery, bucket, seconds):
+        key = QUOTE_KEY % (pickup, delivery, bucket, 0)
+        entry = cache.get(key)
+        entry["fetched_at"] -= seconds
+        cache.set(key, entry)
+
+    def test_quotes_are_cached_per_route_and_weight_band(self):
+        with StubShiprocket() as stub, override_settings(SHIPROCKET_API_BASE=stub.base_url):
+            rates = quote_rates("110001", "411001", 1.2)
+            self.assertEqual(rates["data"]["available_courier_companies"][0]["courier_name"], "Shiprocket Surface")
+            quote_rates("110001", "411001", 1.4)
+            self.assertEqual(stub.hits("/courier/serviceability/"), 1)
+            self.assertEqual(stub.calls[-1][2]["weight"], "1.5")
+
+            quote_rates("110001", "411001", 1.6)
+            quote_rates("110001", "560001", 1.2)
+            self.assertEqual(stub.hits("/courier/serviceability/"), 3)
+            self.assertEqual(stub.hits("/auth/login"), 1)
+
+    @override_settings(STORE_SHIPPING_QUOTE_BACKGROUND=False)
+    def test_stale_quotes_are_served_while_revalidating(self):
+        with StubShiprocket() as stub, override_settings(SHIPROCKET_API_BASE=stub.base_url):
+            quote_rates("110001", "411001", 0.3)
+            self._age("110001", "411001", "0.5", 3600)
+            stub.rates = [{"courier_name": "Cheaper Surface", "rate": 30.0}]
+
+            stale = quote_rates("110001", "411001", 0.3)
+            self.assertEqual(stale["data"]["available_courier_companies"][0]["courier_name"], "Shiprocket Surface")
+            fresh = quote_rates("110001", "411001", 0.3)
+            self.assertEqual(fresh["data"]["available_courier_companies"][0]["courier_name"], "Cheaper Surface")
+            self.assertEqual(stub.hits("/courier/serviceability/"), 2)
+
+            self._age("110001", "411001", "0.5", 3600)
+            stub.status = 502
+            with self.assertLogs("store.shiprocket", "WARNING"):
+                self.assertEqual(quote_rates("110001", "411001", 0.3), fresh)
+            with self.assertRaises(ShiprocketError):
+                quote_rates("110001", "999999", 0.3)
+
+
+@override_settings(STORE_HTTP_BACKOFF=0, STORE_HTTP_RETRIES=2)
+class IntegrationClientTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        shiprocket_client.reset_metrics()
+
+    def test_token_refresh_is_single_flight_and_connections_are_reused(self):
+        with StubShiprocket() as stub, override_settings(SHIPROCKET_API_BASE=stub.base_url):
+            threads = [threading.Thread(target=_get_token) for _ in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(stub.hits("/auth/login"), 1)
+            self.assertEqual(cache.get(CACHE_KEY), "stub-token")
+
+            for _ in range(3):
+                get_serviceability_and_rates("110001", "411001", 1)
+            self.assertEqual(len(set(stub.peers[-3:])), 1)
+            self.assertEqual(shiprocket_client.metrics()["courier.serviceability"]["count"], 3)
+
+    def test_only_idempotent_calls_are_retried(self):
+        with StubShiprocket() as stub, override_settings(SHIPROCKET_API_BASE=stub.base_url):
+            _get_token()
+            stub.status = 503
+            with self.assertRaises(ShiprocketError):
+                get_serviceability_and_rates("110001", "411001", 1)
+            self.assertEqual(stub.hits("/courier/serviceability/"), 3)
+            self.assertEqual(shiprocket_client.metrics()["courier.serviceability"]["outcomes"], {"503": 3})
+
+            with self.assertRaises(ShiprocketError):
+                create_shiprocket_order({"order_id": "X1"})
+            self.assertEqual(stub.hits("/orders/create/adhoc"), 1)
+
+    def test_easebuzz_status_falls_back_to_v1_when_v2_is_down(self):
+        with StubEasebuzz() as stub, override_settings(EASEBUZZ_API_BASE=stub.base_url):
+            self.assertEqual(_easebuzz_txn_status("T1")["data"]["api"], "v2")
+            self.assertEqual(stub.hits("/transaction/v1/retrieve"), 0)
+
+            stub.down.add("/transaction/v2/retrieve")
+            with self.assertLogs("payments.views", "INFO"):
+                answer = _easebuzz_txn_status("T2")
+            self.assertEqual(answer["data"], {"txnid": "T2", "status": "success", "easebuzz_id": "EZT2", "api": "v1"})
+            self.assertEqual(stub.hits("/transaction/v1/retrieve"), 1)
+
+    @override_settings(STORE_EASEBUZZ_STATUS_HEDGE_AFTER=0.1)
+    def test_easebuzz_status_hedges_to_v1_only_past_the_deadline(self):
+        with StubEasebuzz() as stub, override_settings(EASEBUZZ_API_BASE=stub.base_url):
+            stub.slow["/transaction/v2/retrieve"] = 0.05
+            self.assertEqual(_easebuzz_txn_status("T3")["data"]["api"], "v2")
+            self.assertEqual(stub.hits("/transaction/v1/retrieve"), 0)
+
+            stub.slow["/transaction/v2/retrieve"] = 1.0
+            self.assertEqual(_easebuzz_txn_status("T4")["data"]["api"], "v1")
+            self.assertEqual(stub.hits("/transaction/v1/retrieve"), 1)
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        vendor = userauths_models.User.objects.create_user(
+            email="flash@example.com", username="flash", password="x",
+            role=userauths_models.User.Role.VENDOR,
+        )
+        product = store_models.Product.objects.create(vendor=vendor, name="Deal", description="Deal")
+        self.variation = store_models.ProductVariation.objects.create(
+            product=product, sku="DEAL-1", sale_price=Decimal("5.00"), regular_price=Decimal("9.00"),
+            stock_quantity=3, deal_active=True, weight=1, length=1, height=1, width=1,
+        )
+        self.buyers = [
+            userauths_models.User.objects.create_user(email=f"b{i}@example.com", username=f"b{i}", password="x")
+            for i in range(2)
+        ]
+        self.addr = userauths_models.Address.objects.create(
+            profile=self.buyers[0].profile, address_type=userauths_models.Address.AddressType.SHIPPING,
+            street_address="1 Road", city="Pune", state="MH", postal_code="411001", country="IN",
+        )
+
+    def _checkout(self, user, quantity):
+        cart, _ = order_models.Cart.objects.get_or_create(user=user)
+        cart.items.update_or_create(
+            product_variation=self.variation, defaults={"quantity": quantity, "price": Decimal("5.00")}
+        )
+        return create_order_from_cart(user, self.addr, cart_lines(cart))
+
+    def _stock(self):
+        self.variation.refresh_from_db()
+        return self.variation.stock_quantity
+
+    def test_shortfall_rolls_back_the_order(self):
+        self._checkout(self.buyers[0], 2)
+        self.assertEqual(self._stock(), 1)
+
+        with self.assertRaises(InsufficientStock):
+            self._checkout(self.buyers[1], 2)
+        self.assertEqual(self._stock(), 1)
+        self.assertFalse(order_models.Order.objects.filter(buyer=self.buyers[1]).exists())
+
+    def test_expired_holds_return_units_once_and_payment_retakes_them(self):
+        order = self._checkout(self.buyers[0], 3)
+        store_models.StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(release_expired_holds(), 1)
+        self.assertEqual(release_expired_holds(), 0)
+        self.assertEqual(self._stock(), 3)
+
+        self.assertEqual(commit_order_stock(order), 1)
+        self.assertEqual(commit_order_stock(order), 0)
+        self.assertEqual(self._stock(), 0)
+        self.assertEqual(order.stock_reservations.get().status, store_models.StockReservation.Status.COMMITTED)
+
+    def test_listing_cards_follow_holds_and_releases(self):
+        store_models.Product.objects.filter(pk=self.variation.product_id).update(
+            status=store_models.Product.ProductStatus.PUBLISHED
+        )
+        store_models.ProductVariation.objects.filter(pk=self.variation.pk).update(is_primary=True)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order = self._checkout(self.buyers[0], 3)
+        self.assertFalse(self._card_in_stock())
+        with self.captureOnCommitCallbacks(execute=True):
+            release_order_stock(order)
+        self.assertTrue(self._card_in_stock())
+
+    def _card_in_stock(self):
+        return store_models.ProductCardSnapshot.objects.get(product_id=self.variation.product_id).in_stock
+
+    def test_new_checkout_spares_an_order_open_at_the_gateway(self):
+        at_gateway = self._checkout(self.buyers[0], 1)
+        at_gateway.easebuzz_txnid = "TXN-TAB1"
+        at_gateway.save(update_fields=["easebuzz_txnid"])
+        abandoned = self._checkout(self.buyers[0], 1)
+
+        # The buyer opens checkout again in a second tab while the first is still paying.
+        self.assertEqual(release_abandoned_checkouts(self.buyers[0]), 1)
+        self.assertEqual(abandoned.stock_reservations.get().status, store_models.StockReservation.Status.RELEASED)
+        self.assertEqual(at_gateway.stock_reservations.get().status, store_models.StockReservation.Status.HELD)
+
+        # The first tab's payment lands on units that are still held for it.
+        self.assertEqual(commit_order_stock(at_gateway), 1)
+        self.assertEqual(self._stock(), 2)
+
+        # Once its hold has expired, it is fair game.
+        other = self._checkout(self.buyers[0], 1)
+        other.easebuzz_txnid = "TXN-TAB2"
+        other.save(update_fields=["easebuzz_txnid"])
+        other.stock_reservations.update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(release_abandoned_checkouts(self.buyers[0]), 1)
+
+    def test_out_of_stock_sweeps_lapsed_holds_first(self):
+        self._checkout(self.buyers[0], 3)
+        store_models.StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        self._checkout(self.buyers[1], 2)
+        self.assertEqual(self._stock(), 1)
+        self.assertEqual(
+            sorted(store_models.StockReservation.objects.values_list("status", flat=True)), ["HELD", "RELEASED"]
+        )
+
+
+class CouponEngineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendors = [
+            userauths_models.User.objects.create_user(
+                email=f"shop{i}@example.com", username=f"shop{i}", password="x",
+                role=userauths_models.User.Role.VENDOR,
+            )
+            for i in range(2)
+        ]
+        cls.buyer = userauths_models.User.objects.create_user(email="saver@example.com", username="saver", password="x")
+        cls.variations = {}
+        for vendor in cls.vendors:
+            product = store_models.Product.objects.create(vendor=vendor, name=f"Item {vendor.pk}", description="x")
+            cls.variations[vendor.pk] = store_models.ProductVariation.objects.create(
+                product=product, sku=f"CPN-{vendor.pk}", sale_price=Decimal("10.00"), regular_price=Decimal("10.00"),
+                weight=1, length=1, height=1, width=1,
+            )
+        cls.coupon = order_models.Coupon.objects.create(
+            code="SAVE10", vendor=cls.vendors[0], discount_type=order_models.Coupon.DiscountType.FIXED,
+            amount_off=Decimal("10.00"), usage_limit_total=1,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def _order(self, lines):
+        order = order_models.Order(buyer=self.buyer)
+        order.set_order_id_if_missing()
+        order.save()
+        order_models.OrderItem.objects.bulk_create([
+            order_models.OrderItem(
+                order=order, vendor=vendor, product_variation=self.variations[vendor.pk],
+                quantity=1, price=Decimal("10.00") + n,
+            )
+            for n in range(lines)
+            for vendor in self.vendors
+        ])
+        return order
+
+    def _post(self, name, order):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse(name), {"code": "save10", "order_id": order.order_id})
+        return len(ctx.captured_queries), response.json()
+
+    def test_apply_and_remove_cost_the_same_for_any_order_size(self):
+        self.client.force_login(self.buyer)
+        small, large = self._order(1), self._order(12)
+        cached_coupon("SAVE10")
+
+        applied = self._post("store:apply_coupon", small)[0]
+        self.assertEqual(self._post("store:remove_coupon", small)[1]["ok"], True)
+        count, data = self._post("store:apply_coupon", large)
+
+        self.assertEqual(count, applied)
+        self.assertTrue(data["ok"])
+        self.assertEqual(data["amounts"]["item_discount_total"], "10.00")
+        self.assertEqual(
+            order_models.OrderItemDiscount.objects.filter(order_item__order=large).aggregate(t=Sum("amount"))["t"],
+            Decimal("10.00"),
+        )
+
+        # Re-applying (allowed when SINGLE_COUPON_PER_* are off) replaces the earlier allocation.
+        self.assertEqual(apply_coupon_to_order(large, self.coupon, self.buyer), (True, "Applied SAVE10."))
+        self.assertEqual(large.item_discount_total, Decimal("10.00"))
+
+        removed = self._post("store:remove_coupon", large)[1]
+        self.assertEqual(removed["amounts"]["item_discount_total"], "0.00")
+        self.assertEqual(removed["amounts"]["amount_payable"], "372.00")
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.times_redeemed, 0)
+
+    def test_total_usage_limit_is_claimed_once(self):
+        self.client.force_login(self.buyer)
+        first, second = self._order(1), self._order(1)
+
+        self.assertTrue(self._post("store:apply_coupon", first)[1]["ok"])
+        self.assertEqual(self._post("store:apply_coupon", second)[1]["message"], "Coupon usage limit reached.")
+
+        # The conditional UPDATE is what enforces the limit, whatever the caller's copy says.
+        self.assertFalse(_claim_use(self.coupon))
+        order_models.Coupon.objects.filter(pk=self.coupon.pk).update(usage_limit_total=2)
+        self.assertTrue(_claim_use(self.coupon))
+        self.assertFalse(_claim_use(self.coupon))
+
+
+class CouponCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.vendor = userauths_models.User.objects.create_user(
+            email="promo@example.com", username="promo", password="x",
+            role=userauths_models.User.Role.VENDOR,
+        )
+        self.coupon = order_models.Coupon.objects.create(
+            code=" Spring25 ", vendor=self.vendor, discount_type=order_models.Coupon.DiscountType.PERCENT,
+            percent_off=Decimal("25"),
+        )
+
+    def test_lookup_is_case_insensitive_and_served_from_cache(self):
+        self.assertEqual(self.coupon.code_normalized, "SPRING25")
+        self.assertEqual(cached_coupon("spring25"), self.coupon)
+        with self.assertNumQueries(0):
+            self.assertEqual(cached_coupon("SPRING25 ").pk, self.coupon.pk)
+            self.assertIsNone(cached_coupon(""))
+        self.assertIsNone(cached_coupon("nope"))
+        with self.assertNumQueries(0):
+            self.assertIsNone(cached_coupon("NOPE"))
+
+    def test_vendor_endpoints_drop_the_cached_entry(self):
+        self.assertTrue(cached_coupon("spring25").is_active)
+        self.client.force_login(self.vendor)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("vendor:coupon_toggle_active_ajax", args=[self.coupon.pk]), HTTP_X_REQUESTED_WITH="XMLHttpRequest"
+            )
+        self.assertFalse(cached_coupon("spring25").is_active)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("vendor:coupon_delete_ajax", args=[self.coupon.pk]), HTTP_X_REQUESTED_WITH="XMLHttpRequest"
+            )
+        self.assertIsNone(cached_coupon("spring25"))
+
+    def test_entries_expire_at_the_next_window_boundary(self):
+        now = timezone.now()
+        self.coupon.starts_at = now + timedelta(minutes=10)
+        self.coupon.ends_at = now + timedelta(days=3)
+        self.assertEqual(_entry_timeout(self.coupon, now), 600)
+
+        self.coupon.starts_at = now - timedelta(minutes=10)
+        self.coupon.ends_at = now + timedelta(seconds=90)
+        self.assertEqual(_entry_timeout(self.coupon, now), 90)
+
+        self.coupon.ends_at = None
+        self.assertEqual(_entry_timeout(self.coupon, now), 3600)
+        self.assertEqual(_entry_timeout(None, now), 60)
+
+    def test_redemption_rechecks_the_row_behind_a_stale_entry(self):
+        stale = cached_coupon("spring25")
+        # Deactivated where this process's cache never hears about it.
+        order_models.Coupon.objects.filter(pk=self.coupon.pk).update(is_active=False)
+        self.assertTrue(cached_coupon("spring25").is_live())
+        self.assertFalse(_claim_use(stale))
+
+        order_models.Coupon.objects.filter(pk=self.coupon.pk).update(
+            is_active=True, ends_at=timezone.now() - timedelta(minutes=1)
+        )
+        self.assertFalse(_claim_use(stale))
+        order_models.Coupon.objects.filter(pk=self.coupon.pk).update(ends_at=None)
+        self.assertTrue(_claim_use(stale))
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.times_redeemed, 1)
+
+    def test_codes_that_normalize_alike_cannot_coexist(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            order_models.Coupon.objects.create(
+                code="spring25", vendor=self.vendor, discount_type=order_models.Coupon.DiscountType.FIXED,
+                amount_off=Decimal("5"),
+            )
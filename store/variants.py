@@ -0,0 +1,102 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .models import ProductVariation
+
+
+# One entry per product describing its active variations, so add-to-cart can
+# turn a shopper's selections into a variation without joining through
+# ProductVariation.variations once per option:
+#   variants:  "3,17" (sorted value ids) -> variation id
+#   values:    variation id -> its value ids
+#   names:     "size:m" (category:value, lowercased) -> value id
+#   primary:   the variation a bare product_id resolves to
+# Variation and value edits drop the entry (store.signals) - in this process's
+# cache only, unless CACHE_URL points every worker at a shared one - so the map
+# is a lookup aid: add-to-cart records a line's values from the database.
+VARIANT_MAP_KEY = "store:variants:%s"
+
+
+def value_key(value_ids):
+    return ",".join(str(v) for v in sorted(set(value_ids)))
+
+
+def name_key(category, value):
+    return f"{str(category).strip().lower()}:{str(value).strip().lower()}"
+
+
+def build_variant_map(product_id):
+    variations = list(
+        ProductVariation.objects.filter(product_id=product_id, is_active=True)
+        .order_by("-is_primary", "pk").values_list("pk", flat=True)
+    )
+    rows = ProductVariation.variations.through.objects.filter(productvariation_id__in=variations).values_list(
+        "productvariation_id", "variationvalue_id", "variationvalue__category__name", "variationvalue__value"
+    )
+    values = {vid: [] for vid in variations}
+    names = {}
+    for vid, value_id, category, value in rows:
+        values[vid].append(value_id)
+        names[name_key(category, value)] = value_id
+    return {
+        "variants": {value_key(ids): vid for vid, ids in reversed(list(values.items()))},
+        "values": {vid: sorted(ids) for vid, ids in values.items()},
+        "names": names,
+        "primary": variations[0] if variations else None,
+    }
+
+
+def variant_map(product_id):
+    key = VARIANT_MAP_KEY % product_id
+    entry = cache.get(key)
+    if entry is None:
+        entry = build_variant_map(product_id)
+        cache.set(key, entry, getattr(settings, "STORE_VARIANT_MAP_TIMEOUT", 3600))
+    return entry
+
+
+def resolve_variant(product_id, value_ids=None, selections=None):
+    """
+    The variation id for a product and the shopper's selections, given as
+    value ids or as {category name: value} (matched case-insensitively).
+    An exact set of values wins; otherwise the first variation carrying all
+    of them, and with no selections at all the product's primary variation.
+    Returns (variation_id or None, the value ids that were understood).
+    """
+    vmap = variant_map(product_id)
+    if not value_ids and selections:
+        value_ids = [vmap["names"].get(name_key(cat, val)) for cat, val in selections.items()]
+        if None in value_ids:
+            return None, []
+    value_ids = sorted(set(value_ids or []))
+    if not value_ids:
+        return vmap["primary"], []
+
+    vid = vmap["variants"].get(value_key(value_ids))
+    if vid is None:
+        wanted = set(value_ids)
+        vid = next((v for v, ids in vmap["values"].items() if wanted <= set(ids)), None)
+    return vid, value_ids
+
+
+def invalidate_variant_maps(product_ids):
+    keys = [VARIANT_MAP_KEY % pid for pid in set(product_ids) if pid]
+    if keys:
+        cache.delete_many(keys)
+
+
+def schedule_variant_invalidation(product_ids):
+    """Drop the products' variant maps once the current transaction commits."""
+    pending = getattr(connection, "_pending_variant_invalidation", None)
+    if pending is None:
+        pending = set()
+        connection._pending_variant_invalidation = pending
+    pending.update(pid for pid in product_ids if pid)
+
+    def _flush():
+        ids = list(pending)
+        pending.clear()
+        invalidate_variant_maps(ids)
+
+    transaction.on_commit(_flush)
@@ -3,6 +3,7 @@ from django.db.models import Prefetch, Sum, Avg, Case, When, IntegerField, F, Q,
 from django.http import JsonResponse, HttpResponseBadRequest
 from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
+from django.contrib import messages
 from django.views.decorators.csrf import csrf_protect
 from django.views.decorators.csrf import ensure_csrf_cookie
 
@@ -12,9 +13,8 @@ from django.conf import settings
 from django.db.models import Q, Count
 from django.core.paginator import Paginator
 
-from decimal import Decimal, getcontext, ROUND_HALF_UP
+from decimal import Decimal
 import json
-import traceback
 import math
 import requests
 import uuid
@@ -26,91 +26,41 @@ from order import models as order_models
 from store.easebuzz import generate_easebuzz_form_data
 from userauths import models as userauths_model
 from store import forms as store_forms
+from store.cards import with_cards
+from order.summary import adjust_cart_summary, request_owner, update_summary
+from store.carts import cart_for_request
+from store.checkout import cart_lines, create_order_from_cart, flat_shipping, shipping_weight
+from store.coupons import apply_coupon_to_order, cached_coupon, remove_coupon_from_order
+from store.stock import InsufficientStock, release_abandoned_checkouts
+from store.home import home_context, record_section_stats
+from store.search import get_search_backend
+from store.shoppage import suggestions_for
+from store.variants import invalidate_variant_maps, resolve_variant
 
 
 from django.urls import reverse
 from django.conf import settings
 from django.utils import timezone
 
-from .shiprocket import get_serviceability_and_rates, create_shiprocket_order, ShiprocketError
+from .shiprocket import create_shiprocket_order, quote_rates, ShiprocketError
 from userauths.models import Address 
 from store.models import ProductVariation, ProductImage
 
-getcontext().prec = 6
-
-
 logger = logging.getLogger(__name__)
 
 
-def _update_session_cart_count(request, cart):
-    session = getattr(request, "session", None)
-    if session is None or cart is None:
-        return 0
-    count = cart.items.count()
-    session["cart_item_count"] = count
-    session.modified = True
-    return count
+def _refresh_cart_summary(request, cart):
+    """Recompute the cart's figures after a change and publish them for the header (order.summary)."""
+    figures = cart.summary()
+    update_summary(request_owner(request), **figures)
+    return figures
 
 @ensure_csrf_cookie
 def index(request):
-    Product = store_models.Product
-    ProductVariation = store_models.ProductVariation
-    OrderItem = order_models.OrderItem
-    ProductImage = store_models.ProductImage
-
-    base_products_qs = Product.objects.filter(
-        status=Product.ProductStatus.PUBLISHED
-    ).select_related('vendor', 'category').prefetch_related(
-        Prefetch('images', queryset=ProductImage.objects.filter(is_primary=True), to_attr='primary_images'),
-        Prefetch('variations', queryset=ProductVariation.objects.filter(is_active=True), to_attr='active_variations'),
-    )
-
-    top_selling_agg = OrderItem.objects.filter(
-        product_variation__product__status=Product.ProductStatus.PUBLISHED
-    ).values('product_variation__product').annotate(
-        total_sold=Sum('quantity')
-    ).order_by('-total_sold')[:4]
-
-    top_selling_ids = [item['product_variation__product'] for item in top_selling_agg]
-
-    if top_selling_ids:
-        preserved_order = Case(*[
-            When(pk=pid, then=pos) for pos, pid in enumerate(top_selling_ids)
-        ], output_field=IntegerField())
-        top_selling = list(Product.objects.filter(pk__in=top_selling_ids).order_by(preserved_order))
-    else:
-        top_selling = []
-
-    trending_products = list(
-        base_products_qs.filter(variations__label='Trending').distinct()
-    )[:12]
-
-    recently_added = list(base_products_qs.order_by('-created_at'))[:12]
-
-    
-    top_rated = list(
-        base_products_qs.annotate(avg_rating=Avg('reviews__rating'))
-                        .filter(avg_rating__isnull=False)
-                        .order_by('-avg_rating')[:12]
-    )
-
-    deals = store_models.ProductVariation.objects.filter(
-        product__status=Product.ProductStatus.PUBLISHED,
-        is_active=True,
-        is_primary=True
-    )[:4]
-
-    context = {
-        'products': base_products_qs,           
-        'categories': store_models.Category.objects.filter(is_active=True, featured=True).order_by("id"),
-        'trending_categories': store_models.Category.objects.filter(is_active=True, trending=True)[:8],
-        'deals': deals,
-        'top_selling': top_selling,
-        'trending_products': trending_products,
-        'recently_added': recently_added,
-        'top_rated': top_rated,
-    }
-    return render(request, 'index.html', context)
+    context, sections = home_context()
+    response = render(request, 'index.html', context)
+    record_section_stats(sections)
+    return response
 
 @ensure_csrf_cookie
 def product_detail_view(request, slug):
@@ -167,7 +117,6 @@ def product_detail_view(request, slug):
         }
 
     reviews = product.reviews.all()
-    average_rating = reviews.aggregate(avg=Avg('rating'))['avg'] or 0
 
     related_products = []
     if product.category:
@@ -181,7 +130,7 @@ def product_detail_view(request, slug):
         'variation_options': variation_options,
         'variation_map_json': json.dumps(variation_map),  
         'reviews': reviews,
-        'average_rating': round(average_rating, 1),
+        'average_rating': product.average_rating(),
         'related_products': related_products,
     }
     return render(request, 'product_detail.html', context)
@@ -225,16 +174,16 @@ def category_detail(request, slug, pk):
     products_qs = (
         store_models.Product.objects.filter(status=store_models.Product.ProductStatus.PUBLISHED)
         .filter(Q(category=category) | Q(category__parent=category))
-        .select_related("category", "vendor")
-        .prefetch_related("images", "variations", "reviews")
+        .select_related("category", "card")
         .order_by("-created_at")
     )
 
     paginator = Paginator(products_qs, 12)
     page_obj = paginator.get_page(request.GET.get("page"))
+    page_obj.object_list = with_cards(page_obj.object_list)
 
     
-    total_products = products_qs.count()
+    total_products = paginator.count
 
     return render(
         request,
@@ -261,12 +210,13 @@ def products_by_label(request, label):
             variations__is_active=True,
             variations__label=label_value,
         )
-        .select_related("category", "vendor")
+        .select_related("category", "card")
         .distinct()
         .order_by("-updated_at")
     )
 
     page_obj = Paginator(qs, 24).get_page(request.GET.get("page") or 1)
+    page_obj.object_list = with_cards(page_obj.object_list)
 
     return render(
         request,
@@ -278,275 +228,121 @@ def products_by_label(request, label):
         },
     )
 
+def _selected_value_ids(raw):
+    """selected_value_ids as clients send it: a list, a JSON list or "1,2,3"."""
+    if not raw:
+        return []
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            raw = raw.split(",")
+    if not isinstance(raw, (list, tuple)):
+        raw = [raw]
+    return [int(x) for x in raw if str(x).strip().isdigit()]
+
+
+def _cart_figures_after_add(request, cart, item, created):
+    """The cached cart summary shifted by this one line; the full aggregate only when nothing is cached."""
+    figures = adjust_cart_summary(
+        request_owner(request),
+        lines=1 if created else 0,
+        quantity=item.quantity - item.previous_quantity,
+        subtotal=item.subtotal() - item.previous_subtotal,
+    )
+    return figures or cart.summary()
+
+
 @ensure_csrf_cookie
 @require_POST
 @csrf_protect
 def add_to_cart(request):
-    print("---- add_to_cart called ----")
+    """
+    Add a variation to the cart. The variation comes from variation_id, or
+    from product_id plus the shopper's selections through the product's
+    cached variant map (store.variants) -- no per-option joins. The line is
+    written once and the returned totals are the cached header summary
+    shifted by this line.
+    """
     try:
         payload = json.loads(request.body.decode('utf-8') or '{}')
-    except Exception as e:
-        print("Invalid JSON:", e)
+    except ValueError:
         return JsonResponse({"detail": "Invalid JSON"}, status=400)
 
-    print("payload:", payload)
-    variation_id = payload.get('variation_id')
-    product_id = payload.get('product_id')
-    selected_variations = payload.get('selected_variations') or {}
-    selected_value_ids = payload.get('selected_value_ids') or payload.get('selected_value_ids[]') or None
-
-    print("selected_value_ids ====", selected_value_ids)
-    print("selected_variations ====", selected_variations)
+    selections = payload.get('selected_variations') or {}
+    if not isinstance(selections, dict):
+        selections = {}
+    value_ids = _selected_value_ids(payload.get('selected_value_ids') or payload.get('selected_value_ids[]'))
 
     try:
         qty = int(payload.get('quantity', 1) or 1)
-    except Exception:
+    except (TypeError, ValueError):
         qty = 1
-
     if qty < 1:
-        print("Bad quantity:", qty)
         return JsonResponse({"detail": "Quantity must be at least 1"}, status=400)
 
-    variation = None
+    variation_id = payload.get('variation_id')
+    product_id = payload.get('product_id')
+    if not variation_id:
+        if not product_id:
+            return JsonResponse({"detail": "Provide variation_id or product_id"}, status=400)
+        variation_id, wanted = resolve_variant(product_id, value_ids, selections)
+        if variation_id is None:
+            detail = "No matching variant for those selections" if value_ids or selections else "No available variant for this product"
+            return JsonResponse({"detail": detail}, status=404)
+    else:
+        wanted = []
 
-    
-    if variation_id:
-        print("Resolving by variation_id:", variation_id)
+    variation = get_object_or_404(
+        store_models.ProductVariation.objects.select_related('product'), pk=variation_id, is_active=True
+    )
+    # The line records the variation's own values as the database has them, whichever way the
+    # shopper picked it: the variant map may be another worker's stale copy (locmem is per process).
+    line_values = sorted(variation.variations.values_list('pk', flat=True))
+    if not set(wanted) <= set(line_values):
+        # The map resolved from an outdated picture of the product; rebuild it and try once more.
+        invalidate_variant_maps([variation.product_id])
+        variation_id, wanted = resolve_variant(variation.product_id, value_ids, selections)
         variation = get_object_or_404(
-            store_models.ProductVariation.objects.select_related('product'),
-            pk=variation_id,
-            is_active=True
+            store_models.ProductVariation.objects.select_related('product'), pk=variation_id, is_active=True
         )
-    elif selected_variations and product_id:
-        print("Resolving by selected_variations for product:", product_id, selected_variations)
-        product = get_object_or_404(store_models.Product, pk=product_id)
-        qs = store_models.ProductVariation.objects.filter(product=product, is_active=True)
-        for cat, val in selected_variations.items():
-            qs = qs.filter(variations__category__name=cat, variations__value=val)
-        qs = qs.distinct()
-        variation = qs.first()
-        if not variation:
-            print("No matching variant for selections:", selected_variations)
-            return JsonResponse({"detail": "No matching variant for those selections"}, status=404)
-    elif product_id:
-        print("Resolving by product_id fallback:", product_id)
-        product = get_object_or_404(store_models.Product, pk=product_id)
-        primary = product.primary_item() if callable(getattr(product, "primary_item", None)) else getattr(product, "primary_item", None)
-        variation = primary or product.variations.filter(is_active=True).first()
-        if not variation:
-            print("No available variant for product:", product_id)
-            return JsonResponse({"detail": "No available variant for this product"}, status=404)
-    else:
-        print("No variation_id or product_id provided")
-        return JsonResponse({"detail": "Provide variation_id or product_id"}, status=400)
-
-    if not getattr(variation, "is_active", False):
-        print("Variant not active:", getattr(variation, "id", None))
-        return JsonResponse({"detail": "Variant not active"}, status=400)
+        line_values = sorted(variation.variations.values_list('pk', flat=True))
 
-    if getattr(variation, "stock_quantity", 0) < qty:
-        print("Insufficient stock for variation:", variation.id, "requested:", qty, "available:", getattr(variation, "stock_quantity", 0))
-        return JsonResponse({"detail": "Insufficient stock"}, status=400)
-
-    print("Attempting to get cart via order_models.Cart.get_for_request")
-    cart = None
-    try:
-        cart = order_models.Cart.get_for_request(request)
-    except Exception as e:
-        print("get_for_request raised:", e)
-        cart = None
-
-    if not cart or getattr(cart, "id", None) is None:
-        print("Fallback: creating/getting cart manually")
-        if request.user.is_authenticated:
-            cart, created = order_models.Cart.objects.get_or_create(user=request.user)
-            print("Cart for user:", request.user, "created:", created, "cart_id:", cart.id)
-        else:
-            if not request.session.session_key:
-                request.session.create()
-                print("Created session_key:", request.session.session_key)
-            session_key = request.session.session_key
-            cart, created = order_models.Cart.objects.get_or_create(session_key=session_key)
-            print("Cart for session:", session_key, "created:", created, "cart_id:", cart.id)
-
-    if getattr(cart, "id", None) is None:
-        try:
-            cart.save()
-            print("Saved cart, new id:", cart.id)
-        except Exception as e:
-            print("Failed to save cart:", e)
-            return JsonResponse({"detail": "Could not initialize cart"}, status=500)
-
-    print("Final cart id:", cart.id)
-    price_snapshot = variation.sale_price
-
-    cart_item = None
-    created = False
-
-    resolved_vv_qs = store_models.VariationValue.objects.none()
-    resolved_value_ids = []
+    cart = cart_for_request(request)
     try:
-        if selected_value_ids:
-            print("Client provided selected_value_ids:", selected_value_ids)
-            if isinstance(selected_value_ids, str):
-                try:
-                    selected_value_ids = json.loads(selected_value_ids)
-                except Exception:
-                    selected_value_ids = [int(x) for x in selected_value_ids.split(',') if x.strip().isdigit()]
-            selected_value_ids = [int(x) for x in selected_value_ids] if hasattr(selected_value_ids, "__iter__") else [int(selected_value_ids)]
-            resolved_vv_qs = store_models.VariationValue.objects.filter(id__in=selected_value_ids)
-            resolved_value_ids = list(resolved_vv_qs.values_list('id', flat=True))
-        elif selected_variations and isinstance(selected_variations, dict):
-            
-            print("Resolving VariationValue by category/value pairs:", selected_variations)
-            found_ids = []
-            for cat, val in selected_variations.items():
-                vv = store_models.VariationValue.objects.filter(category__name__iexact=str(cat).strip(), value__iexact=str(val).strip()).first()
-                if vv:
-                    found_ids.append(vv.id)
-            if found_ids:
-                resolved_vv_qs = store_models.VariationValue.objects.filter(id__in=found_ids)
-                resolved_value_ids = found_ids
-    except Exception as e:
-        print("Error resolving VariationValue objects:", e)
-        resolved_vv_qs = store_models.VariationValue.objects.none()
-        resolved_value_ids = []
-
-    print("Resolved VariationValue ids:", resolved_value_ids)
-
-    try:
-        with transaction.atomic():
-            print("Adding item to cart (cart_id=%s, variation_id=%s, qty=%s)" % (cart.id, variation.id, qty))
-
-            add_item_error = None
-            if hasattr(cart, "add_item") and callable(getattr(cart, "add_item")):
-                try:
-                    result = cart.add_item(variation, quantity=qty)
-                    if isinstance(result, tuple) and len(result) >= 2:
-                        cart_item, created = result[0], result[1]
-                    else:
-                        cart_item = result
-                        created = False
-                    print("Used cart.add_item; returned:", getattr(cart_item, "id", None), "created:", created)
-                except Exception as e:
-                    add_item_error = e
-                    print("cart.add_item raised, will fallback to manual create. Error:", e)
-
-            if cart_item is None:
-                print("Manual fallback: detecting CartItem FK to ProductVariation")
-                fk_field_name = None
-                for f in order_models.CartItem._meta.fields:
-                    related = getattr(f, "related_model", None)
-                    if related is store_models.ProductVariation:
-                        fk_field_name = f.name
-                        break
-
-                if not fk_field_name:
-                    for candidate in ("product_variation", "variation", "product_variation_id", "variation_id"):
-                        try:
-                            order_models.CartItem._meta.get_field(candidate)
-                            fk_field_name = candidate
-                            break
-                        except Exception:
-                            continue
-
-                if not fk_field_name:
-                    print("Could not auto-detect ProductVariation FK field on CartItem. Fields:", [f.name for f in order_models.CartItem._meta.fields])
-                    raise RuntimeError("CartItem model does not have FK to ProductVariation (cannot fallback)")
-
-                print("Detected FK field name on CartItem:", fk_field_name)
-
-                kwargs = {"cart": cart, fk_field_name: variation}
-                defaults = {"quantity": qty, "price": price_snapshot}
-                try:
-                    cart_item, created = order_models.CartItem.objects.get_or_create(defaults=defaults, **kwargs)
-                    if not created:
-                        cart_item.quantity = (cart_item.quantity or 0) + qty
-                        cart_item.price = price_snapshot
-                        cart_item.save()
-                    print("Manual CartItem done; id:", cart_item.id, "created:", created)
-                except InterruptedError as ie:
-                    print("IntegrityError creating CartItem:", ie)
-                    raise
-
-            print("cart_item.cart_id after create:", getattr(cart_item, "cart_id", None))
-            if getattr(cart_item, "cart_id", None) is None:
-                raise RuntimeError("cart_item.cart_id is None after creation")
-
-            try:
-                cart_item.price = price_snapshot
-                cart_item.save()
-            except Exception as e:
-                print("Failed to save cart_item.price:", e)
-
-            try:
-                
-                if hasattr(cart_item, "variation_values"):
-                    if resolved_vv_qs.exists():
-                        cart_item.variation_values.set(resolved_vv_qs)
-                        print("Set cart_item.variation_values ->", list(resolved_vv_qs.values_list('id', flat=True)))
-                    else:
-                        
-                        print("No resolved variation values to set (keeping existing).")
-                else:
-                    print("CartItem model does not have 'variation_values' M2M field; skipping.")
-
-                backup = {}
-                if resolved_value_ids:
-                    backup['value_ids'] = resolved_value_ids
-                if isinstance(selected_variations, dict) and selected_variations:
-                    backup['display'] = {str(k): str(v) for k, v in selected_variations.items()}
-                if hasattr(cart_item, "selected_variations_json"):
-                    cart_item.selected_variations_json = backup or None
-                    cart_item.save()
-                    print("Saved selected_variations_json:", cart_item.selected_variations_json)
-                else:
-                    print("CartItem model does not have 'selected_variations_json' field; skipping backup save.")
-            except Exception as e:
-                print("Failed to attach variation_values / save backup:", e)
-
+        cart_item, created = cart.add_item(variation, quantity=qty, value_ids=line_values, display=selections or None)
     except ValidationError as e:
-        print("ValidationError while adding to cart:", e)
-        return JsonResponse({"detail": str(e)}, status=400)
-    except Exception as e:
-        print("Exception while adding to cart:", e)
-        print(traceback.format_exc())
-        return JsonResponse({"detail": "Could not add to cart"}, status=500)
-
-    subtotal = None
-    if hasattr(cart_item, "subtotal") and callable(getattr(cart_item, "subtotal")):
-        try:
-            subtotal = str(cart_item.subtotal())
-        except Exception:
-            subtotal = None
-
-    item_count = _update_session_cart_count(request, cart)
+        logger.info("cart.add rejected variation=%s qty=%s reason=%r", variation.pk, qty, e.messages[0])
+        return JsonResponse({"detail": e.messages[0]}, status=400)
 
-    resp = {
+    figures = _cart_figures_after_add(request, cart, cart_item, created)
+    logger.info(
+        "cart.add variation=%s qty=%s line_qty=%s created=%s guest=%s cart_items=%s",
+        variation.pk, qty, cart_item.quantity, created, cart.pk is None, figures["cart_items"],
+    )
+    return JsonResponse({
         "ok": True,
         "created": bool(created),
         "cart_item": {
             "id": cart_item.id,
             "variation_id": variation.id,
-            "product_id": getattr(getattr(variation, 'product', None), 'id', None),
+            "product_id": variation.product_id,
             "quantity": cart_item.quantity,
             "price": str(cart_item.price),
-            "subtotal": subtotal or (str(cart_item.quantity * cart_item.price) if getattr(cart_item, "price", None) is not None else None),
+            "subtotal": str(cart_item.subtotal()),
         },
         "cart": {
-            "item_count": item_count,
-            "total_amount": str(cart.total_amount()) if hasattr(cart, "total_amount") else "0"
+            "item_count": figures["cart_items"],
+            "quantity": figures["cart_quantity"],
+            "total_amount": str(figures["cart_subtotal"]),
         }
-    }
-    print("add_to_cart success, resp:", resp)
-    return JsonResponse(resp)
+    })
 
 
 def cart_detail(request):
     
-    cart = order_models.Cart.get_for_request(request)
-    items = cart.items.select_related('product_variation', 'product_variation__product')\
-            .prefetch_related('variation_values').all()
+    cart = cart_for_request(request, create=False)
+    items = cart.lines() if cart is not None else []
     
     if request.user.is_authenticated:
         addresses = userauths_model.Address.objects.filter(profile__user=request.user)
@@ -598,47 +394,28 @@ def update_cart_item_qty(request):
     if qty < 0:
         return JsonResponse({'ok': False, 'message': 'Quantity must be >= 0'}, status=400)
 
-    cart = order_models.Cart.get_for_request(request)
-
-    with transaction.atomic():
-        try:
-            cart_item = order_models.CartItem.objects.select_for_update().select_related('product_variation').get(pk=cart_item_id, cart=cart)
-        except order_models.CartItem.DoesNotExist:
-            return JsonResponse({'ok': False, 'message': 'Cart item not found'}, status=404)
-
-        variation = cart_item.product_variation
-
-        if qty == 0:
-            cart_item.delete()
-        else:
-            
-            if qty > variation.stock_quantity:
-                return JsonResponse({
-                    'ok': False,
-                    'message': f'Only {variation.stock_quantity} units available in stock'
-                }, status=400)
-
-            cart_item.quantity = qty
-            cart_item.price = variation.sale_price
-            cart_item.save()
+    cart = cart_for_request(request, create=False)
+    try:
+        cart_item = cart.set_item_quantity(cart_item_id, qty) if cart is not None else None
+    except ValidationError as e:
+        return JsonResponse({'ok': False, 'message': e.messages[0]}, status=400)
+    if cart_item is None:
+        return JsonResponse({'ok': False, 'message': 'Cart item not found'}, status=404)
 
-    agg = cart.items.aggregate(total=Sum(F('quantity') * F('price')))
-    cart_total = agg['total'] or Decimal('0.00')
+    figures = _refresh_cart_summary(request, cart)
 
     
     item_subtotal = Decimal('0.00')
     if qty > 0:
         item_subtotal = (cart_item.price or Decimal('0.00')) * qty
 
-    item_count = _update_session_cart_count(request, cart)
-
     return JsonResponse({
         'ok': True,
         'cart_item_id': cart_item_id,
         'quantity': qty,
         'item_subtotal': str(item_subtotal),   
-        'cart_total': str(cart_total),
-        "item_count": item_count,
+        'cart_total': str(figures["cart_subtotal"]),
+        "item_count": figures["cart_items"],
     })
 
 @login_required
@@ -732,105 +509,68 @@ def _choose_shiprocket_surface(opts):
     return opts[0]
 
 
+def _order_from_cart_or_none(request, addr, lines, **kwargs):
+    # Starting a new checkout abandons the previous unpaid ones; hand their held units back first.
+    release_abandoned_checkouts(request.user)
+    try:
+        return create_order_from_cart(request.user, addr, lines, **kwargs)
+    except InsufficientStock as e:
+        name = next(
+            (ci.product_variation.product.name for ci in lines if ci.product_variation_id == e.variation_id),
+            "an item in your cart",
+        )
+        messages.error(request, f"Sorry, there isn't enough stock left for {name}. Please update your cart.")
+        return None
+
+
+def _shiprocket_surface_rate(addr, ship_weight):
+    """The preferred surface option for the address, from the quote cache; None when there is none."""
+    pickup_pincode = getattr(settings, "SHIPROCKET_PICKUP_PINCODE", "")
+    try:
+        raw = quote_rates(pickup_pincode, addr.postal_code.strip(), ship_weight, cod=0)
+        return _choose_shiprocket_surface(_extract_rate_list(_normalize_resp(raw)))
+    except ShiprocketError:
+        logger.debug("Shiprocket rate lookup failed for %s; keeping fallback shipping", addr.postal_code)
+    except Exception:
+        logger.exception("Unexpected error while fetching shipping rates for %s", addr.postal_code)
+    return None
+
+
 @login_required
-@transaction.atomic
 def begin_checkout_shiprocket(request):
     profile = request.user.profile
     cart = order_models.Cart.get_for_request(request)
-    if cart.items.count() == 0:
+    lines = cart_lines(cart)
+    if not lines:
         return redirect('store:cart')  
 
     addr = profile.addresses.filter(address_type=Address.AddressType.SHIPPING, is_default=True).first()
     if not addr:
         return redirect('store:address_list_create')
 
-    
-    item_total = Decimal('0.00')
-    total_weight_kg = Decimal('0.00')
-    for ci in cart.items.select_related('product_variation', 'product_variation__product'):
-        unit_price = ci.price or ci.product_variation.sale_price
-        item_total += (unit_price * ci.quantity)
-        pv_w = ci.product_variation.weight or Decimal('0.0')
-        total_weight_kg += (pv_w * ci.quantity)
-
-    
-    order = order_models.Order(
-        buyer=request.user,
-        address=addr,
-        currency=getattr(settings, "DEFAULT_CURRENCY", "INR"),
-        item_total=item_total,
-        shipping_fee=Decimal('0.00'),
-        total_amount=item_total,
-        shipping_address_snapshot={
-            "full_name": addr.full_name,
-            "phone": addr.phone,
-            "street_address": addr.street_address,
-            "city": addr.city,
-            "state": addr.state,
-            "postal_code": addr.postal_code,
-            "country": addr.country,
-        },
-    )
-    order.set_order_id_if_missing()
-    order.save()
+    # Quote before the transaction opens: a cache miss is a network round-trip
+    # to Shiprocket and must not hold the order and stock rows meanwhile.
+    total_weight_kg = shipping_weight(lines)
+    ship_weight = float(total_weight_kg) if total_weight_kg > 0 else 0.5
+    chosen = _shiprocket_surface_rate(addr, ship_weight)
 
-    
-    for ci in cart.items.select_related('product_variation', 'product_variation__product').all():
-        unit_price = ci.price or ci.product_variation.sale_price
-        try:
-            vendor_user = getattr(ci.product_variation.product, "vendor", None) or request.user
-        except Exception:
-            vendor_user = request.user
-        oi = order_models.OrderItem.objects.create(
-            order=order,
-            product_variation=ci.product_variation,
-            vendor=vendor_user,
-            quantity=ci.quantity,
-            price=unit_price,
-        )
-        if ci.variation_values.exists():
-            oi.variation_values.set(ci.variation_values.all())
-    order.recompute_item_totals_from_items()
-    order.recalc_total()
-    order.save()
-    print(f"DEBUG: after creating items -> item_total={order.item_total}, item_total_net={order.item_total_net}, shipping_fee={order.shipping_fee}, amount_payable={order.amount_payable}")
+    with transaction.atomic():
+        order = _order_from_cart_or_none(request, addr, lines)
+        if order is None:
+            return redirect('store:cart')
+        logger.debug("Order %s created: item_total=%s amount_payable=%s", order.order_id, order.item_total, order.amount_payable)
 
-    pickup_pincode = getattr(settings, "SHIPROCKET_PICKUP_PINCODE", "")
-    ship_weight = float(total_weight_kg) if total_weight_kg > 0 else 0.5
-    try:
-        raw = get_serviceability_and_rates(pickup_pincode, addr.postal_code.strip(), ship_weight, cod=0)
-        resp = _normalize_resp(raw)
-        opts = _extract_rate_list(resp)
-        chosen = _choose_shiprocket_surface(opts)
         if chosen:
             order.apply_shipping_selection(
                 rate_obj=chosen,
                 fallback_currency=order.currency,
                 chargeable_weight=ship_weight,
             )
-            order.recompute_item_totals_from_items()
             order.recalc_total()
             order.save()
-            print(f"DEBUG: after applying shipping -> shipping_fee={order.shipping_fee}, amount_payable={order.amount_payable}")
+            logger.debug("Order %s shipping applied: shipping_fee=%s amount_payable=%s", order.order_id, order.shipping_fee, order.amount_payable)
         else:
-            
-            order.recompute_item_totals_from_items()
-            order.recalc_total()
-            order.save()
-            print("DEBUG: no shipping chosen; totals recomputed")
-
-    except ShiprocketError as e:
-        
-        order.recompute_item_totals_from_items()
-        order.recalc_total()
-        order.save()
-        print("DEBUG: ShiprocketError; totals recomputed with shipping_fee fallback")
-    except Exception:
-        order.recompute_item_totals_from_items()
-        order.recalc_total()
-        order.save()
-        print("DEBUG: Unexpected exception; totals recomputed with shipping_fee fallback")
-
+            logger.debug("Order %s: no shipping option chosen", order.order_id)
 
     return redirect(reverse('store:checkout', kwargs={'order_id': order.order_id}))
 
@@ -840,8 +580,9 @@ def begin_checkout_shiprocket(request):
 def begin_checkout(request):
     profile = request.user.profile
     cart = order_models.Cart.get_for_request(request)
+    lines = cart_lines(cart)
 
-    if cart.items.count() == 0:
+    if not lines:
         return redirect('store:cart')  
 
     
@@ -852,72 +593,9 @@ def begin_checkout(request):
     if not addr:
         return redirect('store:address_list_create')
 
-    
-    item_total = Decimal('0.00')
-    shipping_total = Decimal('0.00')
-
-    cart_items_qs = cart.items.select_related(
-        'product_variation',
-        'product_variation__product'
-    )
-
-    for ci in cart_items_qs:
-        pv = ci.product_variation
-        unit_price = ci.price or pv.sale_price
-        item_total += (unit_price * ci.quantity)
-
-        
-        shipping_total += (pv.shipping_price or Decimal('0.00')) * ci.quantity
-
-    order = order_models.Order(
-        buyer=request.user,
-        address=addr,
-        currency=getattr(settings, "DEFAULT_CURRENCY", "INR"),
-        item_total=item_total,                 
-        shipping_fee=shipping_total,            
-        total_amount=item_total + shipping_total,
-        shipping_address_snapshot={
-            "full_name": addr.full_name,
-            "phone": addr.phone,
-            "street_address": addr.street_address,
-            "city": addr.city,
-            "state": addr.state,
-            "postal_code": addr.postal_code,
-            "country": addr.country,
-        },
-    )
-    order.set_order_id_if_missing()
-    order.save()
-
-    for ci in cart_items_qs:
-        pv = ci.product_variation
-        unit_price = ci.price or pv.sale_price
-
-        try:
-            vendor_user = getattr(pv.product, "vendor", None) or request.user
-        except Exception:
-            vendor_user = request.user
-
-        oi = order_models.OrderItem.objects.create(
-            order=order,
-            product_variation=pv,
-            vendor=vendor_user,
-            quantity=ci.quantity,
-            price=unit_price,
-        )
-
-        if ci.variation_values.exists():
-            oi.variation_values.set(ci.variation_values.all())
-
-        
-        oi.recompute_line_totals()
-        oi.save(update_fields=["line_subtotal_net"])
-
-    
-    order.recompute_item_totals_from_items()
-    
-    order.recalc_total()
-    order.save()
+    order = _order_from_cart_or_none(request, addr, lines, shipping_fee=flat_shipping(lines))
+    if order is None:
+        return redirect('store:cart')
     return redirect(reverse('store:checkout', kwargs={'order_id': order.order_id}))
 
 
@@ -957,102 +635,6 @@ def checkout_view(request, order_id: str):
 
 
 
-def _q(x: Decimal) -> Decimal:
-    return (x or Decimal('0')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-
-def _vendor_gross(order, vendor_id) -> Decimal:
-    total = Decimal('0.00')
-    for it in order.items.select_related('product_variation', 'product_variation__product'):
-        if it.vendor_id == vendor_id:
-            total += it.subtotal
-    return total
-
-def _prorate_fixed(items, target_amount: Decimal):
-    target = _q(target_amount)
-    parts = [(it.id, it.subtotal) for it in items]
-    gross = sum((g for _, g in parts), Decimal('0.00'))
-    if gross <= 0 or target <= 0:
-        return {it.id: Decimal('0.00') for it in items}
-    alloc, running = {}, Decimal('0.00')
-    for idx, (iid, g) in enumerate(parts):
-        if idx < len(parts) - 1:
-            share = _q(target * (g / gross))
-            alloc[iid], running = share, running + share
-        else:
-            alloc[iid] = _q(target - running)
-    return alloc
-
-def _apply_coupon_to_order(order, coupon: order_models.Coupon, user):
-    if not coupon.is_live():
-        return False, "Coupon is not active."
-    vendor_id = coupon.vendor_id
-    vendor_items = list(order.items.filter(vendor_id=vendor_id))
-    if not vendor_items:
-        return False, "Coupon vendor has no items in this order."
-
-    if coupon.usage_limit_total is not None:
-        if coupon.redemptions.count() >= coupon.usage_limit_total:
-            return False, "Coupon usage limit reached."
-    if coupon.usage_limit_per_user is not None:
-        if coupon.redemptions.filter(user=user).count() >= coupon.usage_limit_per_user:
-            return False, "You have already used this coupon the maximum number of times."
-
-    vendor_gross = _vendor_gross(order, vendor_id)
-    if coupon.min_order_amount and vendor_gross < coupon.min_order_amount:
-        return False, f"Vendor subtotal must be at least {coupon.min_order_amount}."
-
-    discount = Decimal('0.00')
-    if coupon.discount_type == order_models.Coupon.DiscountType.PERCENT:
-        pct = Decimal(str(coupon.percent_off or 0)) / Decimal('100')
-        discount = vendor_gross * pct
-        if coupon.max_discount_amount:
-            discount = min(discount, coupon.max_discount_amount)
-    else:  
-        discount = min(Decimal(str(coupon.amount_off or 0)), vendor_gross)
-
-    discount = _q(discount)
-    if discount <= 0:
-        return False, "Coupon yields no discount for this order."
-
-    if coupon.discount_type == order_models.Coupon.DiscountType.FIXED:
-        allocation = _prorate_fixed(vendor_items, discount)
-    else:
-        allocation, running = {}, Decimal('0.00')
-        for idx, it in enumerate(vendor_items):
-            if idx < len(vendor_items) - 1:
-                share = _q(it.subtotal * (Decimal(str(coupon.percent_off)) / Decimal('100')))
-                allocation[it.id], running = share, running + share
-            else:
-                allocation[it.id] = _q(discount - running)
-
-    with transaction.atomic():
-        order_models.OrderItemDiscount.objects.filter(
-            order_item__in=[it.id for it in vendor_items],
-            coupon=coupon
-        ).delete()
-        red, _ = order_models.CouponRedemption.objects.update_or_create(
-            coupon=coupon, order=order, user=user, vendor_id=vendor_id,
-            defaults={"discount_amount": discount}
-        )
-        for it in vendor_items:
-            add_amt = allocation.get(it.id, Decimal('0.00'))
-            if add_amt > 0:
-                order_models.OrderItemDiscount.objects.create(
-                    order_item=it, coupon=coupon, vendor_id=vendor_id, amount=add_amt
-                )
-                it.line_discount_total = _q((it.line_discount_total or 0) + add_amt)
-                it.recompute_line_totals()
-                it.save(update_fields=["line_discount_total", "line_subtotal_net"])
-
-        order.recompute_item_totals_from_items()
-        order.recalc_total()
-        order.save(update_fields=[
-            "item_total", "item_discount_total", "item_total_net",
-            "amount_payable", "total_amount"
-        ])
-
-    return True, f"Applied {coupon.code}."
-
 @login_required
 @transaction.atomic
 def apply_coupon(request):
@@ -1064,7 +646,7 @@ def apply_coupon(request):
         return HttpResponseBadRequest("Missing code or order_id")
 
     order = get_object_or_404(order_models.Order, buyer=request.user, order_id=order_id)
-    coupon = order_models.Coupon.objects.filter(code__iexact=code).select_related("vendor").first()
+    coupon = cached_coupon(code)
     if not coupon:
         return JsonResponse({"ok": False, "message": "Invalid coupon code."})
     
@@ -1077,7 +659,7 @@ def apply_coupon(request):
             return JsonResponse({"ok": False, "message": "A coupon is already applied for this vendor."})
 
 
-    ok, msg = _apply_coupon_to_order(order, coupon, request.user)
+    ok, msg = apply_coupon_to_order(order, coupon, request.user)
     if not ok:
         return JsonResponse({"ok": False, "message": msg})
 
@@ -1104,42 +686,11 @@ def remove_coupon(request):
         return HttpResponseBadRequest("Missing code or order_id")
 
     order = get_object_or_404(order_models.Order, buyer=request.user, order_id=order_id)
-    coupon = order_models.Coupon.objects.filter(code__iexact=code).first()
+    coupon = cached_coupon(code)
     if not coupon:
         return JsonResponse({"ok": False, "message": "Coupon not found."})
 
-    vendor_id = coupon.vendor_id
-    vendor_items = list(order.items.filter(vendor_id=vendor_id))
-
-    with transaction.atomic():
-        
-        allocs = list(order_models.OrderItemDiscount.objects.filter(
-            order_item__in=[it.id for it in vendor_items], coupon=coupon
-        ))
-        by_item = {}
-        for a in allocs:
-            by_item[a.order_item_id] = by_item.get(a.order_item_id, Decimal('0.00')) + a.amount
-
-        order_models.OrderItemDiscount.objects.filter(
-            order_item__in=[it.id for it in vendor_items], coupon=coupon
-        ).delete()
-        order_models.CouponRedemption.objects.filter(
-            coupon=coupon, order=order, vendor_id=vendor_id
-        ).delete()
-
-        for it in vendor_items:
-            undo = _q(by_item.get(it.id, Decimal('0.00')))
-            if undo > 0:
-                it.line_discount_total = _q(max((it.line_discount_total or 0) - undo, Decimal('0.00')))
-                it.recompute_line_totals()
-                it.save(update_fields=["line_discount_total", "line_subtotal_net"])
-
-        order.recompute_item_totals_from_items()
-        order.recalc_total()
-        order.save(update_fields=[
-            "item_total", "item_discount_total", "item_total_net",
-            "amount_payable", "total_amount"
-        ])
+    remove_coupon_from_order(order, coupon)
 
     return JsonResponse({
         "ok": True,
@@ -1161,54 +712,19 @@ def search(request):
     q = (request.GET.get("q") or "").strip()
 
     
-    products = store_models.Product.objects.none()
-
-    if q:
-        terms = [t for t in re.split(r"\s+", q) if t]
-
-        
-        combined = Q()
-        for t in terms:
-            per_term = (
-                Q(name__icontains=t) |
-                Q(description__icontains=t) |
-                Q(category__name__icontains=t) |
-                Q(variations__sku__icontains=t) |
-                Q(variations__variations__value__icontains=t)
-            )
-            combined &= per_term
-
-        
-        primary_images = ProductImage.objects.filter(is_primary=True)
-        active_vars = ProductVariation.objects.filter(is_active=True).order_by("sale_price")
-
-        
-        name_hit = Case(When(name__icontains=q, then=Value(3)), default=Value(0), output_field=IntegerField())
-        sku_hit  = Case(When(variations__sku__icontains=q, then=Value(2)), default=Value(0), output_field=IntegerField())
-        cat_hit  = Case(When(category__name__icontains=q, then=Value(1)), default=Value(0), output_field=IntegerField())
-
-        products = (
-            store_models.Product.objects
-            .filter(status=store_models.Product.ProductStatus.PUBLISHED)
-            .filter(combined)
-            .select_related("category", "vendor")
-            .prefetch_related(
-                Prefetch("images", queryset=primary_images, to_attr="primary_images_prefetch"),
-                Prefetch("variations", queryset=active_vars, to_attr="active_variations_prefetch"),
-            )
-            .annotate(
-                avg_rating=Avg("reviews__rating"),
-                reviews_count=Count("reviews", distinct=True),
-                _rank=name_hit + sku_hit + cat_hit,
-            )
-            .distinct()
-            .order_by("-_rank", "-updated_at")
-        )
+    product_ids = get_search_backend().search(q) if q else []
 
     page = request.GET.get("page") or 1
-    page_obj = Paginator(products, 24).get_page(page)
+    page_obj = Paginator(product_ids, 24).get_page(page)
+
+    by_id = store_models.Product.objects.filter(
+        pk__in=page_obj.object_list,
+        status=store_models.Product.ProductStatus.PUBLISHED,
+    ).select_related("category", "card").in_bulk()
+    page_obj.object_list = with_cards([by_id[pid] for pid in page_obj.object_list if pid in by_id])
 
     return render(request, "search.html", {
         "q": q,
         "products": page_obj,
-    })
\ No newline at end of file
+        "suggestions": suggestions_for(q, len(product_ids)),
+    })
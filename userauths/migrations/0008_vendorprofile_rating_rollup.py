@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('userauths', '0007_vendorprofile_account_name_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vendorprofile',
+            name='rating_avg',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='vendorprofile',
+            name='rating_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='vendorprofile',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
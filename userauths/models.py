@@ -8,7 +8,7 @@ from django.dispatch import receiver
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.db import DatabaseError, models, transaction
 from django.db.models import Q
 from django.utils import timezone
 from shortuuid.django_fields import ShortUUIDField
@@ -84,13 +84,41 @@ class VendorProfile(models.Model):
     account_number = models.CharField(max_length=60, blank=True, null=True)
 
     is_verified = models.BooleanField(default=False)
+
+    # Rollup of the vendor's product review aggregates (see store.ratings).
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0, db_index=True)
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=0, db_index=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     uuid = ShortUUIDField(length=12, max_length=50, alphabet="1234567890")
 
+    RATING_FIELDS = ("rating_sum", "rating_count", "rating_avg")
+
     def __str__(self):
         return self.business_name
 
+    def save(self, *args, **kwargs):
+        if args or self._state.adding or kwargs.get("update_fields") is not None or kwargs.get("force_insert"):
+            return super().save(*args, **kwargs)
+        # The rollup is owned by store.ratings; don't write back a copy read earlier in the request.
+        deferred = self.get_deferred_fields()
+        fields = [
+            f.name for f in self._meta.concrete_fields
+            if not f.primary_key and f.name not in self.RATING_FIELDS and f.attname not in deferred
+        ]
+        using = kwargs.get("using") or self._state.db
+        try:
+            # In a savepoint, so a failed update doesn't doom the caller's transaction.
+            with transaction.atomic(using=using):
+                super().save(*args, **kwargs, update_fields=fields)
+        except DatabaseError:
+            # The row is gone: insert it again, as a plain save would.
+            if type(self)._base_manager.using(using).filter(pk=self.pk).exists():
+                raise
+            super().save(*args, **kwargs)
+
 class Address(models.Model):
     class AddressType(models.TextChoices):
         SHIPPING = "SHIPPING", "Shipping"
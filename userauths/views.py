@@ -6,6 +6,7 @@ from .forms import RegistrationForm, LoginForm
 from .models import User
 from store import models as store_models
 from order import models as order_models
+from store.carts import adopt_guest_cart
 
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse, HttpResponseBadRequest
@@ -142,15 +143,7 @@ def login_view(request):
             login(request, user)
             messages.success(request, 'Login successful')
 
-            try:
-                guest_cart = order_models.Cart.objects.get(
-                    session_key=guest_session_key, user__isnull=True
-                )
-                user_cart = order_models.Cart.get_for_request(request)
-                if guest_cart != user_cart:
-                    user_cart.merge_from(guest_cart)
-            except order_models.Cart.DoesNotExist:
-                pass
+            adopt_guest_cart(request, guest_session_key)
 
             return redirect(_get_next_url(request))
     else: